@@ -0,0 +1,114 @@
+"""
+Measures how long it takes to import flask_admin and its datastore
+backends, each in a fresh interpreter, compared to importing flask
+alone. Also lists the ORM modules each import pulls in.
+
+On Pythons that support ``-X importtime`` (3.7 and later), the
+slowest modules imported by each are listed too.
+
+Usage::
+
+    python bench/import_time.py [-n RUNS] [--python PYTHON]
+"""
+import optparse
+import os
+import subprocess
+import sys
+import time
+
+
+MODULES = [
+    'flask',
+    'flask_admin',
+    'flask_admin.datastore.memory',
+    'flask_admin.datastore.sqlalchemy',
+    'flask_admin.datastore.mongoalchemy',
+]
+
+ORM_PACKAGES = ('sqlalchemy', 'mongoalchemy', 'pymongo', 'flask_sqlalchemy',
+                'sqlite3')
+
+ORM_CHECK = (
+    "import sys; import %s; "
+    "print(' '.join(sorted(set(m.split('.')[0] for m in sys.modules "
+    "if sys.modules[m] is not None and m.split('.')[0] in %r))))")
+
+
+def time_import(python, module, runs):
+    """Returns the median wall time, in seconds, of importing module
+    in a new interpreter.
+    """
+    timings = []
+    for i in range(runs):
+        start = time.time()
+        subprocess.check_call([python, '-c', 'import ' + module])
+        timings.append(time.time() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def loaded_orms(python, module):
+    output = subprocess.check_output(
+        [python, '-c', ORM_CHECK % (module, ORM_PACKAGES)])
+    return output.decode('ascii').split()
+
+
+def slowest_imports(python, module, limit=5):
+    """Returns (cumulative microseconds, module name) tuples for the
+    slowest imports reported by -X importtime, or None if the
+    interpreter doesn't support it.
+    """
+    process = subprocess.Popen(
+        [python, '-X', 'importtime', '-c', 'import ' + module],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        return None
+    imports = []
+    for line in stderr.decode('ascii', 'replace').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            self_us, cumulative_us, name = line[12:].split('|')
+            imports.append((int(cumulative_us), name.strip()))
+        except ValueError:
+            continue
+    if not imports:
+        return None
+    imports.sort(reverse=True)
+    return imports[:limit]
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [-n RUNS] [--python PYTHON]')
+    parser.add_option('-n', '--runs', type='int', default=10,
+                      help='number of imports to time for each module')
+    parser.add_option('--python', default=sys.executable,
+                      help='interpreter to measure')
+    options, args = parser.parse_args()
+
+    # make the package importable from a checkout
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.environ['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [os.environ.get('PYTHONPATH')] if p])
+
+    baseline = None
+    for module in MODULES:
+        try:
+            seconds = time_import(options.python, module, options.runs)
+        except subprocess.CalledProcessError:
+            print('%-36s  could not be imported' % module)
+            continue
+        if baseline is None:
+            baseline = seconds
+        print('%-36s %7.1f ms  (+%.1f ms)  orms: %s' % (
+            module, seconds * 1000, (seconds - baseline) * 1000,
+            ', '.join(loaded_orms(options.python, module)) or '-'))
+        imports = slowest_imports(options.python, module)
+        if imports:
+            for cumulative_us, name in imports:
+                print('    %8.1f ms  %s' % (cumulative_us / 1000.0, name))
+
+
+if __name__ == '__main__':
+    main()
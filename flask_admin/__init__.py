@@ -9,11 +9,13 @@
     :copyright: (c) 2011 by wilsaj.
     :license: BSD, see LICENSE for more details.
 """
-from __future__ import absolute_import
+from __future__ import absolute_import, with_statement
 
 import datetime
 from functools import wraps
 import inspect
+import itertools
+import mimetypes
 import os
 import time
 import types
@@ -21,6 +23,9 @@ import types
 import flask
 from flask import flash, render_template, redirect, request, url_for
 
+from flask.ext.admin import compression
+from flask.ext.admin import templating
+from flask.ext.admin import tracing
 from flask.ext.admin.wtforms import has_file_field
 from flask.ext.admin.datastore import AdminDatastore
 
@@ -44,6 +49,9 @@ def create_admin_blueprint(*args, **kwargs):
         app.register_blueprint(admin, url_prefix='/admin')
 
 
+    The names of the models available in the datastore are read once,
+    when the blueprint is created.
+
     You can optionally specify the `name` to be used for your
     blueprint. The blueprint name preceeds the view names in the
     endpoints, if for example you want to refer to the views using
@@ -62,8 +70,105 @@ def create_admin_blueprint(*args, **kwargs):
     (e.g. login_required). See the authentication/view_decorator.py
     for an example of this.
 
+    The navigation menu lists every model of the datastore. Its html
+    is built once for each url root the admin is served from and
+    shared by every user, so it must not depend on the user. Keeping
+    a user away from some models is up to the `view_decorator`; a
+    menu that lists different models per user can be rendered from
+    the ``model_names`` template variable by overriding the
+    ``admin/base.html`` template.
+
     The `list_view_pagination` parameter sets the number of items that
-    will be listed per page in the list view.
+    will be listed per page in the list view. It can be overridden for
+    some models by setting `model_list_view_pagination` to a dict with
+    model names as keys matched to numbers of items per page. A
+    different number can also be requested with the `per_page` query
+    argument of the list view, up to `max_list_view_pagination`.
+
+    The `cache` parameter can be set to one of the cache backends in
+    :mod:`flask.ext.admin.cache` to cache expensive datastore results
+    like row counts. Use a :class:`~flask.ext.admin.cache.SQLiteCache`
+    to share the cache between the worker processes of a
+    server. Cached values for a model are invalidated whenever an
+    instance of the model is added, edited or deleted through the
+    admin. A cache can be shared by several admins: the values are
+    cached under namespaces that identify the database of each model,
+    or under the `cache_prefix` of the datastore if it is set; see
+    :meth:`~flask.ext.admin.datastore.AdminDatastore.get_cache_namespace`.
+
+    Compiled admin templates can be cached on disk by setting
+    `template_cache_dir` to a directory; see
+    :mod:`flask.ext.admin.templating`. The cache is set up on the Jinja
+    environment of the app the blueprint is registered on. Setting
+    `preload_templates` to True loads the admin templates when the
+    blueprint is registered, so they are compiled before the first
+    request.
+
+    The stylesheets and scripts of the admin pages can be served as
+    two bundles built with :mod:`flask.ext.admin.assets`, by setting
+    `asset_bundle_folder` to the folder the bundles were built in. The
+    bundles are served with far-future cache headers, gzipped for
+    clients that accept it.
+
+    Setting `compress_responses` to True compresses the responses of
+    the admin views with gzip or deflate for clients that accept
+    it. Responses shorter than `compress_min_size` bytes are sent
+    uncompressed, and `compress_level` sets the zlib compression
+    level, from 1 (fastest) to 9 (smallest). Streamed responses are
+    compressed as they are sent; see
+    :func:`flask.ext.admin.compression.compress_response`.
+
+    Setting `stream_list_view` to True makes the list view stream the
+    page to the client as it is rendered, while the datastore fetches
+    the rows, so large pages start arriving right away and are never
+    held in memory as a whole. This needs Flask 0.9 or later.
+
+    Setting `infinite_scroll` to True makes the list view load the
+    following pages as the list is scrolled, instead of showing a
+    pager. Rows that are scrolled far out of view are taken out of the
+    page, so long lists stay responsive.
+
+    Single requests can be profiled with cProfile by setting
+    `profile_dir` to the directory the stats should be written to and
+    the ``ADMIN_PROFILING`` config value of the app to True. Requests
+    are then profiled when they have a ``_profile`` query argument or
+    an ``X-Admin-Profile`` header; see
+    :mod:`flask.ext.admin.profiling`. Profiling happens inside the
+    `view_decorator`, and the summaries of the profiles are admin
+    views themselves, so they are protected the same way.
+
+    Slow datastore calls made by the views can be logged by setting
+    `slow_log` to a :class:`~flask.ext.admin.slowlog.SlowLog`, which
+    sets the thresholds and the log file. The slowest operations are
+    listed on the `/slow/` page of the admin.
+
+    Latency, datastore and cache metrics of the admin views can be
+    collected by setting `metrics` to a
+    :class:`~flask.ext.admin.metrics.Metrics`. They are served in the
+    Prometheus text format by the `/metrics` view of the admin, which
+    is protected by the `view_decorator` like the other views. Streamed
+    list pages are timed until the response starts.
+
+    The phases of the admin requests can be traced by setting `tracer`
+    to a :class:`~flask.ext.admin.tracing.Tracer`, which records nested
+    spans for the request, the view, the datastore calls, the forms
+    and the templates; see :mod:`flask.ext.admin.tracing`.
+
+    The plans of the queries issued by the views can be captured by
+    setting `query_advisor` to a
+    :class:`~flask.ext.admin.advisor.QueryAdvisor`. The `/advisor/`
+    page of the admin then lists the plans by model and view, along
+    with indexes that would serve the queries that scan whole tables
+    or sort without an index. The rows of streamed list pages are
+    fetched after the view returns, so their queries aren't explained.
+
+    Heavy operations, like list pages that have to count a table and
+    writes, can be limited by setting `admission` to an
+    :class:`~flask.ext.admin.admission.AdmissionController`, which
+    sets how many of them run at once, per operation class and
+    model. Requests over the limits wait in a short queue, and are
+    rejected with a ``429`` response when it is full. If `metrics` is
+    also set, the queues are recorded in it.
 
     Finally, the `empty_sequence` keyword can be used to designate a
     sequence of characters that can be used as a substitute for cases
@@ -102,6 +207,12 @@ def create_admin_blueprint_deprecated(
 def create_admin_blueprint_new(
     datastore, name='admin', list_view_pagination=25, view_decorator=None,
     empty_sequence=u'\x1a', template_folder=None, static_folder=None,
+    cache=None, template_cache_dir=None, preload_templates=False,
+    asset_bundle_folder=None, compress_responses=False,
+    compress_min_size=500, compress_level=6, stream_list_view=False,
+    infinite_scroll=False, model_list_view_pagination=None,
+    max_list_view_pagination=500, profile_dir=None, slow_log=None,
+    metrics=None, tracer=None, query_advisor=None, admission=None,
     **kwargs):
     if not template_folder:
         template_folder = os.path.join(
@@ -115,6 +226,12 @@ def create_admin_blueprint_new(
         static_folder=static_folder, template_folder=template_folder,
         **kwargs)
 
+    if cache is not None:
+        datastore.cache = cache
+
+    if stream_list_view and not hasattr(flask, 'stream_with_context'):
+        raise RuntimeError('stream_list_view requires Flask 0.9 or later')
+
     # if no view decorator was assigned, let view_decorator be a dummy
     # decorator that doesn't really do anything
     if not view_decorator:
@@ -124,46 +241,343 @@ def create_admin_blueprint_new(
                 return f(*args, **kwds)
             return wrapper
 
+    if admission is not None:
+        if metrics is not None and admission.metrics is None:
+            admission.use_metrics(metrics)
+
+        # requests are admitted after the view decorator lets them
+        # through, so rejected logins don't take up slots
+        unadmitted_view_decorator = view_decorator
+
+        def view_decorator(f):
+            return unadmitted_view_decorator(admitted(f))
+
+        def admitted(f):
+            @wraps(f)
+            def wrapper(*args, **kwds):
+                model_name = kwds.get('model_name')
+                operation = get_admission_operation(model_name)
+                if operation is None:
+                    return f(*args, **kwds)
+                release = admission.admit(operation, model_name)
+                if release is None:
+                    return admission.reject()
+                try:
+                    return f(*args, **kwds)
+                finally:
+                    release()
+            return wrapper
+
+        def get_admission_operation(model_name):
+            """Returns the operation class of the current request, or
+            None for requests that aren't heavy.
+            """
+            if model_name not in model_name_set:
+                return None
+            endpoint = (request.endpoint or '').rpartition('.')[2]
+            if endpoint == 'delete' or request.method == 'POST':
+                return 'write'
+            if endpoint in ('list', 'list_view', 'list_rows'):
+                cache = datastore.cache
+                namespace = datastore.get_cache_namespace(model_name)
+                count = cache.lookup(namespace, 'count',
+                                     cache.generation(namespace))
+                if count is None:
+                    return 'count'
+            return None
+
+    if query_advisor is not None:
+        # like profiling, the plans are only captured for requests the
+        # view decorator lets through
+        unexplained_view_decorator = view_decorator
+
+        def view_decorator(f):
+            return unexplained_view_decorator(query_advisor.explained(f))
+
+    if profile_dir:
+        from flask.ext.admin import profiling
+        if not os.path.isdir(profile_dir):
+            os.makedirs(profile_dir)
+
+        # the views are profiled inside the view decorator, so only
+        # requests it lets through can be profiled
+        auth_view_decorator = view_decorator
+
+        def view_decorator(f):
+            return auth_view_decorator(profiled(f))
+
+        def profiled(f):
+            @wraps(f)
+            def wrapper(*args, **kwds):
+                if not profiling.profiling_requested():
+                    return f(*args, **kwds)
+                rv, profile_id = profiling.profile_call(
+                    profile_dir, f, *args, **kwds)
+                response = flask.make_response(rv)
+                response.headers['X-Admin-Profile-Id'] = profile_id
+                response.headers['X-Admin-Profile-Url'] = url_for(
+                    '.profile', profile_id=profile_id)
+                return response
+            return wrapper
+
+    if tracer is None:
+        tracer = tracing.NULL_TRACER
+    else:
+        # the request span includes the view decorator, the view span
+        # only the view itself
+        inner_view_decorator = view_decorator
+
+        def view_decorator(f):
+            return traced('request', inner_view_decorator(traced('view', f)))
+
+        def traced(span_name, f):
+            @wraps(f)
+            def wrapper(*args, **kwds):
+                with tracer.span(span_name, endpoint=request.endpoint,
+                                 **kwds):
+                    return f(*args, **kwds)
+            return wrapper
+
+    # the models of the datastore are looked up once, so membership
+    # checks and the navigation menu don't depend on the datastore
+    model_names = tuple(sorted(datastore.list_model_names()))
+    model_name_set = frozenset(model_names)
+
+    # static traits of the model forms, like whether they need a
+    # multipart enctype, are computed once per form class; the views
+    # only compute them for forms the datastore creates later on
+    for model_name in model_names:
+        has_file_field(datastore.get_model_form(model_name))
+
+    if metrics is not None:
+        cache_datastore = datastore
+
+        def collect_cache_lookups():
+            return [
+                ('cache_lookups_total', (('result', 'hit'),),
+                 cache_datastore.cache.hits),
+                ('cache_lookups_total', (('result', 'miss'),),
+                 cache_datastore.cache.misses),
+            ]
+        metrics.add_collector(collect_cache_lookups)
+        datastore = metrics.counted(datastore)
+
+    if slow_log is not None:
+        datastore = slow_log.timed(datastore)
+
+    datastore = tracer.traced(datastore)
+
+    model_nav_cache = {}
+
+    def get_model_nav():
+        """Returns the html for the list of models in the navigation
+        menu. It's built once for each url root the admin is served
+        from and shared by every user, so nothing in it may depend on
+        the user.
+        """
+        model_nav = model_nav_cache.get(request.script_root)
+        if model_nav is None:
+            model_nav = flask.Markup(u'\n').join(
+                [flask.Markup(u'<li><a href="%s">%s</a></li>') % (
+                        url_for('.list', model_name=model_name, page=1),
+                        model_name.lower())
+                 for model_name in model_names])
+            model_nav_cache[request.script_root] = model_nav
+        return model_nav
+
+    def render_admin_template(template_name, **context):
+        """Renders an admin template, adding the context that every
+        admin page needs.
+        """
+        with tracer.span('template.render', template=template_name):
+            return render_template(template_name, model_names=model_names,
+                                   model_nav=get_model_nav(), **context)
+
+    def stream_admin_template(template_name, **context):
+        """Like render_admin_template(), but returns a response that
+        renders the template as it is sent to the client.
+        """
+        app = flask.current_app
+        context.update(model_names=model_names, model_nav=get_model_nav())
+        app.update_template_context(context)
+        # only the start of the rendering is traced, the rest happens
+        # as the response is sent
+        with tracer.span('template.stream', template=template_name):
+            stream = app.jinja_env.get_template(template_name).stream(
+                context)
+        # send the output in chunks instead of one piece per template
+        # statement
+        stream.enable_buffering(_STREAM_BUFFER_SIZE)
+        return flask.Response(flask.stream_with_context(stream))
+
+    def create_form(model_name, model_form, *args, **kwargs):
+        """Instantiates a model form, tracing it."""
+        with tracer.span('form.create', model=model_name):
+            return model_form(*args, **kwargs)
+
+    def validate_form(model_name, form):
+        """Validates a form, tracing it."""
+        with tracer.span('form.validate', model=model_name):
+            return form.validate()
+
     def get_model_url_key(model_instance):
         """Helper function that turns a set of model keys into a
         unique key for a url.
         """
-        values = datastore.get_model_keys(model_instance)
-        return '/'.join([unicode(value) if value else empty_sequence
-                         for value in values])
+        return get_model_url_keys([model_instance])[0]
+
+    def get_model_url_keys(model_instances):
+        """Returns the url keys for a sequence of model instances."""
+        get_model_keys = datastore.get_model_keys
+        return [u'/'.join([unicode(value) if value else empty_sequence
+                           for value in get_model_keys(model_instance)])
+                for model_instance in model_instances]
+
+    def create_list_rows(model_name, model_instances):
+        """Returns a list of (model_instance, edit_url, delete_url)
+        tuples for the rows of the list view. The edit and delete
+        urls are built once with a placeholder key and then filled in
+        with each escaped url key, which gives the same urls as
+        calling url_for() for every row but is a lot cheaper.
+        """
+        return list(iter_list_rows(model_name, model_instances))
+
+    def iter_list_rows(model_name, model_instances):
+        """Like create_list_rows(), but yields the rows as the model
+        instances are iterated over. The url keys are computed for
+        chunks of instances at a time.
+        """
+        url_map = flask.current_app.url_map
+        quote_url_key = url_map.converters['path'](url_map).to_url
+        edit_prefix, edit_suffix = _split_url_template(
+            url_for('.edit', model_name=model_name,
+                    model_url_key=_URL_KEY_PLACEHOLDER))
+        delete_prefix, delete_suffix = _split_url_template(
+            url_for('.delete', model_name=model_name,
+                    model_url_key=_URL_KEY_PLACEHOLDER))
+
+        rows = 0
+        model_instances = iter(model_instances)
+        try:
+            while True:
+                chunk = list(itertools.islice(model_instances,
+                                              _URL_KEY_CHUNK_SIZE))
+                if not chunk:
+                    break
+                for model_instance, url_key in zip(
+                        chunk, get_model_url_keys(chunk)):
+                    quoted_key = quote_url_key(url_key)
+                    yield (model_instance,
+                           edit_prefix + quoted_key + edit_suffix,
+                           delete_prefix + quoted_key + delete_suffix)
+                    rows += 1
+        finally:
+            if metrics is not None:
+                metrics.inc('rows_rendered_total', (('model', model_name),),
+                            rows)
 
     def create_index_view():
         @view_decorator
         def index():
             """Landing page view for admin module
             """
-            return render_template(
-                'admin/index.html',
-                model_names=datastore.list_model_names())
+            return render_admin_template('admin/index.html')
         return index
 
+    model_pagination = dict(model_list_view_pagination or {})
+
+    def get_requested_per_page():
+        """Returns the number of items per page requested with the
+        per_page query argument, capped at max_list_view_pagination,
+        or None if it isn't given or isn't a positive number.
+        """
+        per_page = request.args.get('per_page', type=int)
+        if per_page is None or per_page < 1:
+            return None
+        return min(per_page, max_list_view_pagination)
+
+    def get_per_page(model_name, requested_per_page):
+        """Returns the number of items per list page for a model."""
+        if requested_per_page is not None:
+            return requested_per_page
+        return model_pagination.get(model_name, list_view_pagination)
+
+    def get_page_cursors():
+        """Returns the keyset cursors of the requested page as keyword
+        arguments for create_model_pagination(). Cursors that aren't
+        given are left out, so datastores that don't page by key are
+        called as usual.
+        """
+        return dict([(name, request.args[name])
+                     for name in ('after', 'before')
+                     if request.args.get(name)])
+
     def create_list_view():
         @view_decorator
         def list_view(model_name):
             """Lists instances of a given model, so they can
             beselected for editing or deletion.
             """
-            if not model_name in datastore.list_model_names():
+            if not model_name in model_name_set:
                 return "%s cannot be accessed through this admin page" % (
                     model_name,)
-            per_page = list_view_pagination
+            requested_per_page = get_requested_per_page()
+            per_page = get_per_page(model_name, requested_per_page)
             page = int(request.args.get('page', '1'))
-            pagination = datastore.create_model_pagination(
-                model_name, page, per_page)
+            if stream_list_view:
+                pagination = datastore.create_model_pagination(
+                    model_name, page, per_page, stream=True,
+                    **get_page_cursors())
+                return stream_admin_template(
+                    'admin/list.html',
+                    get_model_url_key=get_model_url_key,
+                    list_rows=iter_list_rows(model_name, pagination.items),
+                    model_name=model_name,
+                    pagination=pagination,
+                    requested_per_page=requested_per_page,
+                    infinite_scroll=infinite_scroll)
 
-            return render_template(
+            pagination = datastore.create_model_pagination(
+                model_name, page, per_page, **get_page_cursors())
+            return render_admin_template(
                 'admin/list.html',
-                model_names=datastore.list_model_names(),
                 get_model_url_key=get_model_url_key,
+                list_rows=create_list_rows(model_name, pagination.items),
                 model_name=model_name,
-                pagination=pagination)
+                pagination=pagination,
+                requested_per_page=requested_per_page,
+                infinite_scroll=infinite_scroll)
         return list_view
 
+    def create_list_rows_view():
+        @view_decorator
+        def list_rows(model_name):
+            """Returns the rows of a page of the list view as an html
+            fragment in a JSON object, along with the url of the next
+            page, for loading pages as the list is scrolled.
+            """
+            if not model_name in model_name_set:
+                return "%s cannot be accessed through this admin page" % (
+                    model_name,)
+            requested_per_page = get_requested_per_page()
+            page = int(request.args.get('page', '1'))
+            pagination = datastore.create_model_pagination(
+                model_name, page, get_per_page(model_name, requested_per_page),
+                **get_page_cursors())
+            next_url = None
+            if pagination.has_next:
+                next_url = url_for('.list_rows', model_name=model_name,
+                                   page=pagination.next_num,
+                                   after=pagination.next_cursor,
+                                   per_page=requested_per_page)
+            with tracer.span('template.render',
+                             template='admin/list_rows.html'):
+                html = render_template(
+                    'admin/list_rows.html',
+                    list_rows=create_list_rows(model_name, pagination.items))
+            return flask.jsonify(html=html, page=page, next_url=next_url)
+        return list_rows
+
     def create_edit_view():
         @view_decorator
         def edit(model_name, model_url_key):
@@ -171,11 +585,12 @@ def create_admin_blueprint_new(
             model_keys = [key if key != empty_sequence else u''
                          for key in model_url_key.split('/')]
 
-            if not model_name in datastore.list_model_names():
+            if not model_name in model_name_set:
                 return "%s cannot be accessed through this admin page" % (
                     model_name,)
 
             model_form = datastore.get_model_form(model_name)
+            has_file_field(model_form)
             model_instance = datastore.find_model_instance(
                 model_name, model_keys)
 
@@ -183,21 +598,21 @@ def create_admin_blueprint_new(
                 return "%s not found: %s" % (model_name, model_key)
 
             if request.method == 'GET':
-                form = model_form(obj=model_instance)
-                form._has_file_field = has_file_field(form)
-                return render_template(
+                form = create_form(model_name, model_form, obj=model_instance)
+                return render_admin_template(
                     'admin/edit.html',
-                    model_names=datastore.list_model_names(),
                     model_instance=model_instance,
                     model_name=model_name, form=form)
 
             elif request.method == 'POST':
-                form = model_form(request.form, obj=model_instance)
-                form._has_file_field = has_file_field(form)
-                if form.validate():
+                form = create_form(model_name, model_form, request.form,
+                                   obj=model_instance)
+                if validate_form(model_name, form):
                     model_instance = datastore.update_from_form(
                         model_instance, form)
                     datastore.save_model(model_instance)
+                    datastore.cache.invalidate(
+                        datastore.get_cache_namespace(model_name))
                     flash('%s updated: %s' % (model_name, model_instance),
                           'success')
                     return redirect(
@@ -207,9 +622,8 @@ def create_admin_blueprint_new(
                     flash('There was an error processing your form. '
                           'This %s has not been saved.' % model_name,
                           'error')
-                    return render_template(
+                    return render_admin_template(
                         'admin/edit.html',
-                        model_names=datastore.list_model_names(),
                         model_instance=model_instance,
                         model_name=model_name, form=form)
         return edit
@@ -218,27 +632,27 @@ def create_admin_blueprint_new(
         @view_decorator
         def add(model_name):
             """Create a new instance of a model."""
-            if not model_name in datastore.list_model_names():
+            if not model_name in model_name_set:
                 return "%s cannot be accessed through this admin page" % (
                     model_name)
             model_class = datastore.get_model_class(model_name)
             model_form = datastore.get_model_form(model_name)
+            has_file_field(model_form)
             model_instance = model_class()
             if request.method == 'GET':
-                form = model_form()
-                form._has_file_field = has_file_field(form)
-                return render_template(
+                form = create_form(model_name, model_form)
+                return render_admin_template(
                     'admin/add.html',
-                    model_names=datastore.list_model_names(),
                     model_name=model_name,
                     form=form)
             elif request.method == 'POST':
-                form = model_form(request.form)
-                form._has_file_field = has_file_field(form)
-                if form.validate():
+                form = create_form(model_name, model_form, request.form)
+                if validate_form(model_name, form):
                     model_instance = datastore.update_from_form(
                         model_instance, form)
                     datastore.save_model(model_instance)
+                    datastore.cache.invalidate(
+                        datastore.get_cache_namespace(model_name))
                     flash('%s added: %s' % (model_name, model_instance),
                           'success')
                     return redirect(url_for('.list',
@@ -246,9 +660,8 @@ def create_admin_blueprint_new(
                 else:
                     flash('There was an error processing your form. This '
                           '%s has not been saved.' % model_name, 'error')
-                    return render_template(
+                    return render_admin_template(
                         'admin/add.html',
-                        model_names=datastore.list_model_names(),
                         model_name=model_name,
                         form=form)
         return add
@@ -260,13 +673,15 @@ def create_admin_blueprint_new(
             model_keys = [key if key != empty_sequence else u''
                           for key in model_url_key.split('/')]
 
-            if not model_name in datastore.list_model_names():
+            if not model_name in model_name_set:
                 return "%s cannot be accessed through this admin page" % (
                     model_name,)
             model_instance = datastore.delete_model_instance(
                 model_name, model_keys)
             if not model_instance:
                 return "%s not found: %s" % (model_name, model_keys)
+            datastore.cache.invalidate(
+                datastore.get_cache_namespace(model_name))
             flash('%s deleted: %s' % (model_name, model_instance),
                   'success')
             return redirect(
@@ -274,6 +689,140 @@ def create_admin_blueprint_new(
 
         return delete
 
+    def create_profile_view():
+        @auth_view_decorator
+        def profile(profile_id):
+            """Summarizes the hottest functions of a profiled request."""
+            sort = request.args.get('sort', 'cumulative')
+            if sort not in profiling.SORT_ORDERS:
+                sort = 'cumulative'
+            summary = profiling.load_summary(profile_dir, profile_id, sort)
+            if summary is None:
+                flask.abort(404)
+            return render_admin_template(
+                'admin/profile.html', profile_id=profile_id, sort=sort,
+                sort_orders=sorted(profiling.SORT_ORDERS), summary=summary)
+        return profile
+
+    def create_slow_log_view():
+        @view_decorator
+        def slow_log_view():
+            """Lists the slowest datastore operations by model."""
+            return render_admin_template(
+                'admin/slow.html', slow_log=slow_log,
+                offenders=slow_log.worst_offenders())
+        return slow_log_view
+
+    def create_advisor_view():
+        @view_decorator
+        def advisor():
+            """Lists the query plans of the views and the indexes
+            suggested for them.
+            """
+            return render_admin_template(
+                'admin/advisor.html', report=query_advisor.report(),
+                indexes=query_advisor.suggested_indexes())
+        return advisor
+
+    def create_metrics_view():
+        @view_decorator
+        def metrics_view():
+            """Serves the admin metrics in the Prometheus text format."""
+            return flask.Response(metrics.render(),
+                                  mimetype='text/plain; version=0.0.4')
+        return metrics_view
+
+    def create_bundle_view(bundle_filenames):
+        def bundle(filename):
+            """Serves a bundle built with
+            :func:`flask.ext.admin.assets.build_bundles`, gzipped if
+            the client accepts it. Bundle filenames change with their
+            content, so they can be cached indefinitely.
+            """
+            if filename not in bundle_filenames:
+                flask.abort(404)
+            path = os.path.join(asset_bundle_folder, filename)
+            gzipped = 'gzip' in request.accept_encodings and \
+                os.path.isfile(path + '.gz')
+            if gzipped:
+                path += '.gz'
+            response = flask.send_file(
+                path, mimetype=mimetypes.guess_type(filename)[0],
+                cache_timeout=_BUNDLE_MAX_AGE, conditional=True)
+            if gzipped:
+                response.headers['Content-Encoding'] = 'gzip'
+            response.cache_control.public = True
+            response.vary.add('Accept-Encoding')
+            return response
+        return bundle
+
+    def setup_templates(state):
+        if template_cache_dir:
+            templating.enable_bytecode_cache(state.app, template_cache_dir)
+        if preload_templates:
+            templating.warmup_templates(state.app)
+
+    admin_blueprint.record_once(setup_templates)
+
+    if asset_bundle_folder:
+        from flask.ext.admin import assets
+        bundle_manifest = assets.load_manifest(asset_bundle_folder)
+
+        @admin_blueprint.context_processor
+        def inject_bundle_url():
+            def bundle_url(bundle_name):
+                return url_for('.bundle',
+                               filename=bundle_manifest[bundle_name])
+            return dict(bundle_url=bundle_url)
+
+        admin_blueprint.add_url_rule(
+            '%s/%s/<filename>' % (admin_blueprint.static_url_path,
+                                  assets.BUNDLE_URL_PATH),
+            'bundle', view_func=create_bundle_view(
+                frozenset(bundle_manifest.values())))
+
+    if metrics is not None:
+        @admin_blueprint.before_request
+        def start_request_timer():
+            flask.g.admin_request_start = time.time()
+
+        @admin_blueprint.after_request
+        def record_request_duration(response):
+            start = getattr(flask.g, 'admin_request_start', None)
+            endpoint = (request.endpoint or '').rpartition('.')[2]
+            if start is not None and endpoint not in ('static', 'metrics'):
+                model_name = (request.view_args or {}).get('model_name')
+                if model_name not in model_name_set:
+                    model_name = ''
+                metrics.observe('request_duration_seconds',
+                                (('endpoint', endpoint),
+                                 ('model', model_name)),
+                                time.time() - start)
+            metrics.maybe_flush()
+            return response
+
+    if compress_responses:
+        @admin_blueprint.after_request
+        def compress(response):
+            return compression.compress_response(
+                response, min_size=compress_min_size, level=compress_level)
+
+    if profile_dir:
+        admin_blueprint.add_url_rule('/profile/<profile_id>/', 'profile',
+                                     view_func=create_profile_view())
+
+    if slow_log is not None:
+        admin_blueprint.add_url_rule('/slow/', 'slow_log',
+                                     view_func=create_slow_log_view())
+
+    if query_advisor is not None:
+        admin_blueprint.add_url_rule('/advisor/', 'advisor',
+                                     view_func=create_advisor_view())
+
+    if metrics is not None:
+        admin_blueprint.add_url_rule('/metrics', 'metrics',
+                                     view_func=create_metrics_view())
+
     admin_blueprint.add_url_rule('/', 'index',
                                  view_func=create_index_view())
     list_view = create_list_view()
@@ -281,6 +830,8 @@ def create_admin_blueprint_new(
                                  'list', view_func=list_view)
     admin_blueprint.add_url_rule('/list/<model_name>/',
                                  'list_view', view_func=list_view)
+    admin_blueprint.add_url_rule('/list/<model_name>/rows/',
+                                 'list_rows', view_func=create_list_rows_view())
     admin_blueprint.add_url_rule('/edit/<model_name>/<path:model_url_key>/',
                                  'edit', view_func=create_edit_view(),
                                  methods=['GET', 'POST'])
@@ -293,6 +844,27 @@ def create_admin_blueprint_new(
     return admin_blueprint
 
 
+# bundles are served with cache headers that expire in a year
+_BUNDLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# number of template output pieces sent at once by streamed views
+_STREAM_BUFFER_SIZE = 40
+
+# number of list view rows whose url keys are computed at once
+_URL_KEY_CHUNK_SIZE = 100
+
+# url key used to build url templates for the list view rows
+_URL_KEY_PLACEHOLDER = u'__model_url_key__'
+
+
+def _split_url_template(url):
+    """Splits a url built with the url key placeholder into the parts
+    that go before and after the url key.
+    """
+    prefix, placeholder, suffix = url.rpartition(_URL_KEY_PLACEHOLDER)
+    return prefix, suffix
+
+
 def _get_admin_extension_dir():
     """Returns the directory path of this admin extension. This is
     necessary for setting the static_folder and templates_folder
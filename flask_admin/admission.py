@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.admission
+    ~~~~~~~~~~~~~~
+
+    Limits how many heavy admin operations run at once, so that a
+    handful of them can't take all the connections of the database
+    pool the application relies on. Operations are grouped in classes;
+    the admin views use these:
+
+    ``count``
+        list pages of models whose row count isn't cached, which have
+        to count the whole table
+
+    ``write``
+        adding, editing and deleting model instances
+
+    Each class with a limit gets a semaphore. Requests that find it
+    full wait in a bounded queue for a slot to free up; requests that
+    find the queue full, or wait longer than the queue timeout, are
+    rejected right away with a ``429 Too Many Requests`` response and
+    a ``Retry-After`` header. Classes without a limit aren't limited.
+
+    Views the application adds to the admin, like exports or bulk
+    imports, can be limited with :meth:`AdmissionController.admitted`.
+
+    Pass an :class:`AdmissionController` to the `admission` parameter
+    of :func:`~flask.ext.admin.create_admin_blueprint` to use it. The
+    limits apply to the threads of one process.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+from functools import wraps
+import threading
+import time
+
+import flask
+
+
+class AdmissionController(object):
+    """Limits the concurrency of operation classes. `limits` is a
+    dict that maps operation classes, or (model name, operation class)
+    tuples for limits that only apply to one model, to the number of
+    operations that can run at once. Models with a limit of their own
+    don't count against the limit of the operation class.
+
+    At most `queue_size` requests wait for each limit, for at most
+    `queue_timeout` seconds. Rejected requests are told to retry after
+    `retry_after` seconds.
+
+    If `metrics` is set to a :class:`~flask.ext.admin.metrics.Metrics`,
+    the number of running and waiting operations, the time waited and
+    the rejections are recorded in it.
+    """
+    def __init__(self, limits, queue_size=10, queue_timeout=5,
+                 retry_after=10, metrics=None):
+        self.limits = dict(limits)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.metrics = None
+        self._gates = {}
+        for key, limit in self.limits.items():
+            self._gates[key] = _Gate(limit)
+        if metrics is not None:
+            self.use_metrics(metrics)
+
+    def use_metrics(self, metrics):
+        """Records the queues of the limits in `metrics`."""
+        self.metrics = metrics
+        metrics.add_collector(self._collect)
+
+    def get_gate_key(self, operation, model_name=None):
+        """Returns the key of the limit that applies to an operation
+        class on a model, or None if it isn't limited.
+        """
+        if (model_name, operation) in self._gates:
+            return (model_name, operation)
+        if operation in self._gates:
+            return operation
+        return None
+
+    def admit(self, operation, model_name=None):
+        """Waits for a slot for an operation. Returns a release
+        function to call when the operation is done, or None if the
+        operation was rejected.
+        """
+        key = self.get_gate_key(operation, model_name)
+        if key is None:
+            return _release_nothing
+        gate = self._gates[key]
+        start = time.time()
+        admitted = gate.acquire(self.queue_size, self.queue_timeout)
+        if self.metrics is not None:
+            labels = (('operation', operation),)
+            if admitted:
+                self.metrics.observe('admission_wait_seconds', labels,
+                                     time.time() - start)
+            else:
+                self.metrics.inc('admission_rejections_total', labels)
+        if not admitted:
+            return None
+        return gate.release
+
+    def admitted(self, operation, model_name=None):
+        """Returns a decorator for views that limits them as
+        operations of the `operation` class. The model name is taken
+        from the `model_name` argument of the view if `model_name`
+        isn't given.
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwds):
+                release = self.admit(
+                    operation, model_name or kwds.get('model_name'))
+                if release is None:
+                    return self.reject()
+                try:
+                    return f(*args, **kwds)
+                finally:
+                    release()
+            return wrapper
+        return decorator
+
+    def reject(self):
+        """Returns the response for rejected requests."""
+        response = flask.Response(
+            'Too many heavy admin operations are running, please '
+            'retry later.', 429, mimetype='text/plain')
+        response.headers['Retry-After'] = str(int(self.retry_after))
+        return response
+
+    def _collect(self):
+        samples = []
+        for key, gate in self._gates.items():
+            if isinstance(key, tuple):
+                labels = (('model', key[0]), ('operation', key[1]))
+            else:
+                labels = (('model', ''), ('operation', key))
+            samples.append(('admission_running', labels, gate.running))
+            samples.append(('admission_queue_depth', labels, gate.waiting))
+        return samples
+
+
+class _Gate(object):
+    """A semaphore that keeps track of how many threads wait for it."""
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = 0
+        self.waiting = 0
+        self._condition = threading.Condition(threading.Lock())
+
+    def acquire(self, queue_size, timeout):
+        """Takes a slot, waiting at most `timeout` seconds for one if
+        fewer than `queue_size` threads are waiting already. Returns
+        True if a slot was taken.
+        """
+        self._condition.acquire()
+        try:
+            if self.running < self.limit:
+                self.running += 1
+                return True
+            if self.waiting >= queue_size:
+                return False
+            deadline = time.time() + timeout
+            self.waiting += 1
+            try:
+                while self.running >= self.limit:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.running += 1
+            return True
+        finally:
+            self._condition.release()
+
+    def release(self):
+        self._condition.acquire()
+        try:
+            self.running -= 1
+            self._condition.notify()
+        finally:
+            self._condition.release()
+
+
+def _release_nothing():
+    pass
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.advisor
+    ~~~~~~~~~~~~~~
+
+    Explains the queries the admin views issue and suggests indexes
+    for them. While a view runs, the datastore asks the database for
+    the plan of each of its queries: ``EXPLAIN QUERY PLAN`` on SQLite,
+    ``EXPLAIN`` on PostgreSQL and ``explain()`` on MongoDB. The plans
+    are aggregated by model and view, and queries that read whole
+    tables or collections, or sort rows without an index, get an
+    index suggested for the columns they filter and sort on.
+
+    Pass a :class:`QueryAdvisor` to the `query_advisor` parameter of
+    :func:`~flask.ext.admin.create_admin_blueprint` to use it. The
+    plans and the suggested indexes are listed on the `/advisor/`
+    page of the admin.
+
+    Explaining a query costs as much as planning it again, so this is
+    meant as a diagnostic mode rather than something to leave on.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import, with_statement
+
+from functools import wraps
+import threading
+
+from flask import request
+
+from flask.ext.admin import util
+
+
+class QueryAdvisor(object):
+    """Collects the plans of the queries issued by the admin views of
+    this process. At most `max_queries` distinct queries are kept for
+    each (model, view) pair.
+    """
+    def __init__(self, max_queries=100):
+        self.max_queries = max_queries
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def explained(self, f):
+        """Decorates a view so that the plans of the queries it
+        issues are recorded under its model and endpoint.
+        Requests that don't issue queries are not counted.
+        """
+        @wraps(f)
+        def wrapper(*args, **kwds):
+            with util.capture_plans() as plans:
+                try:
+                    return f(*args, **kwds)
+                finally:
+                    # requests that don't query anything, like the
+                    # ones for unknown models, aren't recorded
+                    if plans:
+                        endpoint = request.endpoint or ''
+                        self.record(kwds.get('model_name', ''),
+                                    endpoint.rpartition('.')[2], plans)
+        return wrapper
+
+    def record(self, model_name, view, plans):
+        """Records the plans captured during a request to a view."""
+        self._lock.acquire()
+        try:
+            aggregate = self._views.get((model_name, view))
+            if aggregate is None:
+                aggregate = self._views[(model_name, view)] = dict(
+                    model=model_name, view=view, requests=0, queries={})
+            aggregate['requests'] += 1
+            queries = aggregate['queries']
+            for plan in plans:
+                query = queries.get(plan['query'])
+                if query is None:
+                    if len(queries) >= self.max_queries:
+                        continue
+                    query = queries[plan['query']] = dict(plan, count=0)
+                query['count'] += 1
+        finally:
+            self._lock.release()
+
+    def report(self):
+        """Returns the recorded plans by model and view, as a list of
+        dicts with the `model`, the `view`, the number of `requests`
+        and the distinct `queries`, full scans first. Each query is a
+        dict with the `query`, how many times it was issued
+        (`count`), the `plan` lines, whether it was a `full_scan` and
+        the `indexes` suggested for it.
+        """
+        self._lock.acquire()
+        try:
+            report = []
+            for (model_name, view), aggregate in sorted(self._views.items()):
+                queries = sorted(
+                    [dict(query) for query in aggregate['queries'].values()],
+                    key=lambda query: (not query['full_scan'],
+                                       -query['count'], query['query']))
+                report.append(dict(aggregate, queries=queries))
+            return report
+        finally:
+            self._lock.release()
+
+    def suggested_indexes(self):
+        """Returns the suggested indexes, as a list of dicts with the
+        `statement` that creates the index, the number of queries
+        issued that it would serve (`count`) and the (model, view)
+        pairs they were issued by (`views`), most useful first.
+        """
+        indexes = {}
+        for aggregate in self.report():
+            for query in aggregate['queries']:
+                for statement in query['indexes']:
+                    index = indexes.get(statement)
+                    if index is None:
+                        index = indexes[statement] = dict(
+                            statement=statement, count=0, views=[])
+                    index['count'] += query['count']
+                    view = (aggregate['model'], aggregate['view'])
+                    if view not in index['views']:
+                        index['views'].append(view)
+        return sorted(indexes.values(),
+                      key=lambda index: (-index['count'], index['statement']))
+
+    def reset(self):
+        """Forgets the recorded plans."""
+        self._lock.acquire()
+        try:
+            self._views.clear()
+        finally:
+            self._lock.release()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.assets
+    ~~~~~~~~~~~~~~
+
+    Builds the stylesheets and scripts used by the admin templates into
+    a single stylesheet and a single script. The bundle filenames
+    contain a hash of their content, so they can be served with
+    far-future cache headers, and each bundle has a gzipped variant
+    that is served to clients that accept it.
+
+    The bundles are built ahead of time, e.g. when deploying, by
+    running::
+
+        python -m flask_admin.assets
+
+    which writes them to the ``static/bundles`` folder of the
+    admin. A different output folder can be given as an argument. See
+    the `asset_bundle_folder` parameter of
+    :func:`~flask.ext.admin.create_admin_blueprint`.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import posixpath
+import re
+import sys
+from cStringIO import StringIO
+
+
+#: stylesheets bundled into admin.css, in order, relative to the static
+#: folder
+CSS_FILES = (
+    'css/bootstrap.min.css',
+    'css/Aristo/Aristo.css',
+    'css/chosen.css',
+    'css/style.css',
+)
+
+#: scripts bundled into admin.js, in order, relative to the static
+#: folder. Modernizr is not included, since it has to be loaded in the
+#: head of the page.
+JS_FILES = (
+    'js/libs/jquery-1.7.1.min.js',
+    'js/libs/jquery-ui-1.8.17.custom.min.js',
+    'js/libs/jquery-ui-timepicker-addon.js',
+    'js/libs/chosen.jquery.min.js',
+    'js/libs/bootstrap.min.js',
+    'js/plugins.js',
+    'js/admin.js',
+)
+
+#: name of the file, in the output folder, that maps bundle names to
+#: the filenames of the built bundles
+MANIFEST_FILENAME = 'manifest.json'
+
+# the output folder, relative to the static folder, that the urls in
+# the stylesheets are rewritten for
+BUNDLE_URL_PATH = 'bundles'
+
+
+def build_bundles(static_folder=None, output_folder=None):
+    """Builds the admin bundles from the files in `static_folder`
+    (the admin's own static folder by default) and writes them to
+    `output_folder` (``static_folder/bundles`` by default), along
+    with their gzipped variants and a manifest. Returns the manifest,
+    a dict that maps the bundle names ``admin.css`` and ``admin.js``
+    to the filenames of the built bundles.
+
+    Relative urls in the stylesheets are rewritten so that they work
+    when the bundles are served from the ``bundles`` path under the
+    static url of the admin.
+    """
+    if static_folder is None:
+        static_folder = _get_static_folder()
+    if output_folder is None:
+        output_folder = os.path.join(static_folder, BUNDLE_URL_PATH)
+    if not os.path.isdir(output_folder):
+        os.makedirs(output_folder)
+
+    bundles = {
+        'admin.css': minify_css(u'\n'.join(
+            [rewrite_css_urls(_read_file(static_folder, path), path)
+             for path in CSS_FILES])),
+        'admin.js': u'\n;\n'.join(
+            [minify_js(_read_file(static_folder, path))
+             for path in JS_FILES]),
+    }
+
+    manifest = {}
+    for bundle_name, content in bundles.items():
+        content = content.encode('utf-8')
+        base, ext = posixpath.splitext(bundle_name)
+        filename = '%s.%s%s' % (
+            base, hashlib.sha1(content).hexdigest()[:10], ext)
+        path = os.path.join(output_folder, filename)
+        _write_file(path, content)
+        _write_file(path + '.gz', _gzip(content))
+        manifest[bundle_name] = filename
+
+    _write_file(os.path.join(output_folder, MANIFEST_FILENAME),
+                json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+def load_manifest(bundle_folder):
+    """Returns the manifest of the bundles built in `bundle_folder`.
+    Raises an IOError if the bundles haven't been built.
+    """
+    manifest_file = open(os.path.join(bundle_folder, MANIFEST_FILENAME))
+    try:
+        return json.load(manifest_file)
+    finally:
+        manifest_file.close()
+
+
+_css_url_re = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def rewrite_css_urls(css, path):
+    """Rewrites the relative urls in a stylesheet found at `path`
+    (relative to the static folder) so that they are relative to the
+    bundle folder instead.
+    """
+    css_dir = posixpath.dirname(path)
+
+    def rewrite(match):
+        url = match.group(2).strip()
+        if url.startswith(('/', 'data:', '#')) or '://' in url:
+            return match.group(0)
+        url = posixpath.normpath(posixpath.join(css_dir, url))
+        return u"url('%s')" % posixpath.relpath(url, BUNDLE_URL_PATH)
+
+    return _css_url_re.sub(rewrite, css)
+
+
+_css_comment_re = re.compile(r'/\*(?!!).*?\*/', re.DOTALL)
+_css_whitespace_re = re.compile(r'\s+')
+_css_space_re = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(css):
+    """Removes comments and unneeded whitespace from a stylesheet.
+    Comments starting with ``/*!``, like license notices, are kept.
+    Whitespace before colons is left alone, since it is significant
+    in selectors.
+    """
+    css = _css_comment_re.sub(u'', css)
+    css = _css_whitespace_re.sub(u' ', css)
+    css = _css_space_re.sub(r'\1', css)
+    return css.replace(u';}', u'}').strip()
+
+
+def minify_js(js):
+    """Minifies a script with rjsmin or jsmin, if either is
+    installed. Otherwise the script is returned unchanged; most of
+    the bundled scripts come minified already.
+    """
+    try:
+        from rjsmin import jsmin
+    except ImportError:
+        try:
+            from jsmin import jsmin
+        except ImportError:
+            return js
+    return jsmin(js)
+
+
+def _read_file(static_folder, path):
+    f = open(os.path.join(static_folder, *path.split('/')), 'rb')
+    try:
+        return f.read().decode('utf-8')
+    finally:
+        f.close()
+
+
+def _write_file(path, content):
+    f = open(path, 'wb')
+    try:
+        f.write(content)
+    finally:
+        f.close()
+
+
+def _gzip(content):
+    """Returns gzipped content. The timestamp in the gzip header is
+    zeroed, so building the same content gives the same output.
+    """
+    buf = StringIO()
+    gzip_file = gzip.GzipFile(filename='', mode='wb', fileobj=buf,
+                              compresslevel=9, mtime=0)
+    try:
+        gzip_file.write(content)
+    finally:
+        gzip_file.close()
+    return buf.getvalue()
+
+
+def _get_static_folder():
+    return os.path.join(
+        os.path.dirname(inspect.getfile(inspect.currentframe())),
+        'static')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        sys.exit('usage: python -m flask_admin.assets [OUTPUT_FOLDER]')
+    output_folder = sys.argv[1] if len(sys.argv) == 2 else None
+    for bundle_name, filename in sorted(
+            build_bundles(output_folder=output_folder).items()):
+        print('built %s as %s' % (bundle_name, filename))
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.cache
+    ~~~~~~~~~~~~~~
+
+    Cache backends for results that are expensive to compute and
+    change rarely, like the row counts shown in the list view.
+
+    Cached values are grouped in namespaces (the admin uses one per
+    model and database; see
+    :meth:`~flask.ext.admin.datastore.AdminDatastore.get_cache_namespace`).
+    Invalidating a namespace bumps its generation number, which
+    makes every value cached under an older generation unreachable, so
+    invalidation is a single atomic operation no matter how many
+    values are cached.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import cPickle as pickle
+import os
+import random
+import threading
+import time
+
+
+class BaseCache(object):
+    """Base class for cache backends. Subclasses need to define
+    :meth:`generation`, :meth:`lookup`, :meth:`store` and
+    :meth:`invalidate`. Since None is used to signal a cache miss,
+    None values can't be cached.
+
+    `hits` and `misses` count the lookups made in this process.
+    """
+    def __init__(self, default_timeout=300):
+        self.default_timeout = default_timeout
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, namespace):
+        """Returns the current generation number of a namespace."""
+        raise NotImplementedError()
+
+    def lookup(self, namespace, key, generation):
+        """Returns the value cached for key in a namespace under the
+        given generation, or None.
+        """
+        raise NotImplementedError()
+
+    def store(self, namespace, key, generation, value, timeout=None):
+        """Caches a value for key in a namespace under the given
+        generation.
+        """
+        raise NotImplementedError()
+
+    def invalidate(self, namespace):
+        """Invalidates all the values cached in a namespace."""
+        raise NotImplementedError()
+
+    def get(self, namespace, key):
+        """Returns the value cached for key in a namespace, or None."""
+        value = self.lookup(namespace, key, self.generation(namespace))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, namespace, key, value, timeout=None):
+        """Caches a value for key in a namespace."""
+        self.store(namespace, key, self.generation(namespace), value,
+                   timeout)
+
+    def get_or_set(self, namespace, key, creator, timeout=None):
+        """Returns the value cached for key in a namespace. If there
+        isn't one, `creator` is called to compute it and the result is
+        cached. If the namespace is invalidated while the value is
+        being computed, the result is returned but not cached.
+        """
+        generation = self.generation(namespace)
+        value = self.lookup(namespace, key, generation)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = creator()
+        if value is not None:
+            self.store(namespace, key, generation, value, timeout)
+        return value
+
+
+class NullCache(BaseCache):
+    """A cache that doesn't cache anything. This is the default."""
+    def generation(self, namespace):
+        return 0
+
+    def lookup(self, namespace, key, generation):
+        return None
+
+    def store(self, namespace, key, generation, value, timeout=None):
+        pass
+
+    def invalidate(self, namespace):
+        pass
+
+
+class SimpleCache(BaseCache):
+    """A cache that keeps values in a dict in the memory of the
+    current process. Each process has its own copy, so this is only
+    suitable for single process deployments.
+    """
+    def __init__(self, default_timeout=300):
+        super(SimpleCache, self).__init__(default_timeout)
+        self._generations = {}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def lookup(self, namespace, key, generation):
+        entry = self._values.get((namespace, key))
+        if entry is None:
+            return None
+        entry_generation, expires, value = entry
+        if entry_generation != generation or expires <= time.time():
+            return None
+        return value
+
+    def store(self, namespace, key, generation, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        self._lock.acquire()
+        try:
+            if generation == self.generation(namespace):
+                self._values[(namespace, key)] = (
+                    generation, time.time() + timeout, value)
+        finally:
+            self._lock.release()
+
+    def invalidate(self, namespace):
+        self._lock.acquire()
+        try:
+            self._generations[namespace] = self.generation(namespace) + 1
+            for cache_key in self._values.keys():
+                if cache_key[0] == namespace:
+                    del self._values[cache_key]
+        finally:
+            self._lock.release()
+
+
+class SQLiteCache(BaseCache):
+    """A cache that keeps values in a local SQLite database, so that
+    all the worker processes on a host share it. The database uses
+    write-ahead logging, so readers don't block each other or the
+    writer, and is memory-mapped up to `mmap_size` bytes so reads are
+    served from the page cache shared between processes.
+
+    `path` is the filename of the database; it is created if it
+    doesn't exist. Values are pickled, so they must be picklable.
+    """
+    def __init__(self, path, default_timeout=300, mmap_size=64 * 1024 * 1024):
+        super(SQLiteCache, self).__init__(default_timeout)
+        self.path = path
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS generations ('
+            'namespace TEXT PRIMARY KEY, generation INTEGER NOT NULL)')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, '
+            'generation INTEGER NOT NULL, expires REAL NOT NULL, '
+            'value BLOB NOT NULL, PRIMARY KEY (namespace, key))')
+
+    def _connection(self):
+        """Returns a connection for the current thread. Connections
+        are not shared across threads or forked processes.
+        """
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            # imported here so that importing the admin doesn't load
+            # sqlite3 for apps that don't use this cache
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=10,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA mmap_size=%d' % self.mmap_size)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def generation(self, namespace):
+        row = self._connection().execute(
+            'SELECT generation FROM generations WHERE namespace = ?',
+            (namespace,)).fetchone()
+        if row is None:
+            return 0
+        return row[0]
+
+    def lookup(self, namespace, key, generation):
+        row = self._connection().execute(
+            'SELECT value FROM entries WHERE namespace = ? AND key = ? '
+            'AND generation = ? AND expires > ?',
+            (namespace, repr(key), generation, time.time())).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(str(row[0]))
+
+    def store(self, namespace, key, generation, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        now = time.time()
+        connection = self._connection()
+        # only store the value if the namespace hasn't been invalidated
+        # since its generation was read
+        connection.execute(
+            'INSERT OR REPLACE INTO entries '
+            '(namespace, key, generation, expires, value) '
+            'SELECT ?, ?, ?, ?, ? WHERE ? = IFNULL('
+            '(SELECT generation FROM generations WHERE namespace = ?), 0)',
+            (namespace, repr(key), generation, now + timeout,
+             buffer(pickle.dumps(value, 2)), generation, namespace))
+        if random.random() < 0.01:
+            connection.execute('DELETE FROM entries WHERE expires <= ?',
+                               (now,))
+
+    def invalidate(self, namespace):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT OR IGNORE INTO generations (namespace, generation) '
+                'VALUES (?, 0)', (namespace,))
+            connection.execute(
+                'UPDATE generations SET generation = generation + 1 '
+                'WHERE namespace = ?', (namespace,))
+            connection.execute('DELETE FROM entries WHERE namespace = ?',
+                               (namespace,))
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.compression
+    ~~~~~~~~~~~~~~
+
+    Compresses admin responses with gzip or deflate, negotiated from
+    the ``Accept-Encoding`` header of the request. Responses that are
+    streamed from a generator are compressed chunk by chunk, so they
+    are still sent to the client as they are produced.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import zlib
+
+from flask import request
+
+
+#: mimetypes of the responses that get compressed
+COMPRESSIBLE_MIMETYPES = frozenset([
+    'text/html', 'text/plain', 'text/css', 'text/csv',
+    'text/javascript', 'application/javascript', 'application/json',
+    'application/xml',
+])
+
+# window bits given to zlib for each content encoding; 16 + MAX_WBITS
+# makes zlib write a gzip header and trailer
+_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def compress_response(response, min_size=500, level=6):
+    """Compresses `response` in place with the content encoding the
+    client of the current request prefers, if any, and returns
+    it. Only successful responses with a compressible mimetype are
+    compressed. Buffered responses shorter than `min_size` bytes are
+    left alone. `level` is the zlib compression level, from 1
+    (fastest) to 9 (smallest).
+
+    Streamed responses are compressed as they are sent, flushing the
+    compressor after each chunk so that every chunk the application
+    yields reaches the client right away.
+    """
+    if response.status_code != 200 or response.direct_passthrough or \
+            'Content-Encoding' in response.headers or \
+            response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_sequence:
+        data = response.data
+        if len(data) < min_size:
+            return response
+        compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+        response.data = compressor.compress(data) + compressor.flush()
+    else:
+        if response.content_length is not None and \
+                response.content_length < min_size:
+            return response
+        response.response = _compress_iter(
+            response.response, response.charset, encoding, level)
+        response.headers.pop('Content-Length', None)
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _negotiate_encoding():
+    """Returns the content encoding to use for the current request, or
+    None if the client doesn't accept a compressed response.
+    """
+    accept_encodings = request.accept_encodings
+    gzip_quality = accept_encodings.quality('gzip')
+    deflate_quality = accept_encodings.quality('deflate')
+    if gzip_quality > 0 and gzip_quality >= deflate_quality:
+        return 'gzip'
+    if deflate_quality > 0:
+        return 'deflate'
+    return None
+
+
+def _compress_iter(iterable, charset, encoding, level):
+    """Yields the compressed contents of a response iterable, closing
+    the iterable when done. Unicode chunks are encoded with `charset`.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+    try:
+        for chunk in iterable:
+            if isinstance(chunk, unicode):
+                chunk = chunk.encode(charset)
+            if chunk:
+                yield compressor.compress(chunk) + \
+                    compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
@@ -1,11 +1,40 @@
+from flask.ext.admin.cache import NullCache
+
+
 class AdminDatastore(object):
     """A base class for admin datastore objects. All datastores used
     in Flask-Admin should subclass this object and define the
     following methods.
+
+    Datastores can use the `cache` attribute to cache results that
+    are expensive to compute, like row counts, under the namespaces
+    returned by :meth:`get_cache_namespace`. It is set by
+    :func:`create_admin_blueprint` and defaults to a
+    :class:`~flask.ext.admin.cache.NullCache`.
+
+    Several datastores, or applications, can share a cache. The
+    namespaces of each datastore's models are prefixed with
+    `cache_prefix` if it is set, or with :meth:`get_cache_prefix`
+    otherwise, so that models with the same name don't collide.
     """
+    cache = NullCache()
+    cache_prefix = None
+
+    def create_model_pagination(self, model_name, page, per_page=25,
+                                stream=False, after=None, before=None):
+        """Returns a pagination object for the list view. If `stream`
+        is True, the `items` of the pagination can be an iterator that
+        fetches the model instances as it is consumed; it is only
+        iterated over once, within the request. The `total` of the
+        pagination can be None if counting the model instances would
+        take too long; see :class:`~flask.ext.admin.util.Pagination`.
 
-    def create_model_pagination(self, model_name, page, per_page=25):
-        """Returns a pagination object for the list view."""
+        Datastores that page by key can set the `next_cursor` and
+        `prev_cursor` of the pagination. The list view then passes
+        them back as `after`, for the page following the one they came
+        from, or `before`, for the page preceding it, along with the
+        page number. Datastores that don't page by key ignore them.
+        """
         raise NotImplementedError()
 
     def delete_model_instance(self, model_name, model_keys):
@@ -14,6 +43,14 @@ class AdminDatastore(object):
         """
         raise NotImplementedError()
 
+    def estimate_count(self, model_name):
+        """Returns an estimate of the number of instances of a model
+        that is cheaper to get than counting them, or None if the
+        datastore can't estimate it. Datastores can use it for the
+        totals of the list view pagination.
+        """
+        return None
+
     def find_model_instance(self, model_name, model_keys):
         """Returns a model instance, if one exists, that matches
         model_name and model_keys. Returns None if no such model
@@ -21,6 +58,22 @@ class AdminDatastore(object):
         """
         raise NotImplementedError()
 
+    def get_cache_namespace(self, model_name):
+        """Returns the cache namespace of a model."""
+        prefix = self.cache_prefix
+        if prefix is None:
+            prefix = self.get_cache_prefix(model_name)
+        return u'%s:%s' % (prefix, model_name)
+
+    def get_cache_prefix(self, model_name):
+        """Returns the prefix of the cache namespace of a model when
+        `cache_prefix` isn't set. It should identify the database the
+        model is stored in. This default implementation returns the
+        name of the datastore class, which only tells datastores of
+        different types apart.
+        """
+        return u'%s.%s' % (type(self).__module__, type(self).__name__)
+
     def get_model_class(self, model_name):
         """Returns a model class, given a model name."""
         raise NotImplementedError()
@@ -42,11 +95,49 @@ class AdminDatastore(object):
     def save_model(self, model_instance):
         """Persists a model instance to the datastore. Note: this
         could be called when a model instance is added or edited.
+        Datastores may skip the write entirely if an existing model
+        instance has not been changed.
         """
         raise NotImplementedError()
 
+    def save_models(self, model_instances, batch_size=100):
+        """Persists an iterable of model instances to the datastore,
+        writing them `batch_size` at a time. Returns a list of
+        (model_instance, exception) tuples for the instances that
+        could not be saved; an empty list means every instance was
+        saved.
+
+        The cached values of the models of the instances are
+        invalidated once the instances are saved.
+
+        This default implementation calls :meth:`save_model` for each
+        instance, so each instance is saved on its own: the instances
+        saved before a failure stay saved. Datastores should override
+        it with something more efficient where the backend allows.
+        """
+        model_instances = list(model_instances)
+        failed = []
+        try:
+            for model_instance in model_instances:
+                try:
+                    self.save_model(model_instance)
+                except Exception as e:
+                    failed.append((model_instance, e))
+        finally:
+            self._invalidate_cache(model_instances)
+        return failed
+
     def update_from_form(self, model_instance, form):
         """Returns a model instance whose values have been updated
-        with the values from a given form.
+        with the values from a given form. Datastores should only
+        update the values that actually differ from the form data.
         """
         raise NotImplementedError()
+
+    def _invalidate_cache(self, model_instances):
+        """Invalidates the cached values of the models of a sequence
+        of model instances.
+        """
+        for model_name in set([type(model_instance).__name__
+                               for model_instance in model_instances]):
+            self.cache.invalidate(self.get_cache_namespace(model_name))
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.datastore.memory
+    ~~~~~~~~~~~~~~
+
+    Defines an in-memory datastore, mostly useful for testing and
+    benchmarking the admin views without a database.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+from bisect import bisect_left, insort
+import datetime
+import threading
+import types
+import weakref
+
+from wtforms import fields as wtf_fields
+from wtforms import validators
+from wtforms.form import Form
+
+from flask.ext.admin import util
+from flask.ext.admin import wtforms as admin_wtf
+from flask.ext.admin.datastore import AdminDatastore
+
+
+class Field(object):
+    """Declares a field on a model class that is stored in an
+    :class:`InMemoryDatastore`. The `type` should be one of the
+    python types the datastore knows how to make form fields for:
+    ``bool``, ``int``, ``float``, ``unicode``, ``str``,
+    ``datetime.date``, ``datetime.datetime`` or ``datetime.time``.
+
+    For example::
+
+        class Student(Model):
+            id = Field(int, primary_key=True)
+            name = Field(unicode, required=True)
+
+            def __repr__(self):
+                return self.name
+
+    A model can have several primary key fields. If it has a single
+    ``int`` primary key, values are assigned automatically to new
+    instances that don't have one. Models don't need to subclass
+    :class:`Model`, but it's convenient to do so.
+    """
+    _creation_counter = 0
+
+    def __init__(self, type=unicode, primary_key=False, required=False,
+                 default=None, label=None):
+        self.type = type
+        self.primary_key = primary_key
+        self.required = required
+        self.default = default
+        self.label = label
+        self.name = None
+
+        self._creation_order = Field._creation_counter
+        Field._creation_counter += 1
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__.get(self.name, self.default)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+
+
+class Model(object):
+    """A convenient base class for models stored in an
+    :class:`InMemoryDatastore`. Field values can be passed to the
+    constructor as keyword arguments.
+    """
+    def __init__(self, **kwargs):
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+class InMemoryDatastore(AdminDatastore):
+    """A datastore that keeps model instances in memory.
+
+    The `models` parameter should be either a module or an iterable
+    that contains model classes declaring their fields with
+    :class:`Field` attributes. Model classes must be able to be
+    initialized without any arguments.
+
+    Each model is kept in a compact table: one tuple per row, a hash
+    index from primary keys to rows and a sorted index of primary keys
+    that the list view pages through, so lookups are O(1) and pages
+    are O(per_page) regardless of the number of rows.
+
+    Forms are generated from the field declarations. As with the
+    other datastores, the `model_forms` parameter can be set to a dict
+    with model names as keys matched to custom forms, and
+    `exclude_pks` controls whether primary key fields are left out of
+    generated forms.
+    """
+    def __init__(self, models, model_forms=None, exclude_pks=True):
+        self.model_classes = {}
+        self.model_forms = model_forms
+
+        if not self.model_forms:
+            self.model_forms = {}
+
+        if type(models) == types.ModuleType:
+            self.model_classes = dict(
+                [(k, v) for k, v in models.__dict__.items()
+                 if _is_model_class(v)])
+        else:
+            self.model_classes = dict(
+                [(model.__name__, model)
+                 for model in models
+                 if _get_fields(model)])
+
+        self.tables = dict([(k, _Table(_get_fields(v)))
+                            for k, v in self.model_classes.items()])
+
+        self.form_dict = dict(
+            [(k, _form_for_model(v, exclude_pk=exclude_pks))
+             for k, v in self.model_classes.items()])
+        for model_name, form in self.model_forms.items():
+            if model_name in self.form_dict:
+                self.form_dict[model_name] = form
+
+    def create_model_pagination(self, model_name, page, per_page=25,
+                                stream=False, after=None, before=None):
+        """Returns a pagination object for the list view. If `stream`
+        is True, model instances are created from the rows as they are
+        iterated over. Pages are found by their number; `after` and
+        `before` are ignored.
+        """
+        table = self.tables[model_name]
+        model_class = self.get_model_class(model_name)
+        rows = table.page((page - 1) * per_page, per_page)
+        items = (_materialize(model_class, table, row) for row in rows)
+        if not stream:
+            items = list(items)
+        return util.Pagination(page, per_page, len(table), items)
+
+    def delete_model_instance(self, model_name, model_keys):
+        """Deletes a model instance. Returns True if model instance
+        was successfully deleted, returns False otherwise.
+        """
+        table = self.tables[model_name]
+        return table.delete(table.key_from_strings(model_keys))
+
+    def find_model_instance(self, model_name, model_keys):
+        """Returns a model instance, if one exists, that matches
+        model_name and model_keys. Returns None if no such model
+        instance exists.
+        """
+        table = self.tables[model_name]
+        row = table.get(table.key_from_strings(model_keys))
+        if row is None:
+            return None
+        return _materialize(self.get_model_class(model_name), table, row)
+
+    def get_cache_prefix(self, model_name):
+        """Returns an identifier of this datastore, since the model
+        instances only live in it.
+        """
+        return u'memory|%x' % id(self)
+
+    def get_model_class(self, model_name):
+        """Returns a model class, given a model name."""
+        return self.model_classes[model_name]
+
+    def get_model_form(self, model_name):
+        """Returns a form, given a model name."""
+        return self.form_dict[model_name]
+
+    def get_model_keys(self, model_instance):
+        """Returns the keys for a given a model instance."""
+        return [getattr(model_instance, field.name)
+                for field in _get_fields(type(model_instance))
+                if field.primary_key]
+
+    def list_model_names(self):
+        """Returns a list of model names available in the datastore."""
+        return self.model_classes.keys()
+
+    def save_model(self, model_instance):
+        """Persists a model instance to the datastore. Note: this
+        could be called when a model instance is added or edited.
+        Nothing is written if an existing model instance has not been
+        changed.
+        """
+        table = self.tables[type(model_instance).__name__]
+        row = tuple([getattr(model_instance, field.name)
+                     for field in table.fields])
+        old_key = model_instance.__dict__.get('_memory_key')
+        model_instance._memory_key = table.save(old_key, row)
+        for field, value in zip(table.fields, table.get(
+                model_instance._memory_key)):
+            setattr(model_instance, field.name, value)
+
+    def update_from_form(self, model_instance, form):
+        """Returns a model instance whose values have been updated
+        with the values from a given form. Only the fields whose data
+        differs from the current value on the model instance are
+        populated.
+        """
+        for name, field in form._fields.iteritems():
+            if getattr(model_instance, name, _missing) != field.data:
+                field.populate_obj(model_instance, name)
+        return model_instance
+
+
+# sentinel for attributes that have not been set on a model instance
+_missing = object()
+
+
+class _Table(object):
+    """Row storage for a single model. Rows are tuples of field
+    values, kept in a list of slots; deleted slots are reused. A dict
+    maps primary key tuples to slots and a sorted list of primary key
+    tuples gives the order rows are paged through.
+    """
+    def __init__(self, fields):
+        self.fields = fields
+        self.pk_positions = [i for i, field in enumerate(fields)
+                             if field.primary_key]
+        self.rows = []
+        self.free_slots = []
+        self.pk_index = {}
+        self.sorted_keys = []
+        self.lock = threading.RLock()
+
+        pk_fields = [fields[i] for i in self.pk_positions]
+        self.autoincrement = len(pk_fields) == 1 and \
+            pk_fields[0].type in (int, long)
+        self.last_id = 0
+
+    def __len__(self):
+        return len(self.pk_index)
+
+    def key_for(self, row):
+        return tuple([row[i] for i in self.pk_positions])
+
+    def key_from_strings(self, model_keys):
+        """Converts the string keys that come from a url to a primary
+        key tuple. Returns None if they can't be converted.
+        """
+        try:
+            return tuple([self.fields[i].type(value) for i, value
+                          in zip(self.pk_positions, model_keys)])
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, key):
+        slot = self.pk_index.get(key)
+        if slot is None:
+            return None
+        return self.rows[slot]
+
+    def page(self, offset, limit):
+        rows = self.rows
+        pk_index = self.pk_index
+        return [rows[pk_index[key]]
+                for key in self.sorted_keys[offset:offset + limit]]
+
+    def save(self, old_key, row):
+        """Stores a row, replacing the row stored under `old_key` if
+        it is given. Returns the primary key of the stored row.
+        """
+        self.lock.acquire()
+        try:
+            if self.autoincrement and row[self.pk_positions[0]] is None:
+                row = list(row)
+                row[self.pk_positions[0]] = self.last_id + 1
+                row = tuple(row)
+
+            key = self.key_for(row)
+            if None in key:
+                raise ValueError('primary key values must be set')
+
+            if old_key is not None and old_key in self.pk_index:
+                slot = self.pk_index[old_key]
+                if self.rows[slot] == row:
+                    return key
+                if key != old_key:
+                    if key in self.pk_index:
+                        raise ValueError('duplicate primary key: %r' % (key,))
+                    del self.pk_index[old_key]
+                    self._remove_sorted_key(old_key)
+                    self.pk_index[key] = slot
+                    insort(self.sorted_keys, key)
+                self.rows[slot] = row
+            else:
+                if key in self.pk_index:
+                    raise ValueError('duplicate primary key: %r' % (key,))
+                if self.free_slots:
+                    slot = self.free_slots.pop()
+                    self.rows[slot] = row
+                else:
+                    slot = len(self.rows)
+                    self.rows.append(row)
+                self.pk_index[key] = slot
+                insort(self.sorted_keys, key)
+
+            if self.autoincrement:
+                self.last_id = max(self.last_id, key[0])
+            return key
+        finally:
+            self.lock.release()
+
+    def delete(self, key):
+        self.lock.acquire()
+        try:
+            slot = self.pk_index.pop(key, None)
+            if slot is None:
+                return False
+            self.rows[slot] = None
+            self.free_slots.append(slot)
+            self._remove_sorted_key(key)
+            return True
+        finally:
+            self.lock.release()
+
+    def _remove_sorted_key(self, key):
+        del self.sorted_keys[bisect_left(self.sorted_keys, key)]
+
+
+# the field declarations of model classes, by class
+_fields_by_class = weakref.WeakKeyDictionary()
+
+
+def _get_fields(model_class):
+    """Returns the :class:`Field` declarations of a model class, in
+    the order they were declared. The fields of classes that declare
+    any are cached.
+    """
+    fields = _fields_by_class.get(model_class)
+    if fields is not None:
+        return fields
+
+    fields = {}
+    for klass in reversed(model_class.__mro__):
+        for name, value in klass.__dict__.items():
+            if isinstance(value, Field):
+                value.name = name
+                fields[name] = value
+    fields = tuple(sorted(fields.values(),
+                          key=lambda field: field._creation_order))
+    if fields:
+        _fields_by_class[model_class] = fields
+    return fields
+
+
+def _is_model_class(value):
+    """Returns True if `value` is a model class: a :class:`Model`
+    subclass or any other class that declares :class:`Field`
+    attributes. Other classes found in a models module, like imported
+    ones, are left alone.
+    """
+    return isinstance(value, type) and value is not Model and \
+        bool(_get_fields(value))
+
+
+def _materialize(model_class, table, row):
+    """Returns a model instance for a stored row."""
+    model_instance = model_class()
+    for field, value in zip(table.fields, row):
+        model_instance.__dict__[field.name] = value
+    model_instance._memory_key = table.key_for(row)
+    return model_instance
+
+
+def _form_for_model(model_class, exclude_pk=True):
+    """Returns a wtforms Form class for a model class, generated from
+    its field declarations.
+    """
+    field_dict = {}
+    for field in _get_fields(model_class):
+        if exclude_pk and field.primary_key:
+            continue
+        converter = _converters.get(field.type)
+        if converter is None:
+            continue
+
+        if field.required and field.type is not bool:
+            field_validators = [validators.Required()]
+        else:
+            field_validators = [validators.Optional()]
+        field_dict[field.name] = converter(
+            label=field.label, validators=field_validators,
+            default=field.default)
+
+    return type(model_class.__name__ + 'Form', (Form,), field_dict)
+
+
+def _date_field(**field_args):
+    field_args['widget'] = admin_wtf.DatePickerWidget()
+    return wtf_fields.DateField(**field_args)
+
+
+def _datetime_field(**field_args):
+    field_args['widget'] = admin_wtf.DateTimePickerWidget()
+    return wtf_fields.DateTimeField(**field_args)
+
+
+def _time_field(**field_args):
+    field_args['widget'] = admin_wtf.TimePickerWidget()
+    return admin_wtf.TimeField(**field_args)
+
+
+_converters = {
+    bool: wtf_fields.BooleanField,
+    int: wtf_fields.IntegerField,
+    long: wtf_fields.IntegerField,
+    float: wtf_fields.FloatField,
+    str: wtf_fields.TextField,
+    unicode: wtf_fields.TextField,
+    datetime.date: _date_field,
+    datetime.datetime: _datetime_field,
+    datetime.time: _time_field,
+}
@@ -9,12 +9,15 @@
 """
 from __future__ import absolute_import
 
+import datetime
 import types
 
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
 import mongoalchemy as ma
 from mongoalchemy.document import Document
 from wtforms import fields as f
-from wtforms import form, validators, widgets
+from wtforms import validators, widgets
 from wtforms.form import Form
 
 from flask.ext.admin.datastore import AdminDatastore
@@ -48,10 +51,15 @@ class MongoAlchemyDatastore(AdminDatastore):
     that should be used as forms for creating and editing instances of
     these models.
 
+    Generated forms can be cached on disk by setting `form_cache` to a
+    :class:`~flask.ext.admin.formcache.FormCache`. A model's form is
+    generated again whenever its fields change.
+
     .. _MongoAlchemy documentation: http://www.mongoalchemy.org/api/session.html
     .. _WTForms documentation: http://wtforms.simplecodes.com/
     """
-    def __init__(self, models, db_session, model_forms=None):
+    def __init__(self, models, db_session, model_forms=None,
+                 form_cache=None):
         self.model_classes = {}
         self.model_forms = model_forms
         self.db_session = db_session
@@ -71,18 +79,77 @@ class MongoAlchemyDatastore(AdminDatastore):
 
         if self.model_classes:
             self.form_dict = dict(
-                [(k, _form_for_model(v, db_session,))
+                [(k, _cached_form_for_model(v, db_session, form_cache))
                  for k, v in self.model_classes.items()])
+            if form_cache is not None:
+                form_cache.save()
             for model_name, form in self.model_forms.items():
                 if model_name in self.form_dict:
                     self.form_dict[model_name] = form
 
-    def create_model_pagination(self, model_name, page, per_page=25):
-        """Returns a pagination object for the list view."""
+    def create_model_pagination(self, model_name, page, per_page=25,
+                                stream=False, after=None, before=None):
+        """Returns a pagination object for the list view. Documents
+        are listed in `mongo_id` order.
+
+        Pages are found by seeking in the `_id` index: `after` or
+        `before` can be set to the `mongo_id` that the page starts
+        after or ends before, as given by the `next_cursor` and
+        `prev_cursor` of the pagination of a neighbouring page. Pages
+        without a cursor, like the ones linked by number, are skipped
+        to from whichever end of the collection is closer, since the
+        cost of skipping grows with the number of skipped documents.
+
+        If `stream` is True, the items are read from the database
+        cursor as they are iterated over. The last document of a
+        streamed page isn't known when the pager is rendered, so the
+        pagination has no `next_cursor` then.
+        """
         model_class = self.get_model_class(model_name)
-        query = self.db_session.query(model_class).skip(
-            (page - 1) * per_page).limit(per_page)
-        return MongoAlchemyPagination(page, per_page, query)
+        mongo_id = model_class.mongo_id
+        # the list view shows whole collections, so their metadata
+        # count is the total
+        total = self.cache.get_or_set(
+            self.get_cache_namespace(model_name), 'count',
+            lambda: self.estimate_count(model_name))
+        after = _to_object_id(after)
+        before = _to_object_id(before)
+
+        query = self.db_session.query(model_class)
+        skip = 0
+        limit = per_page
+        reverse = False
+        if after is not None:
+            query = query.filter(mongo_id > after).ascending(mongo_id)
+        elif before is not None:
+            query = query.filter(mongo_id < before).descending(mongo_id)
+            reverse = True
+        else:
+            offset = (page - 1) * per_page
+            # the number of documents after the page
+            remaining = total - page * per_page
+            if offset > remaining > -per_page:
+                query = query.descending(mongo_id)
+                skip = max(remaining, 0)
+                # the last page can be shorter than the others
+                limit = per_page + min(remaining, 0)
+                reverse = True
+            else:
+                query = query.ascending(mongo_id)
+                skip = offset
+        if skip:
+            query = query.skip(skip)
+        query = query.limit(limit)
+
+        options = dict(sort=query.sort, limit=limit)
+        if skip:
+            options['skip'] = skip
+        _record_query(model_class, 'find', query.query, **options)
+        if util.capturing_plans():
+            _record_plan(self.db_session.db, model_class, query.query,
+                         skip=skip, limit=limit, sort=query.sort)
+        return MongoAlchemyPagination(page, per_page, query, stream=stream,
+                                      total=total, reverse=reverse)
 
     def delete_model_instance(self, model_name, model_keys):
         """Deletes a model instance. Returns True if model instance
@@ -91,6 +158,8 @@ class MongoAlchemyDatastore(AdminDatastore):
         model_class = self.get_model_class(model_name)
         try:
             model_instance = self.find_model_instance(model_name, model_keys)
+            _record_query(model_class, 'remove',
+                          {'_id': model_instance.mongo_id})
             self.db_session.remove(model_instance)
             return True
         except ma.query.BadResultException:
@@ -103,8 +172,29 @@ class MongoAlchemyDatastore(AdminDatastore):
         """
         model_key = model_keys[0]
         model_class = self.get_model_class(model_name)
-        return self.db_session.query(model_class).filter(
-            model_class.mongo_id == model_key).one()
+        query = self.db_session.query(model_class).filter(
+            model_class.mongo_id == model_key)
+        _record_query(model_class, 'find_one', query.query)
+        if util.capturing_plans():
+            _record_plan(self.db_session.db, model_class, query.query,
+                         limit=1)
+        return query.one()
+
+    def estimate_count(self, model_name):
+        """Returns the number of documents of the collection of a
+        model, as kept in the collection metadata. Reading it takes
+        constant time, unlike counting the documents matched by a
+        query.
+        """
+        model_class = self.get_model_class(model_name)
+        _record_query(model_class, 'count')
+        return self.db_session.db[model_class.get_collection_name()].count()
+
+    def get_cache_prefix(self, model_name):
+        """Returns the name of the database the documents are stored
+        in.
+        """
+        return u'mongodb|%s' % self.db_session.db.name
 
     def get_model_class(self, model_name):
         """Returns a model class, given a model name."""
@@ -125,34 +215,238 @@ class MongoAlchemyDatastore(AdminDatastore):
     def save_model(self, model_instance):
         """Persists a model instance to the datastore. Note: this
         could be called when a model instance is added or edited.
+
+        New documents are committed in full. Documents that already
+        exist are updated with a `$set` of the fields that were
+        changed by :meth:`update_from_form`, and nothing is written
+        if no fields were changed.
+        """
+        changed_fields = getattr(model_instance, '_admin_changed_fields',
+                                 None)
+        if changed_fields is None or not model_instance.has_id():
+            _record_query(type(model_instance), 'save')
+            return model_instance.commit(self.db_session.db)
+
+        del model_instance._admin_changed_fields
+        document_fields = model_instance.get_fields()
+        set_ops = {}
+        for name in changed_fields:
+            if name not in document_fields:
+                continue
+            ma_field = document_fields[name]
+            set_ops[ma_field.db_field] = ma_field.wrap(
+                getattr(model_instance, name))
+        if not set_ops:
+            return
+
+        collection = self.db_session.db[
+            model_instance.get_collection_name()]
+        _record_query(type(model_instance), 'update',
+                      {'_id': model_instance.mongo_id}, {'$set': set_ops})
+        collection.update({'_id': model_instance.mongo_id},
+                          {'$set': set_ops}, safe=True)
+
+    def save_models(self, model_instances, batch_size=100):
+        """Persists an iterable of model instances. New documents are
+        inserted into their collections `batch_size` at a time;
+        existing documents are updated as in :meth:`save_model`.
+        Returns a list of (model_instance, exception) tuples for the
+        instances that could not be saved.
+
+        If a batch insert fails, the documents that did not make it
+        into the collection are inserted one at a time, so that only
+        the offending documents are reported.
+
+        The cached values of the models of the documents are
+        invalidated once the documents are saved.
         """
-        return model_instance.commit(self.db_session.db)
+        model_instances = list(model_instances)
+        new_instances = []
+        failed = []
+        try:
+            for model_instance in model_instances:
+                if model_instance.has_id():
+                    try:
+                        self.save_model(model_instance)
+                    except Exception as e:
+                        failed.append((model_instance, e))
+                else:
+                    new_instances.append(model_instance)
+
+            for start in xrange(0, len(new_instances), batch_size):
+                failed.extend(self._insert_batch(
+                    new_instances[start:start + batch_size]))
+        finally:
+            self._invalidate_cache(model_instances)
+        return failed
+
+    def _insert_batch(self, model_instances):
+        """Inserts a batch of new documents, grouped by collection.
+        Returns a list of (model_instance, exception) tuples for the
+        documents that could not be inserted.
+        """
+        failed = []
+        by_collection = {}
+        for model_instance in model_instances:
+            try:
+                document = model_instance.wrap()
+            except Exception as e:
+                failed.append((model_instance, e))
+                continue
+            by_collection.setdefault(
+                model_instance.get_collection_name(), []).append(
+                (model_instance, document))
+
+        for collection_name, pairs in by_collection.items():
+            collection = self.db_session.db[collection_name]
+            for index in pairs[0][0].get_indexes():
+                index.ensure(collection)
+            try:
+                collection.insert([document for model_instance, document
+                                   in pairs], safe=True)
+                inserted_pairs = pairs
+            except Exception:
+                # pymongo sets the _id of every document before
+                # sending the batch, so look up which ones were
+                # inserted and retry the rest individually
+                ids = [document['_id'] for model_instance, document in pairs]
+                inserted = set(
+                    [document['_id'] for document in collection.find(
+                        {'_id': {'$in': ids}}, fields=['_id'])])
+                inserted_pairs = []
+                for model_instance, document in pairs:
+                    if document['_id'] not in inserted:
+                        try:
+                            collection.insert(document, safe=True)
+                        except Exception as e:
+                            failed.append((model_instance, e))
+                            continue
+                    inserted_pairs.append((model_instance, document))
+
+            for model_instance, document in inserted_pairs:
+                model_instance.mongo_id = document['_id']
+        return failed
 
     def update_from_form(self, model_instance, form):
         """Returns a model instance whose values have been updated
-        with the values from a given form.
+        with the values from a given form. Only the fields whose data
+        differs from the current value on the model instance are set;
+        their names are remembered so :meth:`save_model` can write
+        just those fields.
         """
+        changed_fields = set()
         for field in form:
             # handle FormFields that were generated for mongoalchemy
             # TupleFields as a special case
             if field.__class__ == f.FormField:
-                data_tuple = tuple([subfield.data for subfield in field])
-                setattr(model_instance, field.name, data_tuple)
-                continue
+                value = tuple([subfield.data for subfield in field])
 
             # don't use the mongo id from the form - it comes from the
             # key/url and if someone tampers with the form somehow, we
             # should ignore that
             elif field.name != 'mongo_id':
-                setattr(model_instance, field.name, field.data)
+                value = field.data
+            else:
+                continue
+
+            if getattr(model_instance, field.name, _missing) != value:
+                setattr(model_instance, field.name, value)
+                changed_fields.add(field.name)
+
+        model_instance._admin_changed_fields = changed_fields
         return model_instance
 
 
+# sentinel for attributes that have not been set on a document
+_missing = object()
+
+
 class MongoAlchemyPagination(util.Pagination):
-    def __init__(self, page, per_page, query, *args, **kwargs):
+    """A page of the documents read by `query`. If `reverse` is True,
+    the query reads the page backwards, so it is read whole and
+    reversed rather than streamed. If `total` isn't given, the
+    documents matched by the query are counted, leaving out its skip
+    and limit.
+
+    When the page is read whole, `next_cursor` and `prev_cursor` are
+    set to the `mongo_id` of its last and first documents.
+    """
+    def __init__(self, page, per_page, query, stream=False, total=None,
+                 reverse=False, *args, **kwargs):
+        if reverse:
+            items = query.all()
+            items.reverse()
+        elif stream:
+            items = iter(query)
+        else:
+            items = query.all()
+        if total is None:
+            _record_query(query.type, 'count', query.query)
+            total = query.count(with_limit_and_skip=False)
         super(MongoAlchemyPagination, self).__init__(
-            page, per_page, total=query.count(), items=query.all(),
-            *args, **kwargs)
+            page, per_page, total=total, items=items, *args, **kwargs)
+        if isinstance(items, list) and items:
+            if self.has_next:
+                self.next_cursor = unicode(items[-1].mongo_id)
+            if self.has_prev:
+                self.prev_cursor = unicode(items[0].mongo_id)
+
+
+def _to_object_id(value):
+    """Returns the ObjectId of a page cursor, or None if it isn't set
+    or isn't a valid ObjectId.
+    """
+    if not value:
+        return None
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _record_plan(db, document_class, spec, skip=0, limit=0, sort=None):
+    """Explains a find on the collection of `document_class` and
+    reports its plan, along with an index for the fields it filters
+    on if it scans the whole collection, to the plan captures of
+    :func:`flask.ext.admin.util.capture_plans`.
+    """
+    collection_name = document_class.get_collection_name()
+    try:
+        cursor = db[collection_name].find(spec).skip(skip).limit(limit)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = cursor.explain()
+    except Exception:
+        return
+    # servers before 3.0 name the cursor type, later ones describe the
+    # winning plan
+    winning_plan = explanation.get('queryPlanner', {}).get('winningPlan')
+    full_scan = explanation.get('cursor', '').startswith('BasicCursor') or \
+        'COLLSCAN' in repr(winning_plan)
+    plan = [u'%s: %r' % (key, explanation[key])
+            for key in ('cursor', 'nscanned', 'n', 'millis')
+            if key in explanation]
+    if winning_plan is not None:
+        plan.append(u'winningPlan: %r' % (winning_plan,))
+
+    indexes = []
+    fields = [field for field in sorted(spec) if not field.startswith('$')]
+    if full_scan and fields and fields != ['_id']:
+        indexes.append(u'db.%s.ensureIndex({%s})' % (
+            collection_name,
+            u', '.join([u'%s: 1' % field for field in fields])))
+    util.record_plan(u'%s.find(%r)' % (collection_name, spec), plan,
+                     full_scan=full_scan, indexes=indexes)
+
+
+def _record_query(document_class, operation, *specs, **options):
+    """Reports a query on the collection of `document_class` to the
+    query captures of :func:`flask.ext.admin.util.capture_queries`.
+    """
+    util.record_query(u'%s.%s(%s)%s' % (
+        document_class.get_collection_name(), operation,
+        u', '.join([repr(spec) for spec in specs]),
+        u''.join([u'.%s(%r)' % item for item in sorted(options.items())])))
 
 
 def _form_for_model(document_class, db_session):
@@ -162,6 +456,53 @@ def _form_for_model(document_class, db_session):
     return model_form(document_class)
 
 
+def _cached_form_for_model(document_class, db_session, form_cache):
+    """Returns the form for a document class from `form_cache`,
+    generating it with _form_for_model() if it isn't cached. If
+    `form_cache` is None the form is always generated.
+    """
+    if form_cache is None:
+        return _form_for_model(document_class, db_session)
+
+    return form_cache.get_form(
+        'mongoalchemy:%s.%s' % (document_class.__module__,
+                                document_class.__name__),
+        _document_metadata(document_class),
+        lambda: _form_for_model(document_class, db_session))
+
+
+def _document_metadata(document_class):
+    """Returns a description of the fields of a document class that
+    its generated form depends on, for keying the form cache.
+    """
+    return (document_class.__module__, document_class.__name__,
+            [(name, _field_metadata(field))
+             for name, field in sorted(document_class.get_fields().items())])
+
+
+def _field_metadata(ma_field):
+    metadata = [type(ma_field).__module__, type(ma_field).__name__]
+    for key, value in sorted(vars(ma_field).items()):
+        metadata.append((key, _value_metadata(value)))
+    return metadata
+
+
+def _value_metadata(value):
+    if isinstance(value, ma.fields.Field):
+        return _field_metadata(value)
+    if isinstance(value, (list, tuple)):
+        return [_value_metadata(item) for item in value]
+    if isinstance(value, _PLAIN_TYPES):
+        return repr(value)
+    return type(value).__name__
+
+
+# types of the field attributes whose values are part of the metadata
+# of a document class; only the type of other attributes is used
+_PLAIN_TYPES = (basestring, bool, int, long, float, type(None),
+                datetime.date, datetime.time)
+
+
 #-----------------------------------------------------------------------
 # mongo alchemy form generation: to be pushed upstream
 #-----------------------------------------------------------------------
@@ -181,17 +522,7 @@ def converts(*args):
 class ModelConverterBase(object):
     def __init__(self, converters, use_mro=True):
         self.use_mro = use_mro
-
-        if not converters:
-            converters = {}
-
-        for name in dir(self):
-            obj = getattr(self, name)
-            if hasattr(obj, '_converter_for'):
-                for classname in obj._converter_for:
-                    converters[classname] = obj
-
-        self.converters = converters
+        self.converters = util.bind_converters(self, converters)
 
     def convert(self, model, ma_field, field_args):
         default = getattr(ma_field, 'default', None)
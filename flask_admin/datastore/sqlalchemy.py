@@ -8,25 +8,28 @@
     :copyright: (c) 2011 by wilsaj.
     :license: BSD, see LICENSE for more details.
 """
-from __future__ import absolute_import
+from __future__ import absolute_import, with_statement
 
-import datetime
-from functools import wraps
+from contextlib import contextmanager
+import cPickle as pickle
 import inspect
-import os
+import re
+import sys
+import threading
 import time
 import types
+import weakref
 
-import flask
-from flask import flash, render_template, redirect, request, url_for
-from flask.ext.sqlalchemy import Pagination
 import sqlalchemy as sa
 from sqlalchemy.orm.exc import NoResultFound
-from wtforms import validators, widgets
+from sqlalchemy.orm.util import has_identity
+from wtforms import fields as wtf_fields
+from wtforms import validators
 from wtforms.ext.sqlalchemy.orm import model_form, converts, ModelConverter
 from wtforms.ext.sqlalchemy import fields as sa_fields
 
-from flask.ext.admin.wtforms import *
+from flask.ext.admin import util
+from flask.ext.admin import wtforms as admin_wtf
 from flask.ext.admin.datastore import AdminDatastore
 
 
@@ -61,13 +64,47 @@ class SQLAlchemyDatastore(AdminDatastore):
     the nature of foreign key relationships. If you want to expose the
     primary key, set this to False.
 
+    Generated forms can be cached on disk by setting `form_cache` to a
+    :class:`~flask.ext.admin.formcache.FormCache`, so that worker
+    processes don't have to introspect the models on startup. A
+    model's form is generated again whenever its mapped columns or
+    relationships change.
+
+    Reads made for the list view can be given time budgets, so that
+    counting a huge table or paging far into it doesn't hold a
+    connection for minutes. `read_timeout` is the default budget in
+    seconds, and `read_timeouts` can be set to a dict that maps model
+    names, operations (``'count'`` or ``'list'``) or (model name,
+    operation) tuples to budgets; see :meth:`get_read_timeout`. A
+    query that runs over its budget is cancelled and the list view
+    degrades: without a count, the pager only links to the next page,
+    and a page that can't be fetched in time is shown incomplete, with
+    a warning. Budgets are enforced on SQLite and PostgreSQL; on other
+    databases queries run without them. If the admin has a cache, a
+    model whose count ran over its budget isn't counted again for a
+    minute, or until it is changed.
+
+    Counting the rows of a huge table for the pager can take longer
+    than the page itself. If `estimate_counts_above` is set, tables
+    that the database statistics estimate to have at least that many
+    rows get the estimate as their total instead, which takes a single
+    lookup; smaller tables are counted exactly. See
+    :meth:`estimate_count`. Estimates are also used when counting
+    runs over its time budget.
+
     .. _SQLAlchemy in Flask: http://flask.pocoo.org/docs/patterns/sqlalchemy/
     .. _WTForms documentation: http://wtforms.simplecodes.com/
     """
-    def __init__(self, models, db_session, model_forms=None, exclude_pks=True):
+    def __init__(self, models, db_session, model_forms=None, exclude_pks=True,
+                 form_cache=None, read_timeout=None, read_timeouts=None,
+                 estimate_counts_above=None):
         self.model_classes = {}
         self.model_forms = model_forms
         self.db_session = db_session
+        self.read_timeout = read_timeout
+        self.read_timeouts = dict(read_timeouts or {})
+        self.estimate_counts_above = estimate_counts_above
+        self._cache_prefixes = {}
 
         if not self.model_forms:
             self.model_forms = {}
@@ -87,21 +124,72 @@ class SQLAlchemyDatastore(AdminDatastore):
 
         if self.model_classes:
             self.form_dict = dict(
-                [(k, _form_for_model(v, db_session,
-                                     exclude_pk=exclude_pks))
+                [(k, _cached_form_for_model(v, db_session, form_cache,
+                                            exclude_pk=exclude_pks))
                  for k, v in self.model_classes.items()])
+            if form_cache is not None:
+                form_cache.save()
             for model_name, form in self.model_forms.items():
                 if model_name in self.form_dict:
                     self.form_dict[model_name] = form
 
-    def create_model_pagination(self, model_name, page, per_page=25):
-        """Returns a pagination object for the list view."""
+        util.when_capturing(self._listen_for_queries)
+
+    def create_model_pagination(self, model_name, page, per_page=25,
+                                stream=False, after=None, before=None):
+        """Returns a pagination object for the list view. If `stream`
+        is True, the items are fetched from the database in batches as
+        they are iterated over. Pages are found by their number;
+        `after` and `before` are ignored.
+        """
         model_class = self.model_classes[model_name]
         model_instances = self.db_session.query(model_class)
         offset = (page - 1) * per_page
-        items = model_instances.limit(per_page).offset(offset).all()
-        return Pagination(model_instances, page, per_page,
-                          model_instances.count(), items)
+        if self.estimate_counts_above is not None:
+            estimate = self._get_estimated_count(model_name)
+            if estimate is not None and \
+                    estimate >= self.estimate_counts_above:
+                return self._paginate_with_lookahead(
+                    model_name, model_instances, page, per_page,
+                    total=estimate)
+
+        if self._count_timed_out(model_name):
+            # counting ran over its budget recently, don't wait for
+            # it again
+            total = None
+        else:
+            total = self.cache.get_or_set(
+                self.get_cache_namespace(model_name), 'count',
+                lambda: self._timed_count(model_name, model_instances))
+        if total is None:
+            # an estimate is better than no count at all
+            estimate = self._get_estimated_count(model_name)
+            if estimate is None:
+                return self._paginate_with_lookahead(
+                    model_name, model_instances, page, per_page,
+                    warning=_NO_COUNT_WARNING)
+            return self._paginate_with_lookahead(
+                model_name, model_instances, page, per_page,
+                total=estimate, warning=_ESTIMATED_COUNT_WARNING)
+
+        query = model_instances.limit(per_page).offset(offset)
+        pagination = util.Pagination(page, per_page, total, [])
+        timeout = self.get_read_timeout(model_name, 'list')
+        if stream and timeout is None:
+            pagination.items = iter(query.yield_per(_STREAM_BATCH_SIZE))
+        elif stream:
+            pagination.items = _iter_before_deadline(
+                self.db_session, model_class,
+                query.yield_per(_STREAM_BATCH_SIZE), _deadline(timeout),
+                pagination)
+        else:
+            try:
+                with _statement_deadline(self.db_session, model_class,
+                                         _deadline(timeout)):
+                    pagination.items = query.all()
+            except _ReadTimeout:
+                pagination.warning = _PARTIAL_PAGE_WARNING
+        return pagination
 
     def delete_model_instance(self, model_name, model_keys):
         """Deletes a model instance. Returns True if model instance
@@ -135,6 +223,56 @@ class SQLAlchemyDatastore(AdminDatastore):
         """Returns a model class, given a model name."""
         return self.model_classes[model_name]
 
+    def estimate_count(self, model_name):
+        """Returns the number of rows of the table of a model, as
+        estimated from the statistics the database keeps for its query
+        planner, or None if there are none. On SQLite the statistics
+        are gathered by running ``ANALYZE``; PostgreSQL and MySQL keep
+        them up to date themselves. Models that don't map a whole
+        table, like subclasses sharing the table of their parent
+        class, can't be estimated.
+        """
+        model_class = self.get_model_class(model_name)
+        mapper = sa.orm.class_mapper(model_class)
+        table = mapper.mapped_table
+        if mapper.single or not isinstance(table, sa.Table):
+            return None
+        connection = self.db_session.connection(mapper=mapper)
+        estimator = _ROW_ESTIMATORS.get(connection.dialect.name)
+        if estimator is None:
+            return None
+        try:
+            return estimator(connection, table)
+        except sa.exc.DBAPIError:
+            return None
+
+    def get_cache_prefix(self, model_name):
+        """Returns the url of the database the model is stored in,
+        without its password, and the module of the model class.
+        """
+        prefix = self._cache_prefixes.get(model_name)
+        if prefix is None:
+            model_class = self.model_classes[model_name]
+            url = self.db_session.get_bind(
+                sa.orm.class_mapper(model_class)).url
+            url = sa.engine.url.URL(url.drivername, url.username, None,
+                                    url.host, url.port, url.database)
+            prefix = self._cache_prefixes[model_name] = u'%s|%s' % (
+                url, model_class.__module__)
+        return prefix
+
+    def get_read_timeout(self, model_name, operation):
+        """Returns the time budget in seconds for an operation of the
+        list view on a model, or None if it has none. Budgets set for
+        the (model name, operation) pair take precedence over the ones
+        set for the model name, which take precedence over the ones
+        set for the operation.
+        """
+        for key in ((model_name, operation), model_name, operation):
+            if key in self.read_timeouts:
+                return self.read_timeouts[key]
+        return self.read_timeout
+
     def get_model_form(self, model_name):
         """Returns a form, given a model name."""
         return self.form_dict[model_name]
@@ -150,21 +288,546 @@ class SQLAlchemyDatastore(AdminDatastore):
 
     def save_model(self, model_instance):
         """Persists a model instance to the datastore. Note: this
-        could be called when a model instance is added or edited.
+        could be called when a model instance is added or edited. If
+        an already persisted model instance has not been modified,
+        nothing is written and the session is not committed.
         """
+        if has_identity(model_instance) and \
+               not self.db_session.is_modified(model_instance):
+            return
         self.db_session.add(model_instance)
         self.db_session.commit()
 
+    def save_models(self, model_instances, batch_size=100):
+        """Persists an iterable of model instances, flushing them to
+        the database `batch_size` at a time and committing once at the
+        end. Returns a list of (model_instance, exception) tuples for
+        the instances that could not be saved.
+
+        If flushing a batch fails, the instances flushed so far are
+        committed and the instances of the failing batch are then
+        saved one at a time, so that only the offending instances are
+        left out. The call is therefore not atomic: once a batch has
+        failed, the instances saved before it stay committed even if
+        the call later raises, and the returned failures are the only
+        instances that were not saved. Wrap the call in your own
+        transaction handling if the instances must be saved all or
+        nothing.
+
+        The cached values of the models of the instances are
+        invalidated once the instances are committed.
+        """
+        model_instances = list(model_instances)
+        try:
+            return self._save_models(model_instances, batch_size)
+        finally:
+            self._invalidate_cache(model_instances)
+
+    def _save_models(self, model_instances, batch_size):
+        flushed = []
+        failed = []
+        for start in xrange(0, len(model_instances), batch_size):
+            batch = [(model_instance, _snapshot(model_instance))
+                     for model_instance
+                     in model_instances[start:start + batch_size]]
+            try:
+                self.db_session.add_all(
+                    [model_instance for model_instance, snapshot in batch])
+                self.db_session.flush()
+                flushed.extend(batch)
+            except sa.exc.SQLAlchemyError:
+                # rolling back discards the changes flushed so far
+                # along with the failed batch, so they are restored
+                # from their snapshots and committed before the failed
+                # batch is retried an instance at a time
+                self.db_session.rollback()
+                self._flush_snapshots(flushed)
+                self.db_session.commit()
+                flushed = []
+                for model_instance, snapshot in batch:
+                    try:
+                        self._flush_snapshots([(model_instance, snapshot)])
+                        self.db_session.commit()
+                    except sa.exc.SQLAlchemyError as e:
+                        self.db_session.rollback()
+                        failed.append((model_instance, e))
+        self.db_session.commit()
+        return failed
+
+    def _flush_snapshots(self, snapshots):
+        """Restores model instances from (model_instance, snapshot)
+        tuples, adds them to the session and flushes.
+        """
+        for model_instance, snapshot in snapshots:
+            for key, value in snapshot.iteritems():
+                setattr(model_instance, key, value)
+        self.db_session.add_all(
+            [model_instance for model_instance, snapshot in snapshots])
+        self.db_session.flush()
+
+    def _timed_count(self, model_name, model_instances):
+        """Counts the model instances within the count budget of the
+        model. Returns None if the count was cancelled, in which case
+        the model isn't counted again for a while; see
+        :meth:`_count_timed_out`.
+        """
+        timeout = self.get_read_timeout(model_name, 'count')
+        try:
+            with _statement_deadline(self.db_session,
+                                     self.model_classes[model_name],
+                                     _deadline(timeout)):
+                return model_instances.count()
+        except _ReadTimeout:
+            self.cache.set(self.get_cache_namespace(model_name),
+                           'count_timed_out', True,
+                           timeout=_COUNT_TIMED_OUT_TIMEOUT)
+            return None
+
+    def _count_timed_out(self, model_name):
+        """Returns True if counting the model instances ran over its
+        budget in the last minute, as remembered by the cache.
+        """
+        cache = self.cache
+        namespace = self.get_cache_namespace(model_name)
+        return cache.lookup(namespace, 'count_timed_out',
+                            cache.generation(namespace)) is not None
+
+    def _get_estimated_count(self, model_name):
+        estimate = self.cache.get_or_set(
+            self.get_cache_namespace(model_name), 'estimated_count',
+            lambda: self.estimate_count(model_name))
+        if estimate is None or estimate <= 0:
+            return None
+        return estimate
+
+    def _listen_for_queries(self):
+        """Reports the statements executed by the engines the session
+        is bound to, to the query and plan captures of
+        :mod:`flask.ext.admin.util`. Returns False if the engines
+        can't be found yet, like for Flask-SQLAlchemy sessions outside
+        of an application context.
+        """
+        try:
+            binds = set()
+            if self.db_session.bind is not None:
+                binds.add(self.db_session.bind)
+            for model_class in self.model_classes.values():
+                binds.add(self.db_session.get_bind(
+                    sa.orm.class_mapper(model_class)))
+        except Exception:
+            # Flask-SQLAlchemy sessions raise various errors when
+            # they aren't usable in the current context
+            return False
+        for bind in binds:
+            _listen_for_queries(bind.engine)
+        return True
+
+    def _paginate_with_lookahead(self, model_name, model_instances, page,
+                                 per_page, total=None, warning=None):
+        """Returns a pagination for when the model instances couldn't
+        be counted exactly; `total` is either None or an estimate. One
+        more instance than fits on the page is fetched to tell whether
+        there is a next page, so the page isn't streamed.
+        """
+        pagination = util.Pagination(page, per_page, total, [],
+                                     estimated=total is not None,
+                                     warning=warning)
+        query = model_instances.limit(per_page + 1).offset(
+            (page - 1) * per_page)
+        timeout = self.get_read_timeout(model_name, 'list')
+        try:
+            with _statement_deadline(self.db_session,
+                                     self.model_classes[model_name],
+                                     _deadline(timeout)):
+                items = query.all()
+        except _ReadTimeout:
+            pagination.warning = _PARTIAL_PAGE_WARNING
+            return pagination
+        pagination.items = items[:per_page]
+        pagination.has_more = len(items) > per_page
+        return pagination
+
     def update_from_form(self, model_instance, form):
         """Returns a model instance whose values have been updated
-        with the values from a given form.
+        with the values from a given form. Only the fields whose data
+        differs from the current value on the model instance are
+        populated.
         """
         for name, field in form._fields.iteritems():
-            field.populate_obj(model_instance, name)
+            if _field_changed(model_instance, name, field):
+                field.populate_obj(model_instance, name)
 
         return model_instance
 
 
+# number of rows fetched at a time when streaming list pages
+_STREAM_BATCH_SIZE = 100
+
+# seconds for which a model whose count ran over its budget isn't
+# counted again
+_COUNT_TIMED_OUT_TIMEOUT = 60
+
+# number of SQLite virtual machine instructions between checks of the
+# read deadline
+_SQLITE_PROGRESS_STEPS = 1000
+
+# the SQLSTATE of statements cancelled by PostgreSQL's statement_timeout
+_PG_QUERY_CANCELED = '57014'
+
+_NO_COUNT_WARNING = (u'Counting the rows took too long, so the total '
+                     u'number of pages is unknown.')
+_ESTIMATED_COUNT_WARNING = (u'Counting the rows took too long, so the '
+                            u'number of pages is estimated.')
+_PARTIAL_PAGE_WARNING = (u'Loading this page took too long, so it is '
+                         u'incomplete.')
+
+
+def _estimate_sqlite_rows(connection, table):
+    """Reads the row count of a table from the statistics gathered by
+    ANALYZE. Each index of the table has its own line, which starts
+    with the number of rows of the table.
+    """
+    stat_table = 'sqlite_stat1'
+    if table.schema:
+        stat_table = '"%s".%s' % (table.schema, stat_table)
+    estimates = []
+    for stat, in connection.execute(
+            sa.text('SELECT stat FROM %s WHERE tbl = :table' % stat_table),
+            table=table.name):
+        try:
+            estimates.append(int(stat.split()[0]))
+        except (IndexError, ValueError):
+            continue
+    return max(estimates) if estimates else None
+
+
+def _estimate_postgresql_rows(connection, table):
+    estimate = connection.execute(sa.text(
+        'SELECT c.reltuples FROM pg_class c '
+        'JOIN pg_namespace n ON n.oid = c.relnamespace '
+        'WHERE c.relname = :table '
+        'AND n.nspname = COALESCE(:schema, current_schema())'),
+        table=table.name, schema=table.schema).scalar()
+    # tables that were never analyzed have no estimate
+    if estimate is None or estimate < 0:
+        return None
+    return int(estimate)
+
+
+def _estimate_mysql_rows(connection, table):
+    estimate = connection.execute(sa.text(
+        'SELECT table_rows FROM information_schema.tables '
+        'WHERE table_name = :table '
+        'AND table_schema = COALESCE(:schema, DATABASE())'),
+        table=table.name, schema=table.schema).scalar()
+    if estimate is None:
+        return None
+    return int(estimate)
+
+
+# the functions that read the estimated row count of a table, by
+# dialect name
+_ROW_ESTIMATORS = {
+    'sqlite': _estimate_sqlite_rows,
+    'postgresql': _estimate_postgresql_rows,
+    'mysql': _estimate_mysql_rows,
+}
+
+
+class _ReadTimeout(Exception):
+    """Raised when a query is cancelled for running over its budget."""
+
+
+def _deadline(timeout):
+    """Returns the time a read started now with a budget of `timeout`
+    seconds has to finish by, or None if `timeout` is None.
+    """
+    if timeout is None:
+        return None
+    return time.time() + timeout
+
+
+@contextmanager
+def _statement_deadline(db_session, model_class, deadline):
+    """Cancels the statements executed in the session for a model
+    class while the context is active once `deadline` has passed,
+    raising a :class:`_ReadTimeout`. Does nothing if `deadline` is
+    None or the database isn't SQLite or PostgreSQL.
+    """
+    if deadline is None:
+        yield
+        return
+    # the model may be bound to an engine of its own
+    connection = db_session.connection(
+        mapper=sa.orm.class_mapper(model_class))
+    dialect_name = connection.dialect.name
+    if dialect_name == 'sqlite':
+        # the progress handler interrupts the statement as soon as it
+        # returns a true value
+        dbapi_connection = connection.connection.connection
+        dbapi_connection.set_progress_handler(
+            lambda: time.time() >= deadline, _SQLITE_PROGRESS_STEPS)
+        try:
+            yield
+        except sa.exc.OperationalError:
+            if time.time() >= deadline:
+                raise _ReadTimeout()
+            raise
+        finally:
+            dbapi_connection.set_progress_handler(None, 0)
+    elif dialect_name == 'postgresql':
+        remaining = max(1, int((deadline - time.time()) * 1000))
+        connection.execute('SET LOCAL statement_timeout = %d' % remaining)
+        rolled_back = False
+        try:
+            yield
+        except sa.exc.OperationalError as e:
+            if getattr(e.orig, 'pgcode', None) == _PG_QUERY_CANCELED:
+                # the cancelled statement aborted the transaction
+                db_session.rollback()
+                rolled_back = True
+                raise _ReadTimeout()
+            raise
+        finally:
+            # the short timeout mustn't outlive the read, e.g. for a
+            # save later in the same transaction; after a rollback it
+            # is gone already
+            if not rolled_back and connection.in_transaction():
+                try:
+                    connection.execute(
+                        'SET LOCAL statement_timeout TO DEFAULT')
+                except sa.exc.DBAPIError:
+                    # the transaction was aborted by the error that is
+                    # being raised
+                    pass
+    else:
+        yield
+
+
+def _iter_before_deadline(db_session, model_class, items, deadline,
+                          pagination):
+    """Yields the items of a streamed page until `deadline`. If the
+    deadline passes first, the page is cut short and a warning is set
+    on the pagination.
+    """
+    # the query is executed when the iterator is created. PostgreSQL
+    # cursors fetch all the rows then, so only that is timed; SQLite
+    # runs the statement as the rows are fetched, so each fetch is
+    try:
+        with _statement_deadline(db_session, model_class, deadline):
+            iterator = iter(items)
+            item = next(iterator, _end)
+    except _ReadTimeout:
+        pagination.warning = _PARTIAL_PAGE_WARNING
+        return
+    fetch_deadline = None
+    connection = db_session.connection(
+        mapper=sa.orm.class_mapper(model_class))
+    if connection.dialect.name == 'sqlite':
+        fetch_deadline = deadline
+    while item is not _end:
+        yield item
+        try:
+            with _statement_deadline(db_session, model_class,
+                                     fetch_deadline):
+                item = next(iterator, _end)
+        except _ReadTimeout:
+            pagination.warning = _PARTIAL_PAGE_WARNING
+            return
+
+
+# sentinel for the end of an iterator
+_end = object()
+
+# the engines whose statements are reported to the captures
+_listened_engines = weakref.WeakKeyDictionary()
+_listened_engines_lock = threading.Lock()
+
+
+def _listen_for_queries(engine):
+    """Reports the statements executed by `engine` to the query
+    captures of :func:`flask.ext.admin.util.capture_queries`.
+    """
+    _listened_engines_lock.acquire()
+    try:
+        if engine not in _listened_engines:
+            sa.event.listen(engine, 'before_cursor_execute',
+                            _record_statement)
+            _listened_engines[engine] = True
+    finally:
+        _listened_engines_lock.release()
+
+
+def _record_statement(conn, cursor, statement, parameters, context,
+                      executemany):
+    if util.capturing_queries():
+        util.record_query(statement)
+    if util.capturing_plans() and not executemany:
+        _record_plan(conn, statement, parameters, context)
+
+
+# the statements that explain a query, for the dialects whose plans
+# can be read
+_EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+# the savepoints that explains run in, for the dialects where a
+# failed statement aborts the transaction the explained query runs in
+_EXPLAIN_SAVEPOINTS = {
+    'postgresql': 'flask_admin_explain',
+}
+
+# plan lines that mean a whole table is read, with the table name as
+# the first group
+_FULL_SCAN_RES = {
+    'sqlite': re.compile(r'^SCAN (?:TABLE )?(\w+)\b(?! USING)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+# plan lines that mean rows are sorted without an index
+_SORT_RES = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+    'postgresql': re.compile(r'^\s*(?:->\s*)?Sort\b'),
+}
+
+
+def _record_plan(conn, statement, parameters, context):
+    """Explains a SELECT statement and reports its plan, along with the
+    indexes that would serve its filters and sorting, to the plan
+    captures of :func:`flask.ext.admin.util.capture_plans`. On
+    databases where an error aborts the transaction, the explain runs
+    in a savepoint that is rolled back if it fails, so the explained
+    query is never affected.
+    """
+    dialect_name = conn.dialect.name
+    if dialect_name not in _EXPLAIN_PREFIXES or \
+            not statement.lstrip().upper().startswith('SELECT'):
+        return
+    savepoint = _EXPLAIN_SAVEPOINTS.get(dialect_name)
+    explain_cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            explain_cursor.execute('SAVEPOINT %s' % savepoint)
+        try:
+            explain_cursor.execute(
+                _EXPLAIN_PREFIXES[dialect_name] + statement, parameters)
+            plan = [unicode(row[-1]) for row in explain_cursor.fetchall()]
+        except Exception:
+            if savepoint:
+                explain_cursor.execute('ROLLBACK TO SAVEPOINT %s' % savepoint)
+            return
+        if savepoint:
+            explain_cursor.execute('RELEASE SAVEPOINT %s' % savepoint)
+    except Exception:
+        return
+    finally:
+        explain_cursor.close()
+
+    scanned_tables = set()
+    for line in plan:
+        match = _FULL_SCAN_RES[dialect_name].search(line)
+        if match:
+            scanned_tables.add(match.group(1))
+    unindexed_sort = any(_SORT_RES[dialect_name].search(line)
+                         for line in plan)
+
+    compiled = getattr(context, 'compiled', None)
+    select = getattr(compiled, 'statement', None)
+    indexes = []
+    if isinstance(select, sa.sql.expression.Select):
+        indexes = _suggest_indexes(select, scanned_tables, unindexed_sort)
+    util.record_plan(statement, plan, full_scan=bool(scanned_tables),
+                     indexes=indexes)
+
+
+def _suggest_indexes(select, scanned_tables, unindexed_sort):
+    """Returns CREATE INDEX statements for indexes that would serve
+    the filters and the sorting of a select, for the tables that are
+    scanned or sorted without an index. Tables that already have an
+    index starting with the first suggested column are left out.
+    """
+    columns_by_table = {}
+
+    def add_column(column):
+        table = getattr(column, 'table', None)
+        if isinstance(table, sa.Table):
+            columns = columns_by_table.setdefault(table, [])
+            if column not in columns:
+                columns.append(column)
+
+    # columns compared to a value are filters
+    if select._whereclause is not None:
+        for element in sa.sql.visitors.iterate(select._whereclause, {}):
+            if isinstance(element, sa.sql.expression._BinaryExpression):
+                sides = (element.left, element.right)
+                for column, other in (sides, sides[::-1]):
+                    if isinstance(column, sa.Column) and isinstance(
+                            other, sa.sql.expression._BindParamClause):
+                        add_column(column)
+    if unindexed_sort:
+        for clause in select._order_by_clause.clauses:
+            for element in sa.sql.visitors.iterate(clause, {}):
+                if isinstance(element, sa.Column):
+                    add_column(element)
+
+    statements = []
+    for table, columns in columns_by_table.items():
+        if table.name not in scanned_tables and not unindexed_sort:
+            continue
+        if _has_leading_index(table, columns[0]):
+            continue
+        statements.append('CREATE INDEX ix_%s_%s ON %s (%s)' % (
+            table.name, '_'.join([column.name for column in columns]),
+            table.name, ', '.join([column.name for column in columns])))
+    return sorted(statements)
+
+
+def _has_leading_index(table, column):
+    """Returns True if an index, primary key or unique constraint of
+    table starts with column.
+    """
+    column_lists = [list(table.primary_key.columns)]
+    column_lists.extend([list(index.columns) for index in table.indexes])
+    column_lists.extend(
+        [list(constraint.columns) for constraint in table.constraints
+         if isinstance(constraint, sa.UniqueConstraint)])
+    if column.unique or column.index:
+        return True
+    return any(columns and columns[0] is column for columns in column_lists)
+
+
+def _snapshot(model_instance):
+    """Returns a dict of the currently loaded mapped attribute values
+    of a model instance.
+    """
+    instance_dict = model_instance.__dict__
+    snapshot = {}
+    for prop in sa.orm.object_mapper(model_instance).iterate_properties:
+        if prop.key not in instance_dict:
+            continue
+        value = instance_dict[prop.key]
+        # collections are mutated in place, so keep a plain copy
+        for collection_type in (list, set, dict):
+            if isinstance(value, collection_type):
+                value = collection_type(value)
+                break
+        snapshot[prop.key] = value
+    return snapshot
+
+
+def _field_changed(model_instance, name, field):
+    """Returns True if the data of a form field differs from the
+    value of the corresponding attribute of a model instance.
+    """
+    try:
+        current_value = getattr(model_instance, name)
+    except AttributeError:
+        return True
+    return current_value != field.data
+
+
 def _form_for_model(model_class, db_session, exclude=None, exclude_pk=True):
     """Return a form for a given model. This will be a form generated
     by wtforms.ext.sqlalchemy.model_form, but decorated with a
@@ -195,6 +858,79 @@ def _form_for_model(model_class, db_session, exclude=None, exclude_pk=True):
     return form
 
 
+def _cached_form_for_model(model_class, db_session, form_cache,
+                           exclude_pk=True):
+    """Returns the form for a model from `form_cache`, generating it
+    with _form_for_model() if it isn't cached. If `form_cache` is None
+    the form is always generated.
+    """
+    if form_cache is None:
+        return _form_for_model(model_class, db_session, exclude_pk=exclude_pk)
+
+    def create_form():
+        return _form_for_model(model_class, db_session, exclude_pk=exclude_pk)
+
+    def persistent_load(pid):
+        kind, module_name, class_name = pid
+        return _query_factory_for(
+            getattr(sys.modules[module_name], class_name), db_session)
+
+    return form_cache.get_form(
+        'sqlalchemy:%s.%s' % (model_class.__module__, model_class.__name__),
+        _model_metadata(model_class, exclude_pk), create_form,
+        persistent_id=_form_persistent_id, persistent_load=persistent_load)
+
+
+def _model_metadata(model_class, exclude_pk):
+    """Returns a description of the mapped properties of a model that
+    its generated form depends on, for keying the form cache.
+    """
+    properties = []
+    for prop in sa.orm.class_mapper(model_class).iterate_properties:
+        if isinstance(prop, sa.orm.properties.ColumnProperty):
+            properties.append((
+                'column', prop.key,
+                [(column.name, repr(column.type), column.nullable,
+                  column.primary_key, _default_metadata(column.default),
+                  sorted([foreign_key.target_fullname
+                          for foreign_key in column.foreign_keys]))
+                 for column in prop.columns]))
+        elif isinstance(prop, sa.orm.properties.RelationshipProperty):
+            foreign_model = prop.mapper.class_
+            properties.append((
+                'relationship', prop.key, prop.direction.name,
+                foreign_model.__module__, foreign_model.__name__,
+                [(local.name, local.nullable)
+                 for local, remote in prop.local_remote_pairs]))
+        else:
+            properties.append((type(prop).__name__, prop.key))
+    return (model_class.__module__, model_class.__name__, exclude_pk,
+            properties)
+
+
+def _default_metadata(default):
+    if default is None:
+        return None
+    if getattr(default, 'is_scalar', False):
+        return repr(default.arg)
+    return type(default.arg).__name__
+
+
+def _form_persistent_id(obj):
+    """Pickles the query factories of relationship fields as a
+    reference to their model, and refuses to pickle SQLAlchemy schema
+    objects like column defaults, so forms that hold them aren't
+    cached.
+    """
+    if isinstance(obj, types.FunctionType) and \
+            hasattr(obj, 'query_model_class'):
+        return ('query_factory', obj.query_model_class.__module__,
+                obj.query_model_class.__name__)
+    if isinstance(obj, sa.schema.SchemaItem):
+        raise pickle.PicklingError('%r can not be cached' % (obj,))
+    return None
+
+
 def _get_pk_names(model):
     """Return the primary key attribute names for a given model
     (either instance or class).
@@ -214,17 +950,20 @@ def _query_factory_for(model_class, db_session):
     def query_factory():
         return sorted(db_session.query(model_class).all(), key=repr)
 
+    query_factory.query_model_class = model_class
     return query_factory
 
 
 class AdminConverter(ModelConverter):
     """Subclass of the wtforms sqlalchemy Model Converter that handles
     relationship properties and uses custom widgets for date and
-    datetime objects.
+    datetime objects. The converter methods are looked up once per
+    converter class rather than every time a converter is created.
     """
-    def __init__(self, db_session, *args, **kwargs):
+    def __init__(self, db_session, extra_converters=None):
         self.db_session = db_session
-        super(AdminConverter, self).__init__(*args, **kwargs)
+        self.use_mro = True
+        self.converters = util.bind_converters(self, extra_converters)
 
     def convert(self, model, mapper, prop, field_args):
         if not isinstance(prop, sa.orm.properties.ColumnProperty) and \
@@ -312,7 +1051,7 @@ class AdminConverter(ModelConverter):
 
     @converts('Date')
     def conv_Date(self, field_args, **extra):
-        field_args['widget'] = DatePickerWidget()
+        field_args['widget'] = admin_wtf.DatePickerWidget()
         return wtf_fields.DateField(**field_args)
 
     @converts('DateTime')
@@ -322,10 +1061,10 @@ class AdminConverter(ModelConverter):
         if hasattr(field_args['default'], 'arg'):
             if inspect.isfunction(field_args['default'].arg):
                 return None
-        field_args['widget'] = DateTimePickerWidget()
+        field_args['widget'] = admin_wtf.DateTimePickerWidget()
         return wtf_fields.DateTimeField(**field_args)
 
     @converts('Time')
     def conv_Time(self, field_args, **extra):
-        field_args['widget'] = TimePickerWidget()
-        return TimeField(**field_args)
+        field_args['widget'] = admin_wtf.TimePickerWidget()
+        return admin_wtf.TimeField(**field_args)
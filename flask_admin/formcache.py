@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.formcache
+    ~~~~~~~~~~~~~~
+
+    An on-disk cache for the forms that datastores generate from
+    models. Generating a form means introspecting the model and
+    converting each of its fields, which every worker process would
+    otherwise redo on startup. The cache keeps the resulting form
+    fields along with a hash of the model metadata they were generated
+    from, so forms are generated again whenever the models change.
+
+    Forms that hold values the cache can't serialize are simply
+    generated every time.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import cPickle as pickle
+from cStringIO import StringIO
+import hashlib
+import os
+import tempfile
+import threading
+
+import wtforms
+from wtforms.fields.core import UnboundField
+
+
+# bump this whenever the forms generated by the datastores change
+# without the model metadata changing, to invalidate existing caches
+FORM_CACHE_VERSION = 1
+
+# errors that mean a cached form can't be loaded, e.g. because a
+# class it refers to was renamed
+_LOAD_ERRORS = (pickle.UnpicklingError, AttributeError, EOFError,
+                ImportError, IndexError, KeyError, TypeError, ValueError)
+
+
+class FormCache(object):
+    """Caches generated forms in the file at `path`, which is created
+    if it doesn't exist. Pass an instance to the `form_cache`
+    parameter of a datastore; several datastores can share one
+    cache.
+
+    The cache is read when first used and written by :meth:`save`,
+    which the datastores call once they have generated their
+    forms. The file is replaced atomically, so processes can share
+    it. Cached forms are unpickled, so the file must not be writable
+    by anyone who shouldn't be able to run code in the application.
+
+    `hits` and `misses` count the forms loaded from the cache and the
+    forms that had to be generated.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def get_form(self, name, metadata, create_form, persistent_id=None,
+                 persistent_load=None):
+        """Returns the form cached under `name`, if it was cached for
+        the same `metadata`. Otherwise `create_form` is called to
+        generate the form and the result is cached.
+
+        `metadata` should describe everything the generated form
+        depends on; it is hashed using its repr(), so it should be
+        made of builtin types. `persistent_id` and `persistent_load`
+        are used as the pickle functions of the same names, to store
+        references to values that can't be pickled directly.
+        """
+        key = _metadata_key(metadata)
+        entry = self._load_entries().get(name)
+        if entry is not None and entry[0] == key:
+            try:
+                form = _form_from_spec(_loads(entry[1], persistent_load))
+            except _LOAD_ERRORS:
+                pass
+            else:
+                self.hits += 1
+                return form
+
+        self.misses += 1
+        form = create_form()
+        try:
+            data = _dumps(_spec_from_form(form), persistent_id)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            data = None
+
+        self._lock.acquire()
+        try:
+            if data is None:
+                self._entries.pop(name, None)
+            else:
+                self._entries[name] = (key, data)
+            self._dirty = True
+        finally:
+            self._lock.release()
+        return form
+
+    def save(self):
+        """Writes the cache file, if any form had to be generated."""
+        self._lock.acquire()
+        try:
+            if not self._dirty:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            try:
+                f = os.fdopen(fd, 'wb')
+                try:
+                    pickle.dump(self._entries, f, 2)
+                finally:
+                    f.close()
+                os.rename(tmp_path, self.path)
+            except:
+                os.remove(tmp_path)
+                raise
+            self._dirty = False
+        finally:
+            self._lock.release()
+
+    def _load_entries(self):
+        if self._entries is None:
+            entries = {}
+            if os.path.exists(self.path):
+                f = open(self.path, 'rb')
+                try:
+                    entries = pickle.load(f)
+                except _LOAD_ERRORS:
+                    entries = {}
+                finally:
+                    f.close()
+            self._entries = entries
+        return self._entries
+
+
+def _metadata_key(metadata):
+    return hashlib.sha1(repr((
+        FORM_CACHE_VERSION, wtforms.__version__, metadata))).hexdigest()
+
+
+def _spec_from_form(form_class):
+    """Returns a picklable description of a form class: its name,
+    base classes and the field class, arguments and keyword arguments
+    of each of its fields, in order.
+    """
+    fields = []
+    for name in dir(form_class):
+        value = getattr(form_class, name)
+        if isinstance(value, UnboundField):
+            fields.append((value.creation_counter, name, value.field_class,
+                           value.args, value.kwargs))
+    fields.sort()
+    return (form_class.__name__, form_class.__bases__,
+            [field[1:] for field in fields])
+
+
+def _form_from_spec(spec):
+    name, bases, fields = spec
+    field_dict = {}
+    for field_name, field_class, args, kwargs in fields:
+        field_dict[field_name] = field_class(*args, **kwargs)
+    return type(name, bases, field_dict)
+
+
+def _dumps(value, persistent_id=None):
+    f = StringIO()
+    pickler = pickle.Pickler(f, 2)
+    if persistent_id is not None:
+        pickler.persistent_id = persistent_id
+    pickler.dump(value)
+    return f.getvalue()
+
+
+def _loads(data, persistent_load=None):
+    unpickler = pickle.Unpickler(StringIO(data))
+    if persistent_load is not None:
+        unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.metrics
+    ~~~~~~~~~~~~~~
+
+    Collects metrics about the admin views and exposes them in the
+    Prometheus text format. Pass a :class:`Metrics` to the `metrics`
+    parameter of :func:`~flask.ext.admin.create_admin_blueprint` to
+    collect:
+
+    ``flask_admin_request_duration_seconds``
+        a histogram of the time taken by the admin views, labelled with
+        the `endpoint` and the `model`
+
+    ``flask_admin_datastore_calls_total``
+        the number of datastore calls made by the views, labelled with
+        the `operation` and the `model`
+
+    ``flask_admin_rows_rendered_total``
+        the number of rows rendered by the list views, by `model`
+
+    ``flask_admin_cache_lookups_total`` and ``flask_admin_cache_hit_ratio``
+        the lookups made in the datastore cache, labelled with their
+        `result`, and the ratio of them that were hits
+
+    ``flask_admin_admission_*``
+        the heavy operations running and waiting for a slot, the time
+        they waited and the ones that were rejected, if the admin uses
+        an :class:`~flask.ext.admin.admission.AdmissionController`
+
+    The metrics are served by the `/metrics` view of the admin.
+
+    Every thread records into its own aggregate, so recording never
+    waits on a lock; the aggregates are only merged when the metrics
+    are read. The aggregates of threads that have exited are folded
+    into a total for the process, so servers that start a thread per
+    request don't pile them up.
+
+    With a pre-fork server, set `multiprocess_dir` to a directory
+    shared by the worker processes. Each process then writes its
+    metrics to a file in it every `flush_interval` seconds, named
+    after its pid and a token of its own, so that a worker that gets
+    the pid of a dead one doesn't overwrite its file. `/metrics` adds
+    up the files of all the processes. The files of processes that
+    have exited are merged into a totals file, so that counters don't
+    go backwards; empty the directory when the server is restarted.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import errno
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from flask.ext.admin.slowlog import OPERATIONS
+
+
+#: the upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+
+#: the prefix of the names of the exposed metrics
+METRIC_PREFIX = 'flask_admin_'
+
+# the type and help text of each metric
+_METRIC_INFO = {
+    'request_duration_seconds': (
+        'histogram', 'Time taken by the admin views.'),
+    'datastore_calls_total': (
+        'counter', 'Datastore calls made by the admin views.'),
+    'rows_rendered_total': (
+        'counter', 'Rows rendered by the list views.'),
+    'cache_lookups_total': (
+        'counter', 'Lookups made in the datastore cache.'),
+    'cache_hit_ratio': (
+        'gauge', 'Ratio of the datastore cache lookups that were hits.'),
+    'admission_running': (
+        'gauge', 'Heavy admin operations running.'),
+    'admission_queue_depth': (
+        'gauge', 'Heavy admin operations waiting for a slot.'),
+    'admission_wait_seconds': (
+        'histogram', 'Time heavy admin operations waited for a slot.'),
+    'admission_rejections_total': (
+        'counter', 'Heavy admin operations rejected for lack of a slot.'),
+}
+
+
+class Metrics(object):
+    """Collects the admin metrics of this process, and of the other
+    processes writing to `multiprocess_dir` if it is set. `buckets`
+    are the upper bounds of the latency histogram buckets.
+    """
+    def __init__(self, multiprocess_dir=None, buckets=DEFAULT_BUCKETS,
+                 flush_interval=5):
+        self.multiprocess_dir = multiprocess_dir
+        self.buckets = tuple(sorted(buckets))
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._aggregates = []
+        self._retired = _Aggregate(os.getpid())
+        self._process_token = None
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._last_flush = 0
+        if multiprocess_dir and not os.path.isdir(multiprocess_dir):
+            os.makedirs(multiprocess_dir)
+
+    def inc(self, name, labels=(), value=1):
+        """Increments a counter. `labels` is a tuple of (label name,
+        value) pairs.
+        """
+        counters = self._get_aggregate().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """Records a value in a histogram."""
+        histograms = self._get_aggregate().histograms
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [[0] * (len(self.buckets) + 1),
+                                           0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        histogram[0][i] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def add_collector(self, collector):
+        """Adds a function that is called whenever the metrics are read
+        and returns (name, labels, value) tuples, for counters that
+        are kept elsewhere. The values are the totals of this process.
+        """
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        """Returns the metrics of this process, as a dict with the
+        `counters` and `histograms` keyed by (name, labels).
+        """
+        counters = {}
+        histograms = {}
+        for aggregate in self._current_aggregates():
+            # copy the dicts, since their threads keep recording
+            for key, value in aggregate.counters.items():
+                counters[key] = counters.get(key, 0) + value
+            for key, histogram in aggregate.histograms.items():
+                _merge_histogram(histograms, key, histogram)
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                key = (name, labels)
+                counters[key] = counters.get(key, 0) + value
+        return dict(counters=counters, histograms=histograms)
+
+    def flush(self):
+        """Writes the metrics of this process to `multiprocess_dir`."""
+        if not self.multiprocess_dir:
+            return
+        snapshot = self.snapshot()
+        _write_json(self.multiprocess_dir, self._process_path(),
+                    dict(buckets=self.buckets, **_metrics_to_json(
+                        snapshot['counters'], snapshot['histograms'])))
+        self._last_flush = time.time()
+
+    def maybe_flush(self):
+        """Calls :meth:`flush` if the metrics weren't written in the
+        last `flush_interval` seconds.
+        """
+        if self.multiprocess_dir and \
+                time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def collect(self):
+        """Returns the metrics of all the processes, in the format of
+        :meth:`snapshot`.
+        """
+        if not self.multiprocess_dir:
+            return self.snapshot()
+
+        self.flush()
+        paths_by_pid = {}
+        for filename in os.listdir(self.multiprocess_dir):
+            match = _PROCESS_FILENAME_RE.match(filename)
+            if match:
+                paths_by_pid.setdefault(int(match.group(1)), []).append(
+                    os.path.join(self.multiprocess_dir, filename))
+        self._merge_dead_processes(paths_by_pid)
+
+        counters = {}
+        histograms = {}
+        paths = [os.path.join(self.multiprocess_dir, _TOTALS_FILENAME)]
+        merged = set()
+        totals = _read_metrics_file(paths[0])
+        if totals is not None:
+            merged = set(totals.get('merged', ()))
+        for pid_paths in paths_by_pid.values():
+            paths.extend([path for path in pid_paths
+                          if os.path.basename(path) not in merged])
+        for path in paths:
+            data = _read_metrics_file(path)
+            if data is None or \
+                    tuple(data.get('buckets', ())) != self.buckets:
+                continue
+            _add_metrics_data(counters, histograms, data)
+        return dict(counters=counters, histograms=histograms)
+
+    def render(self):
+        """Returns the metrics of all the processes in the Prometheus
+        text exposition format.
+        """
+        metrics = self.collect()
+        samples = {}
+        for (name, labels), value in metrics['counters'].items():
+            samples.setdefault(name, []).append((name, labels, value))
+        for (name, labels), (counts, total, count) in \
+                metrics['histograms'].items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                if bound != '+Inf':
+                    bound = repr(float(bound))
+                samples.setdefault(name, []).append(
+                    (name + '_bucket', labels + (('le', bound),),
+                     cumulative))
+            samples[name].append((name + '_sum', labels, total))
+            samples[name].append((name + '_count', labels, count))
+
+        lookups = dict((dict(labels).get('result'), value)
+                       for (name, labels), value
+                       in metrics['counters'].items()
+                       if name == 'cache_lookups_total')
+        if lookups:
+            total_lookups = sum(lookups.values())
+            samples['cache_hit_ratio'] = [(
+                'cache_hit_ratio', (),
+                lookups.get('hit', 0) / float(total_lookups)
+                if total_lookups else 0.0)]
+
+        lines = []
+        for name in sorted(samples):
+            metric_type, help_text = _METRIC_INFO.get(
+                name, ('untyped', name))
+            lines.append('# HELP %s%s %s' % (METRIC_PREFIX, name, help_text))
+            lines.append('# TYPE %s%s %s' % (METRIC_PREFIX, name,
+                                             metric_type))
+            for sample_name, labels, value in sorted(samples[name]):
+                lines.append('%s%s%s %s' % (
+                    METRIC_PREFIX, sample_name, _format_labels(labels),
+                    _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def counted(self, datastore):
+        """Returns a :class:`CountedDatastore` that counts the calls
+        to `datastore` in these metrics.
+        """
+        return CountedDatastore(datastore, self)
+
+    def _get_aggregate(self):
+        """Returns the aggregate of the current thread. A lock is only
+        taken the first time a thread records something.
+        """
+        aggregate = getattr(self._local, 'aggregate', None)
+        pid = os.getpid()
+        if aggregate is None or aggregate.pid != pid:
+            aggregate = self._local.aggregate = _Aggregate(
+                pid, threading.current_thread())
+            self._lock.acquire()
+            try:
+                self._retire_aggregates()
+                self._aggregates.append(aggregate)
+            finally:
+                self._lock.release()
+        return aggregate
+
+    def _current_aggregates(self):
+        """Returns the aggregates recorded by this process, leaving
+        out the ones inherited from a parent process that forked it.
+        The aggregates of threads that have exited are merged into a
+        single one.
+        """
+        self._lock.acquire()
+        try:
+            self._retire_aggregates()
+            # the retired aggregate is merged into while the lock is
+            # held, so it is copied
+            retired = _Aggregate(self._retired.pid)
+            retired.merge(self._retired)
+            return [retired] + self._aggregates
+        finally:
+            self._lock.release()
+
+    def _retire_aggregates(self):
+        """Folds the aggregates of the threads that have exited into
+        the retired aggregate, and drops the ones inherited from a
+        parent process. Must be called with the lock held.
+        """
+        pid = os.getpid()
+        if self._retired.pid != pid:
+            self._retired = _Aggregate(pid)
+        aggregates = []
+        for aggregate in self._aggregates:
+            if aggregate.pid != pid:
+                continue
+            if aggregate.thread_alive():
+                aggregates.append(aggregate)
+            else:
+                # the thread is gone, so nothing records into its
+                # aggregate anymore
+                self._retired.merge(aggregate)
+        self._aggregates = aggregates
+
+    def _process_path(self):
+        """Returns the path of the metrics file of this process."""
+        pid = os.getpid()
+        if self._process_token is None or self._process_token[0] != pid:
+            self._process_token = (pid, uuid.uuid4().hex)
+        return os.path.join(self.multiprocess_dir, 'metrics-%d-%s.json'
+                            % self._process_token)
+
+    def _merge_dead_processes(self, paths_by_pid):
+        """Merges the files of the processes that have exited into the
+        totals file and removes them. `paths_by_pid` maps pids to the
+        paths of their files. The totals file lists the files merged
+        into it, so that a file is never counted twice, even if
+        removing it failed.
+        """
+        dead_paths = [path for pid, paths in paths_by_pid.items()
+                      if pid != os.getpid() and not _process_alive(pid)
+                      for path in paths]
+        if not dead_paths or fcntl is None:
+            return
+        lock_file = open(os.path.join(self.multiprocess_dir,
+                                      _LOCK_FILENAME), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            totals_path = os.path.join(self.multiprocess_dir,
+                                       _TOTALS_FILENAME)
+            totals = _read_metrics_file(totals_path) or dict(
+                buckets=list(self.buckets), counters=[], histograms=[],
+                merged=[])
+            merged = set(totals.get('merged', ()))
+            counters, histograms = {}, {}
+            _add_metrics_data(counters, histograms, totals)
+            for path in dead_paths:
+                filename = os.path.basename(path)
+                if filename not in merged:
+                    data = _read_metrics_file(path)
+                    if data is None or \
+                            tuple(data.get('buckets', ())) != self.buckets:
+                        continue
+                    _add_metrics_data(counters, histograms, data)
+                    merged.add(filename)
+            _write_json(self.multiprocess_dir, totals_path, dict(
+                buckets=self.buckets, merged=sorted(merged),
+                **_metrics_to_json(counters, histograms)))
+            for path in dead_paths:
+                if os.path.basename(path) in merged:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        finally:
+            lock_file.close()
+
+
+class CountedDatastore(object):
+    """Wraps a datastore, counting the calls to its methods listed in
+    :data:`flask.ext.admin.slowlog.OPERATIONS` in a :class:`Metrics`.
+    Other attributes are looked up on the wrapped datastore.
+    """
+    def __init__(self, datastore, metrics):
+        self.datastore = datastore
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        value = getattr(self.datastore, name)
+        if name not in OPERATIONS:
+            return value
+
+        def counted(*args, **kwargs):
+            # the first argument is either a model name or a model
+            # instance
+            model = args[0] if args else kwargs.get('model_name')
+            if not isinstance(model, basestring):
+                model = type(model).__name__
+            self.metrics.inc('datastore_calls_total',
+                             (('model', model), ('operation', name)))
+            return value(*args, **kwargs)
+        return counted
+
+
+class _Aggregate(object):
+    """The metrics recorded by one thread, or by the threads of a
+    process that have exited if `thread` is None.
+    """
+    def __init__(self, pid, thread=None):
+        self.pid = pid
+        self.counters = {}
+        self.histograms = {}
+        self._thread = None
+        if thread is not None:
+            self._thread = weakref.ref(thread)
+
+    def thread_alive(self):
+        thread = self._thread and self._thread()
+        return thread is not None and thread.is_alive()
+
+    def merge(self, aggregate):
+        for key, value in aggregate.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, histogram in aggregate.histograms.items():
+            _merge_histogram(self.histograms, key, histogram)
+
+
+# the metrics files written by processes, named after their pid and a
+# token; files named after the pid alone were written by older versions
+_PROCESS_FILENAME_RE = re.compile(r'^metrics-(\d+)(?:-\w+)?\.json$')
+
+# the file the metrics of exited processes are merged into, and the
+# file locked while merging
+_TOTALS_FILENAME = 'totals.json'
+_LOCK_FILENAME = 'totals.lock'
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _read_metrics_file(path):
+    """Returns the data of a metrics file, or None if it can't be
+    read.
+    """
+    try:
+        f = open(path)
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return None
+
+
+def _write_json(directory, path, data):
+    """Writes data to a file atomically, through a temporary file in
+    `directory`.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        f = os.fdopen(fd, 'w')
+        try:
+            f.write(json.dumps(data))
+        finally:
+            f.close()
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+def _metrics_to_json(counters, histograms):
+    return dict(
+        counters=[[name, labels, value] for (name, labels), value
+                  in counters.items()],
+        histograms=[[name, labels] + list(histogram)
+                    for (name, labels), histogram in histograms.items()])
+
+
+def _add_metrics_data(counters, histograms, data):
+    """Adds the metrics of a file to `counters` and `histograms`."""
+    for name, labels, value in data['counters']:
+        key = (name, _labels_from_json(labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, counts, total, count in data['histograms']:
+        _merge_histogram(histograms, (name, _labels_from_json(labels)),
+                         [counts, total, count])
+
+
+def _merge_histogram(histograms, key, histogram):
+    counts, total, count = histogram
+    merged = histograms.get(key)
+    if merged is None:
+        histograms[key] = [list(counts), total, count]
+    else:
+        merged[0] = [a + b for a, b in zip(merged[0], counts)]
+        merged[1] += total
+        merged[2] += count
+
+
+def _labels_from_json(labels):
+    return tuple([tuple(label) for label in labels])
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(['%s="%s"' % (name, _escape_label_value(value))
+                              for name, value in labels])
+
+
+def _escape_label_value(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace(
+        '"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
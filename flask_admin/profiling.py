@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.profiling
+    ~~~~~~~~~~~~~~
+
+    Runs single admin requests under cProfile, to find out where a
+    slow page spends its time. Profiling is enabled per blueprint with
+    the `profile_dir` parameter of
+    :func:`~flask.ext.admin.create_admin_blueprint`, and then per app
+    by setting the ``ADMIN_PROFILING`` config value to True. A request
+    is only profiled if it asks for it, with a ``_profile`` query
+    argument or an ``X-Admin-Profile`` header, and only once it has
+    passed the `view_decorator` of the blueprint.
+
+    The stats of each profiled request are written to `profile_dir`
+    under a new profile id, which is sent back in the
+    ``X-Admin-Profile-Id`` header of the response, along with the url
+    of a page that summarizes the stats in ``X-Admin-Profile-Url``.
+    The stats files can also be loaded with :mod:`pstats`.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import cProfile
+import os
+import pstats
+import re
+import sys
+import uuid
+
+from flask import current_app, request
+
+
+#: the app config value that has to be True for requests to be profiled
+PROFILING_CONFIG_KEY = 'ADMIN_PROFILING'
+
+#: the query argument that asks for a request to be profiled
+PROFILE_ARG = '_profile'
+
+#: the header that asks for a request to be profiled
+PROFILE_HEADER = 'X-Admin-Profile'
+
+#: the orders the summary can be sorted in, mapped to the stats they
+#: sort by
+SORT_ORDERS = {
+    'cumulative': 'cumtime',
+    'time': 'tottime',
+    'calls': 'ncalls',
+}
+
+_profile_id_re = re.compile(r'^[0-9a-f]{32}$')
+
+
+def profiling_requested():
+    """Returns True if the current request should be profiled."""
+    if not current_app.config.get(PROFILING_CONFIG_KEY, False):
+        return False
+    return PROFILE_ARG in request.args or \
+        bool(request.headers.get(PROFILE_HEADER))
+
+
+def profile_call(profile_dir, f, *args, **kwargs):
+    """Calls `f` with the given arguments under cProfile and writes
+    the stats to `profile_dir`. Returns a tuple of the return value
+    of `f` and the id of the profile.
+    """
+    profile_id = uuid.uuid4().hex
+    profiler = cProfile.Profile()
+    try:
+        return_value = profiler.runcall(f, *args, **kwargs)
+    finally:
+        profiler.dump_stats(get_profile_path(profile_dir, profile_id))
+    return return_value, profile_id
+
+
+def get_profile_path(profile_dir, profile_id):
+    """Returns the path of the stats file of a profile, or None if
+    `profile_id` isn't a valid profile id.
+    """
+    if not _profile_id_re.match(profile_id):
+        return None
+    return os.path.join(profile_dir, profile_id + '.prof')
+
+
+def load_summary(profile_dir, profile_id, sort='cumulative', limit=50):
+    """Returns a summary of the stats of a profile as a dict with the
+    total number of calls (`ncalls`), the total time (`tottime`) and
+    the `limit` hottest functions (`functions`), in the order given
+    by `sort`, one of the keys of :data:`SORT_ORDERS`. Each function
+    is a dict with the `ncalls`, `primitive_calls`, `tottime` and
+    `cumtime` of the function, and its `name` and `location`, with
+    paths shortened to be relative to :data:`sys.path`, so the package
+    each function belongs to is easy to spot.
+
+    Returns None if there is no profile with the given id.
+    """
+    path = get_profile_path(profile_dir, profile_id)
+    if path is None or not os.path.isfile(path):
+        return None
+    stats = pstats.Stats(path)
+
+    functions = []
+    for (filename, lineno, name), (primitive_calls, ncalls, tottime,
+                                   cumtime, callers) in stats.stats.items():
+        if filename == '~':
+            # builtins have no file
+            location = ''
+        else:
+            location = '%s:%d' % (_strip_sys_path(filename), lineno)
+        functions.append(dict(
+            name=name, location=location, ncalls=ncalls,
+            primitive_calls=primitive_calls, tottime=tottime,
+            cumtime=cumtime))
+    functions.sort(key=lambda function: function[SORT_ORDERS[sort]],
+                   reverse=True)
+
+    return dict(ncalls=stats.total_calls, tottime=stats.total_tt,
+                functions=functions[:limit])
+
+
+def _strip_sys_path(filename):
+    """Returns filename relative to the longest entry of sys.path it
+    is in.
+    """
+    longest = ''
+    for path in sys.path:
+        path = os.path.join(os.path.abspath(path or os.curdir), '')
+        if filename.startswith(path) and len(path) > len(longest):
+            longest = path
+    return filename[len(longest):]
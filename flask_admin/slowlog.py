@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.slowlog
+    ~~~~~~~~~~~~~~
+
+    Times the datastore calls made by the admin views and logs the
+    slow ones. Each slow call is written as a line of JSON to a log
+    file that is rotated when it grows too big, with the name of the
+    model, the operation, how long it took, the keys or page it was
+    for and the queries the datastore issued. The `/slow/` admin page
+    lists the (model, operation) pairs that were slowest.
+
+    Pass a :class:`SlowLog` to the `slow_log` parameter of
+    :func:`~flask.ext.admin.create_admin_blueprint` to use it.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import, with_statement
+
+import datetime
+import json
+import logging
+from logging.handlers import RotatingFileHandler, WatchedFileHandler
+import os
+import sys
+import time
+
+from flask.ext.admin import util
+
+
+#: the datastore methods called by the admin views that are timed
+OPERATIONS = (
+    'create_model_pagination',
+    'find_model_instance',
+    'save_model',
+    'delete_model_instance',
+    'update_from_form',
+)
+
+
+class SlowLog(object):
+    """Logs datastore calls that take longer than a threshold to the
+    file at `path`. `threshold` is the default threshold in seconds;
+    `thresholds` can be set to a dict with operation names (see
+    :data:`OPERATIONS`) as keys matched to thresholds for those
+    operations.
+
+    The log is rotated when it reaches `max_bytes`, keeping
+    `backup_count` old logs, which are named like the log with a
+    number appended. Rotating by size is only safe when a single
+    process writes the log: the rollovers of several processes race,
+    losing records. If the worker processes of a server share the
+    log, set `max_bytes` to None and rotate the log externally, e.g.
+    with logrotate; each process then reopens the log whenever it has
+    been moved.
+
+    Only the queries issued while the datastore method runs are
+    logged, so for streamed list pages the queries that fetch the
+    rows as the page is sent are not included.
+    """
+    def __init__(self, path, threshold=0.5, thresholds=None,
+                 max_bytes=1024 * 1024, backup_count=5):
+        self.path = path
+        self.threshold = threshold
+        self.thresholds = dict(thresholds or {})
+        self.backup_count = backup_count
+        if max_bytes is None:
+            handler = WatchedFileHandler(path, delay=True)
+        else:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                          backupCount=backup_count,
+                                          delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        # the logger isn't registered with the logging module, so
+        # records don't propagate to the handlers of the app
+        self._logger = logging.Logger(__name__)
+        self._logger.addHandler(handler)
+
+    def get_threshold(self, operation):
+        """Returns the threshold, in seconds, for an operation."""
+        return self.thresholds.get(operation, self.threshold)
+
+    def log(self, operation, model_name, duration, keys=None, page=None,
+            per_page=None, queries=None, error=None):
+        """Logs a datastore call if it took at least the threshold of
+        its operation. Returns True if the call was logged.
+        """
+        if duration < self.get_threshold(operation):
+            return False
+        record = dict(
+            time=datetime.datetime.utcnow().isoformat(),
+            operation=operation, model=model_name,
+            duration=round(duration, 6), queries=list(queries or ()))
+        if keys is not None:
+            record['keys'] = [unicode(key) for key in keys]
+        if page is not None:
+            record['page'] = page
+            record['per_page'] = per_page
+        if error is not None:
+            record['error'] = error
+        self._logger.warning(json.dumps(record, sort_keys=True))
+        return True
+
+    def read_records(self):
+        """Yields the logged records as dicts, from the oldest log to
+        the newest. Lines that can't be read are skipped.
+        """
+        paths = ['%s.%d' % (self.path, i)
+                 for i in range(self.backup_count, 0, -1)]
+        paths.append(self.path)
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+            log_file = open(path)
+            try:
+                for line in log_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict):
+                        yield record
+            finally:
+                log_file.close()
+
+    def worst_offenders(self, limit=20):
+        """Returns the logged calls aggregated by model and
+        operation, slowest total duration first. Each aggregate is a
+        dict with the `model` and `operation`, the number of slow
+        calls (`count`), their `total`, `mean` and `max` durations,
+        the time of the `last` one and the `slowest` record itself.
+        """
+        aggregates = {}
+        for record in self.read_records():
+            try:
+                key = (record['model'], record['operation'])
+                duration = float(record['duration'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            aggregate = aggregates.get(key)
+            if aggregate is None:
+                aggregate = aggregates[key] = dict(
+                    model=key[0], operation=key[1], count=0, total=0.0,
+                    max=0.0, last=None, slowest=None)
+            aggregate['count'] += 1
+            aggregate['total'] += duration
+            if aggregate['slowest'] is None or duration > aggregate['max']:
+                aggregate['max'] = duration
+                aggregate['slowest'] = record
+            if record.get('time') > aggregate['last']:
+                aggregate['last'] = record['time']
+
+        offenders = sorted(aggregates.values(),
+                           key=lambda aggregate: aggregate['total'],
+                           reverse=True)[:limit]
+        for aggregate in offenders:
+            aggregate['mean'] = aggregate['total'] / aggregate['count']
+        return offenders
+
+    def timed(self, datastore):
+        """Returns a :class:`TimedDatastore` that logs the slow calls
+        to `datastore` to this log.
+        """
+        return TimedDatastore(datastore, self)
+
+
+class TimedDatastore(object):
+    """Wraps a datastore, timing the calls to its methods listed in
+    :data:`OPERATIONS` and passing them on to a :class:`SlowLog`. Other
+    attributes are looked up on the wrapped datastore.
+
+    Whether a call is slow is only known once it returns, so the
+    queries of every call are captured, not just those of the slow
+    ones. Capturing keeps the text of each statement or Mongo
+    operation in a list for the duration of the call, which costs
+    about as much as a list append per query.
+    """
+    def __init__(self, datastore, slow_log):
+        self.datastore = datastore
+        self.slow_log = slow_log
+
+    def __getattr__(self, name):
+        return getattr(self.datastore, name)
+
+    def create_model_pagination(self, model_name, page, *args, **kwargs):
+        per_page = args[0] if args else kwargs.get('per_page')
+        return self._call(
+            'create_model_pagination', model_name, None, (page, per_page),
+            model_name, page, *args, **kwargs)
+
+    def find_model_instance(self, model_name, model_keys):
+        return self._call('find_model_instance', model_name, model_keys,
+                          None, model_name, model_keys)
+
+    def delete_model_instance(self, model_name, model_keys):
+        return self._call('delete_model_instance', model_name, model_keys,
+                          None, model_name, model_keys)
+
+    def save_model(self, model_instance):
+        return self._call('save_model', type(model_instance).__name__,
+                          model_instance, None, model_instance)
+
+    def update_from_form(self, model_instance, form):
+        return self._call('update_from_form', type(model_instance).__name__,
+                          model_instance, None, model_instance, form)
+
+    def _call(self, operation, model_name, keys, page, *args, **kwargs):
+        """Calls an operation of the datastore and logs it if it was
+        slow. `keys` is either a list of model keys or a model instance
+        to get them from, and `page` is a (page, per_page) tuple or
+        None.
+        """
+        method = getattr(self.datastore, operation)
+        error = None
+        start = time.time()
+        with util.capture_queries() as queries:
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                error = sys.exc_info()[0].__name__
+                raise
+            finally:
+                duration = time.time() - start
+                if duration >= self.slow_log.get_threshold(operation):
+                    if keys is not None and not isinstance(keys, (list, tuple)):
+                        keys = self._get_model_keys(keys)
+                    page, per_page = page or (None, None)
+                    self.slow_log.log(
+                        operation, model_name, duration, keys=keys,
+                        page=page, per_page=per_page, queries=queries,
+                        error=error)
+
+    def _get_model_keys(self, model_instance):
+        try:
+            return list(self.datastore.get_model_keys(model_instance))
+        except Exception:
+            return None
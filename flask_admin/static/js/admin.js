@@ -46,16 +46,93 @@ $(function(){
         .chosen({no_results_text: "No results matched",
                  allow_single_deselect: true});
 
-    $('tr.listed').on('click', function(){
+    // list rows are handled by delegation from the table, so rows
+    // loaded while scrolling work too
+    $('#list-table').on('click', 'tr.listed', function(){
         window.location = $(this).find('a.edit-link').attr('href');
     });
 
-    $('tr.listed').on('mouseover', function(){
-        $(this).toggleClass('listed-highlight');
+    $('#list-table').on('mouseenter', 'tr.listed', function(){
+        $(this).addClass('listed-highlight');
     });
 
-    $('tr.listed').on('mouseout', function(){
-        $(this).toggleClass('listed-highlight');
+    $('#list-table').on('mouseleave', 'tr.listed', function(){
+        $(this).removeClass('listed-highlight');
+    });
+
+    $('#list-table.infinite-scroll').each(function(){
+        var table = $(this);
+        var pagers = table.siblings('.pagination');
+        var nextUrl = table.attr('data-next-url');
+        var loading = false;
+        var scrollTimer = null;
+
+        if (nextUrl){
+            pagers.hide();
+        }
+
+        // pages of rows that are more than a few screens away from
+        // the viewport are detached and replaced by an empty row of
+        // the same height, so the number of rows in the document
+        // stays bounded however far the list is scrolled
+        function virtualize(){
+            var viewTop = $(window).scrollTop();
+            var viewHeight = $(window).height();
+            var margin = viewHeight * 3;
+
+            table.children('tbody').each(function(){
+                var page = $(this);
+                var top = page.offset().top;
+                var height = page.height();
+                var far = top + height < viewTop - margin ||
+                    top > viewTop + viewHeight + margin;
+                var rows = page.data('detached-rows');
+
+                if (far && !rows){
+                    page.data('detached-rows', page.children().detach());
+                    $('<tr class="list-placeholder"><td colspan="2"></td></tr>')
+                        .height(height)
+                        .appendTo(page);
+                } else if (!far && rows){
+                    page.empty().append(rows).removeData('detached-rows');
+                }
+            });
+        }
+
+        function loadNextPage(){
+            var viewBottom = $(window).scrollTop() + $(window).height();
+            var tableBottom = table.offset().top + table.height();
+            if (loading || !nextUrl || tableBottom - viewBottom > $(window).height()){
+                return;
+            }
+
+            loading = true;
+            $.getJSON(nextUrl)
+                .done(function(data){
+                    $('<tbody></tbody>').html(data.html).appendTo(table);
+                    nextUrl = data.next_url;
+                    loading = false;
+                    virtualize();
+                    loadNextPage();
+                })
+                .fail(function(){
+                    // fall back to the pager
+                    nextUrl = null;
+                    pagers.show();
+                });
+        }
+
+        $(window).on('scroll resize', function(){
+            if (scrollTimer === null){
+                scrollTimer = setTimeout(function(){
+                    scrollTimer = null;
+                    virtualize();
+                    loadNextPage();
+                }, 100);
+            }
+        });
+
+        loadNextPage();
     });
 
 });
\ No newline at end of file
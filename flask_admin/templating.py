@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.templating
+    ~~~~~~~~~~~~~~
+
+    Helpers for caching compiled admin templates, so that new worker
+    processes don't have to compile them on their first requests.
+
+    The templates can be compiled ahead of time, e.g. when deploying,
+    by running::
+
+        python -m flask_admin.templating /path/to/cache_dir
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import inspect
+import os
+import sys
+
+import flask
+from jinja2 import FileSystemBytecodeCache
+
+
+def enable_bytecode_cache(app, cache_dir):
+    """Makes the Jinja environment of `app` cache compiled templates
+    as files in `cache_dir`, which is created if it doesn't exist.
+    The cache applies to all the templates of the app, not just the
+    admin templates.
+
+    .. note::
+
+       This creates the Jinja environment of the app if it hasn't
+       been created yet, so changes made to `app.jinja_options`
+       afterwards won't have an effect.
+    """
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def list_admin_templates():
+    """Returns the names of the templates that come with the admin."""
+    template_folder = _get_template_folder()
+    template_names = []
+    for dirpath, dirnames, filenames in os.walk(template_folder):
+        for filename in filenames:
+            if filename.endswith('.html'):
+                path = os.path.join(dirpath, filename)
+                template_names.append(
+                    os.path.relpath(path, template_folder).replace(
+                        os.path.sep, '/'))
+    return sorted(template_names)
+
+
+def warmup_templates(app, template_names=None):
+    """Loads the admin templates into the Jinja environment of `app`,
+    compiling them (or reading them from the bytecode cache) so they
+    are ready before the first request. Templates overridden by the
+    app are loaded instead of the admin's own ones. Returns the names
+    of the loaded templates.
+
+    Call this at startup, before the worker accepts requests. If the
+    app is loaded before the server forks its workers, they will all
+    share the loaded templates.
+    """
+    if template_names is None:
+        template_names = list_admin_templates()
+    for template_name in template_names:
+        app.jinja_env.get_template(template_name)
+    return template_names
+
+
+def precompile_templates(cache_dir):
+    """Compiles the admin templates into a bytecode cache in
+    `cache_dir`, using a Jinja environment configured like the
+    default Flask one. Apps with custom `jinja_options` should use
+    :func:`enable_bytecode_cache` and :func:`warmup_templates`
+    instead.
+    """
+    app = flask.Flask('flask_admin')
+    app.register_blueprint(flask.Blueprint(
+        'admin', 'flask.ext.admin', template_folder=_get_template_folder()))
+    enable_bytecode_cache(app, cache_dir)
+    return warmup_templates(app)
+
+
+def _get_template_folder():
+    return os.path.join(
+        os.path.dirname(inspect.getfile(inspect.currentframe())),
+        'templates')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('usage: python -m flask_admin.templating CACHE_DIR')
+    for template_name in precompile_templates(sys.argv[1]):
+        print('compiled %s' % template_name)
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+    flask.ext.admin.tracing
+    ~~~~~~~~~~~~~~
+
+    Traces the phases of admin requests as nested spans: the request
+    as a whole (including the `view_decorator`), the view, the
+    datastore calls, building and validating forms, and rendering
+    templates. Spans carry attributes like the model name and keys.
+
+    Pass a :class:`Tracer` to the `tracer` parameter of
+    :func:`~flask.ext.admin.create_admin_blueprint` to trace the admin
+    views. A tracer hands each finished trace to an exporter;
+    :class:`FileExporter` appends them to a local file as JSON, from
+    which waterfalls of slow requests can be built with
+    :func:`format_waterfall`. Any object with an ``export(spans)``
+    method can be used as an exporter, to send traces elsewhere.
+
+    The default tracer, :data:`NULL_TRACER`, doesn't record anything.
+
+    :copyright: (c) 2011 by wilsaj.
+    :license: BSD, see LICENSE for more details.
+"""
+from __future__ import absolute_import, with_statement
+
+import binascii
+import json
+import os
+import threading
+import time
+
+from flask.ext.admin.slowlog import OPERATIONS
+
+
+class Tracer(object):
+    """Records spans and passes the spans of each trace to
+    `exporter` once its root span is finished. Spans started while
+    another span of the same thread is active are nested in it.
+    """
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self._local = threading.local()
+
+    def span(self, name, **attributes):
+        """Returns a :class:`Span` that is started and finished when
+        used as a context manager.
+        """
+        return Span(self, name, attributes)
+
+    def current_span(self):
+        """Returns the innermost active span of the current thread, or
+        None.
+        """
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def traced(self, datastore):
+        """Returns a :class:`TracedDatastore` that traces the calls to
+        `datastore` with this tracer.
+        """
+        return TracedDatastore(datastore, self)
+
+    def _start(self, span):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        if stack:
+            parent = stack[-1]
+            span.trace_id = parent.trace_id
+            span.parent_id = parent.span_id
+            span.trace = parent.trace
+        else:
+            span.trace_id = _new_id(16)
+            span.trace = []
+        stack.append(span)
+
+    def _finish(self, span):
+        stack = self._local.stack
+        # spans that weren't finished, e.g. because a generator was
+        # never exhausted, are dropped along with their children
+        while stack and stack[-1] is not span:
+            stack.pop()
+        if stack:
+            stack.pop()
+        span.trace.append(span)
+        if not stack:
+            self.exporter.export(
+                sorted(span.trace, key=lambda span: span.start))
+
+
+class Span(object):
+    """A phase of a traced request."""
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = _new_id(8)
+        self.parent_id = None
+        self.trace_id = None
+        self.trace = None
+        self.start = None
+        self.duration = None
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def to_dict(self):
+        return dict(name=self.name, trace_id=self.trace_id,
+                    span_id=self.span_id, parent_id=self.parent_id,
+                    start=self.start, duration=self.duration,
+                    attributes=self.attributes)
+
+    def __enter__(self):
+        self.tracer._start(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.time() - self.start
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+
+class NullTracer(object):
+    """A tracer that doesn't record anything."""
+    def span(self, name, **attributes):
+        return _NULL_SPAN
+
+    def current_span(self):
+        return None
+
+    def traced(self, datastore):
+        return datastore
+
+
+class _NullSpan(object):
+    def set_attribute(self, name, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+#: the default tracer
+NULL_TRACER = NullTracer()
+
+
+class FileExporter(object):
+    """Appends each trace to the file at `path` as a line of JSON,
+    with the `trace_id`, the `duration` of the root span and the list
+    of `spans`, as returned by :meth:`Span.to_dict`. Traces whose root
+    span took less than `min_duration` seconds are left out.
+    """
+    def __init__(self, path, min_duration=0):
+        self.path = path
+        self.min_duration = min_duration
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        root = [span for span in spans if span.parent_id is None][0]
+        if root.duration < self.min_duration:
+            return
+        line = json.dumps(dict(
+            trace_id=root.trace_id, duration=root.duration,
+            spans=[span.to_dict() for span in spans]),
+            default=unicode) + '\n'
+        self._lock.acquire()
+        try:
+            # the trace is written at once to a file opened for
+            # appending, so processes can share the file
+            f = open(self.path, 'a')
+            try:
+                f.write(line)
+            finally:
+                f.close()
+        finally:
+            self._lock.release()
+
+    def read_traces(self):
+        """Yields the exported traces as dicts, oldest first."""
+        if not os.path.isfile(self.path):
+            return
+        f = open(self.path)
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+        finally:
+            f.close()
+
+
+def format_waterfall(trace, width=40):
+    """Returns a text waterfall of a trace read with
+    :meth:`FileExporter.read_traces`: one line per span, indented by
+    depth, with a bar showing when the span ran relative to the root
+    span.
+    """
+    spans = trace['spans']
+    depths = {}
+    start = min([span['start'] for span in spans])
+    total = max(trace['duration'], 1e-9)
+    lines = []
+    for span in spans:
+        depth = depths[span['span_id']] = \
+            depths.get(span['parent_id'], -1) + 1
+        offset = int(round((span['start'] - start) / total * width))
+        length = max(1, int(round(span['duration'] / total * width)))
+        attributes = ' '.join(['%s=%s' % item for item in
+                               sorted(span['attributes'].items())])
+        lines.append('%-40s %8.2f ms |%s%s%s| %s' % (
+            '  ' * depth + span['name'], span['duration'] * 1000,
+            ' ' * offset, '#' * length,
+            ' ' * max(0, width - offset - length), attributes))
+    return '\n'.join(lines)
+
+
+class TracedDatastore(object):
+    """Wraps a datastore, tracing the calls to its methods listed in
+    :data:`flask.ext.admin.slowlog.OPERATIONS` as ``datastore.*``
+    spans with the model name and keys. The keys of the instances that
+    are saved or updated are read once the call returns. Other
+    attributes are looked up on the wrapped datastore.
+    """
+    def __init__(self, datastore, tracer):
+        self.datastore = datastore
+        self.tracer = tracer
+
+    def __getattr__(self, name):
+        value = getattr(self.datastore, name)
+        if name not in OPERATIONS:
+            return value
+
+        def traced(*args, **kwargs):
+            # the first argument is either a model name or a model
+            # instance; the second one is either the keys or the page
+            attributes = {}
+            if isinstance(args[0], basestring):
+                attributes['model'] = args[0]
+                if name == 'create_model_pagination':
+                    attributes['page'] = args[1]
+                    if len(args) > 2:
+                        attributes['per_page'] = args[2]
+                else:
+                    attributes['keys'] = u'/'.join(
+                        [unicode(key) for key in args[1]])
+            else:
+                attributes['model'] = type(args[0]).__name__
+            with self.tracer.span('datastore.' + name,
+                                  **attributes) as span:
+                result = value(*args, **kwargs)
+                if 'keys' not in attributes:
+                    # the keys of a new instance are only known once
+                    # it has been saved
+                    keys = self._get_model_keys(args[0])
+                    if keys:
+                        span.set_attribute('keys', u'/'.join(
+                            [unicode(key) for key in keys]))
+                return result
+        return traced
+
+    def _get_model_keys(self, model_instance):
+        try:
+            keys = list(self.datastore.get_model_keys(model_instance))
+        except Exception:
+            return None
+        if None in keys:
+            return None
+        return keys
+
+
+def _new_id(size):
+    return binascii.hexlify(os.urandom(size))
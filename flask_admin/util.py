@@ -1,26 +1,63 @@
+from contextlib import contextmanager
 import math
+import threading
+import weakref
 
 
 # original source:  http://flask.pocoo.org/snippets/44/
 class Pagination(object):
-    def __init__(self, page, per_page, total, items):
+    """A page of model instances for the list view. `total` can be
+    None if the number of instances isn't known, e.g. because counting
+    them took too long; `has_more` then tells whether there are
+    instances after this page, and the pager only goes as far as the
+    next page. `estimated` is True if `total` is an estimate, which
+    `has_more` can then correct. `warning` is a message shown along
+    with the page, like a note that the page is incomplete.
+
+    Datastores that page by key set `next_cursor` and `prev_cursor`
+    to the keys the next and previous pages start after and end
+    before; see
+    :meth:`~flask.ext.admin.datastore.core.AdminDatastore.create_model_pagination`.
+    """
+    next_cursor = None
+    prev_cursor = None
+
+    def __init__(self, page, per_page, total, items, has_more=False,
+                 estimated=False, warning=None):
         self.page = page
         self.per_page = per_page
         self.total = total
         self.items = items
+        self.has_more = has_more
+        self.estimated = estimated
+        self.warning = warning
 
     @property
     def pages(self):
-        return int(math.ceil(self.total / float(self.per_page)))
+        if self.total is None:
+            pages = self.page
+        else:
+            pages = int(math.ceil(self.total / float(self.per_page)))
+        if self.has_more:
+            pages = max(pages, self.page + 1)
+        return pages
 
     @property
     def has_prev(self):
         return self.page > 1
 
+    @property
+    def prev_num(self):
+        return self.page - 1
+
     @property
     def has_next(self):
         return self.page < self.pages
 
+    @property
+    def next_num(self):
+        return self.page + 1
+
     def iter_pages(self, left_edge=2, left_current=2,
                    right_current=5, right_edge=2):
         last = 0
@@ -33,3 +70,163 @@ class Pagination(object):
                     yield None
                 yield num
                 last = num
+
+
+def bind_converters(converter, converters=None):
+    """Adds the methods of `converter` that are marked with a
+    `converts` decorator to the `converters` dict, keyed by the type
+    names they convert, and returns the dict. The marked methods are
+    found once per converter class and the result is kept on the
+    class, so creating converters doesn't have to scan them.
+    """
+    converter_class = type(converter)
+    registry = converter_class.__dict__.get('_converter_registry')
+    if registry is None:
+        registry = {}
+        for name in dir(converter_class):
+            for type_name in getattr(getattr(converter_class, name),
+                                     '_converter_for', ()):
+                registry[type_name] = name
+        converter_class._converter_registry = registry
+
+    if not converters:
+        converters = {}
+    for type_name, name in registry.iteritems():
+        converters[type_name] = getattr(converter, name)
+    return converters
+
+
+_query_captures = threading.local()
+
+# functions to call when queries or plans are captured, until they
+# return True
+_capture_hooks = []
+_capture_hooks_lock = threading.Lock()
+
+
+def when_capturing(hook):
+    """Calls `hook` whenever queries or plans start being captured
+    with :func:`capture_queries` or :func:`capture_plans`, until it
+    returns True. Datastores use it to start reporting their queries
+    only once something collects them.
+
+    If `hook` is a bound method, only a weak reference to its object
+    is kept, and the hook is dropped once the object is garbage
+    collected.
+    """
+    _capture_hooks_lock.acquire()
+    try:
+        _capture_hooks.append(_WeakHook(hook))
+    finally:
+        _capture_hooks_lock.release()
+
+
+class _WeakHook(object):
+    """Calls a function, or a bound method through a weak reference to
+    its object. Returns True, so that the hook is dropped, once the
+    object is gone.
+    """
+    def __init__(self, hook):
+        obj = getattr(hook, '__self__', None)
+        if obj is None:
+            self._obj = None
+            self._func = hook
+        else:
+            self._obj = weakref.ref(obj)
+            self._func = hook.__func__
+
+    def __call__(self):
+        if self._obj is None:
+            return self._func()
+        obj = self._obj()
+        if obj is None:
+            return True
+        return self._func(obj)
+
+
+def _start_capturing():
+    if not _capture_hooks:
+        return
+    for hook in list(_capture_hooks):
+        if hook():
+            _capture_hooks_lock.acquire()
+            try:
+                if hook in _capture_hooks:
+                    _capture_hooks.remove(hook)
+            finally:
+                _capture_hooks_lock.release()
+
+
+@contextmanager
+def capture_queries():
+    """Collects the queries that datastores report with
+    :func:`record_query` in the current thread, while the context is
+    active. Yields the list the queries are appended to. Captures can
+    be nested; every active capture gets each query.
+    """
+    _start_capturing()
+    queries = []
+    captures = getattr(_query_captures, 'captures', None)
+    if captures is None:
+        captures = _query_captures.captures = []
+    captures.append(queries)
+    try:
+        yield queries
+    finally:
+        captures.pop()
+
+
+def capturing_queries():
+    """Returns True if a query capture is active in the current
+    thread.
+    """
+    return bool(getattr(_query_captures, 'captures', None))
+
+
+def record_query(query):
+    """Reports a query issued by a datastore to the active captures of
+    the current thread, if any. `query` should be a string, like a SQL
+    statement.
+    """
+    for queries in getattr(_query_captures, 'captures', ()):
+        queries.append(query)
+
+
+_plan_captures = threading.local()
+
+
+@contextmanager
+def capture_plans():
+    """Like :func:`capture_queries`, but collects the query plans that
+    datastores report with :func:`record_plan`. Datastores only
+    explain their queries while a plan capture is active, since it
+    costs an extra query each time.
+    """
+    _start_capturing()
+    plans = []
+    captures = getattr(_plan_captures, 'captures', None)
+    if captures is None:
+        captures = _plan_captures.captures = []
+    captures.append(plans)
+    try:
+        yield plans
+    finally:
+        captures.pop()
+
+
+def capturing_plans():
+    """Returns True if a plan capture is active in the current thread."""
+    return bool(getattr(_plan_captures, 'captures', None))
+
+
+def record_plan(query, plan, full_scan=False, indexes=()):
+    """Reports the plan of a query issued by a datastore to the active
+    plan captures of the current thread. `plan` is a list of lines
+    describing the plan, `full_scan` tells whether the query reads a
+    whole table or collection and `indexes` lists statements that
+    create indexes that would serve the query.
+    """
+    plan = dict(query=query, plan=list(plan), full_scan=full_scan,
+                indexes=list(indexes))
+    for plans in getattr(_plan_captures, 'captures', ()):
+        plans.append(plan)
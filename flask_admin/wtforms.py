@@ -78,10 +78,30 @@ class TimePickerWidget(widgets.TextInput):
 def has_file_field(form):
     """Test whether or not a form has a FileField in it. This is used
     to know whether or not we need to set enctype to
-    multipart/form-data.
-    """
-    for field in form:
-        if isinstance(field, wtf_fields.FileField):
-            return True
+    multipart/form-data. `form` can be a form class or an instance of
+    one.
 
-    return False
+    The result only depends on the fields declared on the form class,
+    so it is computed once per class and stored in the class's
+    `_has_file_field` attribute, which the templates read.
+    """
+    if isinstance(form, type):
+        form_class = form
+    else:
+        form_class = type(form)
+    if '_has_file_field' not in form_class.__dict__:
+        form_class._has_file_field = any(
+            issubclass(field.field_class, wtf_fields.FileField)
+            for field in _unbound_fields(form_class))
+    return form_class._has_file_field
+
+
+def _unbound_fields(form_class):
+    """Returns the unbound fields declared on a form class and its
+    bases, the way WTForms finds them.
+    """
+    for name in dir(form_class):
+        if not name.startswith('_'):
+            value = getattr(form_class, name)
+            if hasattr(value, '_formfield'):
+                yield value
@@ -0,0 +1,50 @@
+from flask import Flask
+from flask.ext import admin
+from flask.ext.admin.datastore.sqlalchemy import SQLAlchemyDatastore
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String
+
+Base = declarative_base()
+
+
+# ----------------------------------------------------------------------
+# Models
+# ----------------------------------------------------------------------
+class Event(Base):
+    __tablename__ = 'event'
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)
+    name = Column(String(100))
+
+    __mapper_args__ = {'polymorphic_on': kind,
+                       'polymorphic_identity': 'event'}
+
+    def __repr__(self):
+        return self.name
+
+
+class Reading(Event):
+    """Counting readings has to filter the event table by kind, so
+    SQLite can't just count the rows of the table, which it does in a
+    single step that can't be interrupted.
+    """
+    __mapper_args__ = {'polymorphic_identity': 'reading'}
+
+
+def create_app(database_uri='sqlite://', rows=3000, **datastore_options):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'not secure'
+    engine = create_engine(database_uri, convert_unicode=True)
+    app.db_session = scoped_session(sessionmaker(
+        autocommit=False, autoflush=False, bind=engine))
+    app.datastore = SQLAlchemyDatastore(
+        (Event, Reading), app.db_session, **datastore_options)
+    admin_blueprint = admin.create_admin_blueprint(app.datastore)
+    app.register_blueprint(admin_blueprint, url_prefix='/admin')
+    Base.metadata.create_all(bind=engine)
+    app.datastore.save_models([Reading(name=u'Reading%04d' % i)
+                           for i in range(rows)])
+    return app
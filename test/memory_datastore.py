@@ -0,0 +1,46 @@
+import datetime
+
+from flask import Flask, redirect
+from flask.ext import admin
+from flask.ext.admin.datastore.memory import Field, InMemoryDatastore, Model
+
+
+# ----------------------------------------------------------------------
+# Models
+# ----------------------------------------------------------------------
+class Student(Model):
+    id = Field(int, primary_key=True)
+    name = Field(unicode, required=True)
+    enrolled = Field(datetime.date)
+
+    def __repr__(self):
+        return self.name
+
+
+class Location(Model):
+    building = Field(unicode, primary_key=True)
+    room = Field(unicode, primary_key=True)
+    capacity = Field(int)
+
+    def __repr__(self):
+        return u'%s|%s' % (self.building, self.room)
+
+
+def create_app(pagination=25, **kwargs):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'not secure'
+    app.datastore = InMemoryDatastore((Student, Location))
+    admin_blueprint = admin.create_admin_blueprint(
+        app.datastore, list_view_pagination=pagination, **kwargs)
+    app.register_blueprint(admin_blueprint, url_prefix='/admin')
+
+    @app.route('/')
+    def go_to_admin():
+        return redirect('/admin')
+
+    return app
+
+
+if __name__ == '__main__':
+    app = create_app()
+    app.run(debug=True)
@@ -1,10 +1,19 @@
 #!/usr/bin/env python
-from __future__ import absolute_import
+from __future__ import absolute_import, with_statement
 
+import os
+import shutil
+import tempfile
 from unittest import TestCase
+from bson.objectid import ObjectId
 from mongoalchemy import fields as ma_fields
 from mongoalchemy.document import Document
-from flask.ext.admin.datastore.mongoalchemy import model_form
+from flask.ext.admin import util
+from flask.ext.admin.cache import SimpleCache
+from flask.ext.admin.datastore.mongoalchemy import model_form, \
+     MongoAlchemyDatastore, MongoAlchemyPagination, _record_query, \
+     _to_object_id
+from flask.ext.admin.formcache import FormCache
 from wtforms import fields as wtf_fields
 from wtforms.form import Form
 
@@ -121,6 +130,211 @@ class ConversionTest(TestCase):
         assert form.tuple_field.tuple_field_2.__class__ == wtf_fields.TextField
 
 
+class DocumentFormCacheTest(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.cache_dir, 'forms.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_form_cache(self):
+        class CachedDocument(Document):
+            name = ma_fields.StringField(max_length=40)
+            size = ma_fields.EnumField(ma_fields.IntField(), 4, 6, 7)
+
+        form_cache = FormCache(self.path)
+        datastore = MongoAlchemyDatastore(
+            [CachedDocument], None, form_cache=form_cache)
+        self.assertEqual((form_cache.hits, form_cache.misses), (0, 1))
+
+        form_cache = FormCache(self.path)
+        cached_datastore = MongoAlchemyDatastore(
+            [CachedDocument], None, form_cache=form_cache)
+        self.assertEqual((form_cache.hits, form_cache.misses), (1, 0))
+
+        form = datastore.get_model_form('CachedDocument')()
+        cached_form = cached_datastore.get_model_form('CachedDocument')()
+        self.assertEqual([field.name for field in cached_form],
+                         [field.name for field in form])
+        self.assertEqual(cached_form.size.validators[-1].values, (4, 6, 7))
+        self.assertEqual(cached_form.name.validators[-1].max, 40)
+
+        # changing a field generates the form again
+        class CachedDocument(Document):
+            name = ma_fields.StringField(max_length=80)
+            size = ma_fields.EnumField(ma_fields.IntField(), 4, 6, 7)
+
+        form_cache = FormCache(self.path)
+        datastore = MongoAlchemyDatastore(
+            [CachedDocument], None, form_cache=form_cache)
+        self.assertEqual((form_cache.hits, form_cache.misses), (0, 1))
+        form = datastore.get_model_form('CachedDocument')()
+        self.assertEqual(form.name.validators[-1].max, 80)
+
+    def test_uncacheable_form(self):
+        # tuple fields are converted to form fields holding a form
+        # class generated on the fly, which can't be cached
+        class TupleDocument(Document):
+            pair = ma_fields.TupleField(ma_fields.IntField(),
+                                        ma_fields.BoolField())
+
+        for i in range(2):
+            form_cache = FormCache(self.path)
+            datastore = MongoAlchemyDatastore(
+                [TupleDocument], None, form_cache=form_cache)
+            self.assertEqual((form_cache.hits, form_cache.misses), (0, 1))
+            form = datastore.get_model_form('TupleDocument')()
+            assert form.pair.pair_1.__class__ == wtf_fields.BooleanField
+
+
+class QueryRecordTest(TestCase):
+    def test_record_query(self):
+        class RecordedDocument(Document):
+            name = ma_fields.StringField()
+
+        with util.capture_queries() as queries:
+            _record_query(RecordedDocument, 'find', {'name': u'x'},
+                          skip=25, limit=25)
+        self.assertEqual(queries, [
+            u"RecordedDocument.find({'name': u'x'}).limit(25).skip(25)"])
+
+
+class SaveModelTest(TestCase):
+    """Checks what saving edited documents writes, with a session
+    that records the updates instead of sending them to a database.
+    """
+    class SavedDocument(Document):
+        name = ma_fields.StringField()
+        age = ma_fields.IntField(db_field='a')
+
+    class Collection(object):
+        def __init__(self):
+            self.updates = []
+
+        def update(self, spec, document, safe=False):
+            self.updates.append((spec, document))
+
+    class Database(dict):
+        name = 'test'
+
+    class Session(object):
+        def __init__(self, collection):
+            self.db = SaveModelTest.Database(SavedDocument=collection)
+
+    def setUp(self):
+        self.collection = self.Collection()
+        self.datastore = MongoAlchemyDatastore(
+            [self.SavedDocument], self.Session(self.collection))
+        self.document = self.SavedDocument(
+            mongo_id=ObjectId(u'4f' * 12), name=u'Stewart', age=20)
+
+    def edit(self, **data):
+        form = self.datastore.get_model_form('SavedDocument')(
+            obj=self.document)
+        for name, value in data.items():
+            getattr(form, name).data = value
+        self.datastore.update_from_form(self.document, form)
+        with util.capture_queries() as queries:
+            self.datastore.save_model(self.document)
+        return queries
+
+    def test_changed_fields_are_set(self):
+        queries = self.edit(age=21)
+        self.assertEqual(self.collection.updates, [
+            ({'_id': ObjectId(u'4f' * 12)}, {'$set': {'a': 21}})])
+        self.assertEqual(len(queries), 1)
+
+    def test_batch_save_invalidates_cache(self):
+        self.datastore.cache = SimpleCache()
+        namespace = self.datastore.get_cache_namespace('SavedDocument')
+        self.assertEqual(namespace, u'mongodb|test:SavedDocument')
+        self.datastore.cache.set(namespace, 'count', 1)
+        form = self.datastore.get_model_form('SavedDocument')(
+            obj=self.document)
+        form.age.data = 21
+        self.datastore.update_from_form(self.document, form)
+        self.assertEqual(self.datastore.save_models([self.document]), [])
+        self.assertEqual(self.datastore.cache.get(namespace, 'count'), None)
+
+    def test_unchanged_document_is_not_written(self):
+        queries = self.edit()
+        self.assertEqual(self.collection.updates, [])
+        self.assertEqual(queries, [])
+
+
+class PaginationTest(TestCase):
+    """Checks how pages are assembled from the documents a query
+    returns, with a query that returns documents without a database.
+    """
+    class PagedDocument(Document):
+        name = ma_fields.StringField()
+
+    class Query(object):
+        query = {}
+
+        def __init__(self, documents):
+            self.type = PaginationTest.PagedDocument
+            self.documents = documents
+            self.counts = []
+
+        def all(self):
+            return list(self.documents)
+
+        def __iter__(self):
+            return iter(self.documents)
+
+        def count(self, with_limit_and_skip=False):
+            self.counts.append(with_limit_and_skip)
+            return 10
+
+    class Document(object):
+        def __init__(self, mongo_id):
+            self.mongo_id = mongo_id
+
+    def documents(self, *mongo_ids):
+        return [self.Document(mongo_id) for mongo_id in mongo_ids]
+
+    def test_cursors(self):
+        pagination = MongoAlchemyPagination(
+            2, 3, self.Query(self.documents('a', 'b', 'c')), total=10)
+        self.assertEqual(pagination.prev_cursor, u'a')
+        self.assertEqual(pagination.next_cursor, u'c')
+
+        pagination = MongoAlchemyPagination(
+            1, 3, self.Query(self.documents('a', 'b', 'c')), total=3)
+        self.assertEqual(pagination.prev_cursor, None)
+        self.assertEqual(pagination.next_cursor, None)
+
+    def test_reverse(self):
+        pagination = MongoAlchemyPagination(
+            2, 3, self.Query(self.documents('f', 'e', 'd')), stream=True,
+            total=10, reverse=True)
+        self.assertEqual([document.mongo_id for document in pagination.items],
+                         ['d', 'e', 'f'])
+        self.assertEqual(pagination.prev_cursor, u'd')
+        self.assertEqual(pagination.next_cursor, u'f')
+
+    def test_streamed_pages_have_no_cursors(self):
+        pagination = MongoAlchemyPagination(
+            2, 3, self.Query(self.documents('a', 'b', 'c')), stream=True,
+            total=10)
+        self.assertEqual(pagination.next_cursor, None)
+        self.assertEqual(len(list(pagination.items)), 3)
+
+    def test_total_ignores_skip_and_limit(self):
+        query = self.Query(self.documents('a', 'b', 'c'))
+        with util.capture_queries():
+            pagination = MongoAlchemyPagination(2, 3, query)
+        self.assertEqual(pagination.total, 10)
+        self.assertEqual(query.counts, [False])
+
+    def test_invalid_cursors(self):
+        self.assertEqual(_to_object_id(None), None)
+        self.assertEqual(_to_object_id(u'nonsense'), None)
+        self.assertEqual(_to_object_id(u'4f' * 12), ObjectId(u'4f' * 12))
+
+
 if __name__ == '__main__':
     from unittest import main
     main()
@@ -0,0 +1,40 @@
+from __future__ import with_statement
+
+from contextlib import contextmanager
+
+from flask.ext.admin import util
+
+
+class QueryBudgetMixin(object):
+    """Mixin for test cases that checks how many SQL statements or
+    Mongo operations the admin views issue, so that N+1 query
+    regressions fail the tests. Queries are counted with
+    :func:`flask.ext.admin.util.capture_queries`.
+    """
+    @contextmanager
+    def assert_max_queries(self, budget):
+        with util.capture_queries() as queries:
+            yield queries
+        if len(queries) > budget:
+            self.fail('%d queries issued, the budget is %d:\n%s' % (
+                len(queries), budget, '\n'.join(queries)))
+
+    def assert_query_budget(self, budget, url, method='get', **kwargs):
+        """Requests url with the test client and fails if more than
+        `budget` queries were issued. Streamed responses are read
+        entirely, so the queries issued while they are sent count
+        too. Returns the response.
+        """
+        with self.assert_max_queries(budget):
+            rv = getattr(self.client, method)(url, **kwargs)
+            rv.data
+        return rv
+
+    def assert_query_budgets(self, budgets):
+        """Checks a dict of GET urls mapped to query budgets, and that
+        each of the urls is served.
+        """
+        for url, budget in sorted(budgets.items()):
+            rv = self.assert_query_budget(budget, url)
+            self.assertTrue(rv.status_code in (200, 302),
+                            '%s returned %s' % (url, rv.status_code))
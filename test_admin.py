@@ -1,13 +1,43 @@
 from __future__ import with_statement
 
-from datetime import datetime
+from cStringIO import StringIO
+from datetime import date, datetime
+from functools import wraps
+import gc
+import gzip
+import os
+import shutil
+import subprocess
 import sys
+import tempfile
+import threading
+import time
+import types
 import unittest
+import weakref
+import zlib
 
-from flask import Flask
+from flask import Flask, Response, abort, request, url_for
 import sqlalchemy as sa
+from wtforms import Form, TextField
 
 from flask.ext import admin
+from flask.ext.admin import assets
+from flask.ext.admin import compression
+from flask.ext.admin import templating
+from flask.ext.admin import util
+from flask.ext.admin.admission import AdmissionController
+from flask.ext.admin.advisor import QueryAdvisor
+from flask.ext.admin.cache import SimpleCache, SQLiteCache
+from flask.ext.admin.datastore import memory
+from flask.ext.admin.datastore import sqlalchemy as sqlalchemy_datastore
+from flask.ext.admin.datastore.mongoalchemy import MongoAlchemyDatastore
+from flask.ext.admin.datastore.sqlalchemy import SQLAlchemyDatastore
+from flask.ext.admin.formcache import FormCache
+from flask.ext.admin.metrics import Metrics
+from flask.ext.admin.slowlog import SlowLog
+from flask.ext.admin.tracing import FileExporter, Tracer, format_waterfall
+from flask.ext.admin.wtforms import has_file_field
 from flask.ext.testing import TestCase
 
 sys.path.append('./example/')
@@ -22,11 +52,15 @@ from example.mongoalchemy import simple as ma_simple
 import test.custom_form
 import test.deprecation
 import test.filefield
+import test.memory_datastore
+from test.query_budget import QueryBudgetMixin
+import test.large_table
 import test.sqlalchemy_with_defaults
-from test.mongoalchemy_datastore import ConversionTest
+from test.mongoalchemy_datastore import ConversionTest, \
+     DocumentFormCacheTest, PaginationTest, QueryRecordTest, SaveModelTest
 
 
-class SimpleTest(TestCase):
+class SimpleTest(QueryBudgetMixin, TestCase):
     TESTING = True
 
     def create_app(self):
@@ -44,10 +78,44 @@ class SimpleTest(TestCase):
         rv = self.client.get('/')
         self.assert_redirects(rv, '/admin')
 
+    def test_query_budgets(self):
+        self.assert_query_budgets({
+            '/admin/': 0,
+            '/admin/list/Course/': 2,
+            '/admin/list/Student/': 2,
+            '/admin/list/Teacher/': 2,
+            # the instance, its teacher and students, and the teacher
+            # and student options
+            '/admin/edit/Course/1/': 5,
+            '/admin/edit/Student/1/': 3,
+            '/admin/edit/Teacher/1/': 1,
+            '/admin/add/Course/': 2,
+            '/admin/add/Student/': 1,
+            '/admin/add/Teacher/': 0,
+        })
+
+    def test_edit_query_budget(self):
+        # the instance, its current courses, the course options, the
+        # update and reloading the instance for the flashed message
+        self.assert_query_budget(6, '/admin/edit/Student/1/', 'post',
+                                 data={'name': u'Stewie'})
+
+    def test_no_enctype_without_file_field(self):
+        rv = self.client.get('/admin/add/Course/')
+        assert 'enctype' not in rv.data
+
     def test_index(self):
         rv = self.client.get('/admin/')
         self.assert_200(rv)
 
+    def test_model_nav(self):
+        rv = self.client.get('/admin/')
+        links = ['<li><a href="/admin/list/%s/?page=1">%s</a></li>' % (
+                model_name, model_name.lower())
+                 for model_name in ('Course', 'Student', 'Teacher')]
+        positions = [rv.data.index(link) for link in links]
+        self.assertEqual(positions, sorted(positions))
+
     def test_list(self):
         rv = self.client.get('/admin/list/Student/?page=1')
         self.assert_200(rv)
@@ -80,6 +148,420 @@ class SimpleTest(TestCase):
         assert "Student not found" in rv.data
 
 
+class UnchangedEditTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        app = simple.create_app('sqlite://')
+        teacher = simple.Teacher(name="Mrs. Jones")
+        app.db_session.add(teacher)
+        app.db_session.add(simple.Student(name="Stewart"))
+        app.db_session.add(simple.Course(subject="maths", teacher=teacher))
+        app.db_session.commit()
+        self.datastore = SQLAlchemyDatastore(
+            (simple.Course, simple.Student, simple.Teacher), app.db_session)
+        return app
+
+    def test_unchanged_form_does_not_modify(self):
+        course = self.datastore.find_model_instance('Course', [1])
+        form = self.datastore.get_model_form('Course')(obj=course)
+        self.datastore.update_from_form(course, form)
+        assert not self.app.db_session.is_modified(course)
+
+    def test_unchanged_save_writes_nothing(self):
+        statements = []
+        commits = []
+        engine = self.app.db_session.bind
+        sa.event.listen(engine, 'before_cursor_execute',
+                        lambda conn, cursor, statement, *args:
+                            statements.append(statement))
+        sa.event.listen(engine, 'commit',
+                        lambda conn: commits.append(conn))
+        course = self.datastore.find_model_instance('Course', [1])
+        form = self.datastore.get_model_form('Course')(obj=course)
+        del statements[:]
+        self.datastore.update_from_form(course, form)
+        self.datastore.save_model(course)
+        self.assertEqual(
+            [statement for statement in statements
+             if not statement.lstrip().upper().startswith('SELECT')], [])
+        self.assertEqual(commits, [])
+
+        form.subject.data = u'algebra'
+        self.datastore.update_from_form(course, form)
+        self.datastore.save_model(course)
+        assert any(statement.startswith('UPDATE course')
+                   for statement in statements)
+        self.assertEqual(len(commits), 1)
+
+    def test_changed_form_modifies(self):
+        student = self.datastore.find_model_instance('Student', [1])
+        form = self.datastore.get_model_form('Student')(obj=student)
+        form.name.data = u'Stuart'
+        self.datastore.update_from_form(student, form)
+        assert self.app.db_session.is_modified(student)
+        self.datastore.save_model(student)
+        self.assertEqual(self.app.db_session.query(simple.Student).filter_by(
+                name=u'Stuart').count(), 1)
+
+
+class BatchSaveTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        app = simple.create_app('sqlite://')
+        app.db_session.add(simple.Student(name="Stewart"))
+        app.db_session.commit()
+        self.datastore = SQLAlchemyDatastore(
+            (simple.Course, simple.Student, simple.Teacher), app.db_session)
+        return app
+
+    def test_save_models(self):
+        students = [simple.Student(name="Student%s" % i) for i in range(10)]
+        failed = self.datastore.save_models(students, batch_size=3)
+        self.assertEqual(failed, [])
+        self.assertEqual(
+            self.app.db_session.query(simple.Student).count(), 11)
+
+    def test_save_models_reports_failures(self):
+        duplicate = simple.Student(name="Stewart")
+        students = [simple.Student(name="Mike"), duplicate,
+                    simple.Student(name="Jason"),
+                    simple.Student(name="Greg")]
+        failed = self.datastore.save_models(students, batch_size=3)
+        self.assertEqual([instance for instance, e in failed], [duplicate])
+        self.assertEqual(
+            self.app.db_session.query(simple.Student).count(), 4)
+
+    def test_saved_instances_committed_on_failure(self):
+        # the instances that were saved are committed, not left for
+        # the caller to commit
+        students = [simple.Student(name="Mike"),
+                    simple.Student(name="Stewart")]
+        failed = self.datastore.save_models(students, batch_size=3)
+        self.assertEqual(len(failed), 1)
+        self.app.db_session.rollback()
+        self.assertEqual(self.app.db_session.query(simple.Student).filter_by(
+                name="Mike").count(), 1)
+
+
+class SimpleCacheTest(unittest.TestCase):
+    def create_cache(self):
+        return SimpleCache()
+
+    def setUp(self):
+        self.cache = self.create_cache()
+
+    def test_get_set(self):
+        self.assertEqual(self.cache.get('Student', 'count'), None)
+        self.cache.set('Student', 'count', 3)
+        self.assertEqual(self.cache.get('Student', 'count'), 3)
+        self.assertEqual(self.cache.get('Teacher', 'count'), None)
+
+    def test_invalidate(self):
+        self.cache.set('Student', 'count', 3)
+        self.cache.set('Teacher', 'count', 1)
+        self.cache.invalidate('Student')
+        self.assertEqual(self.cache.get('Student', 'count'), None)
+        self.assertEqual(self.cache.get('Teacher', 'count'), 1)
+
+    def test_timeout(self):
+        self.cache.set('Student', 'count', 3, timeout=-1)
+        self.assertEqual(self.cache.get('Student', 'count'), None)
+
+    def test_get_or_set(self):
+        self.assertEqual(
+            self.cache.get_or_set('Student', 'count', lambda: 3), 3)
+        self.assertEqual(
+            self.cache.get_or_set('Student', 'count', lambda: 4), 3)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_invalidated_while_computing(self):
+        def creator():
+            self.cache.invalidate('Student')
+            return 3
+        self.assertEqual(
+            self.cache.get_or_set('Student', 'count', creator), 3)
+        self.assertEqual(self.cache.get('Student', 'count'), None)
+
+
+class SQLiteCacheTest(SimpleCacheTest):
+    def create_cache(self):
+        return SQLiteCache(os.path.join(self.cache_dir, 'cache.db'))
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        super(SQLiteCacheTest, self).setUp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_shared(self):
+        self.cache.set('Student', 'count', 3)
+        other_cache = self.create_cache()
+        self.assertEqual(other_cache.get('Student', 'count'), 3)
+        other_cache.invalidate('Student')
+        self.assertEqual(self.cache.get('Student', 'count'), None)
+
+
+class CachedCountTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'not secure'
+        engine = sa.create_engine('sqlite://', convert_unicode=True)
+        app.db_session = sa.orm.scoped_session(sa.orm.sessionmaker(
+            autocommit=False, autoflush=False,
+            bind=engine))
+        self.cache = SimpleCache()
+        self.datastore = datastore = SQLAlchemyDatastore(
+            (simple.Course, simple.Student, simple.Teacher), app.db_session)
+        admin_blueprint = admin.create_admin_blueprint(
+            datastore, list_view_pagination=1, cache=self.cache)
+        app.register_blueprint(admin_blueprint, url_prefix='/admin')
+        simple.Base.metadata.create_all(bind=engine)
+        app.db_session.add(simple.Student(name="Stewart"))
+        app.db_session.add(simple.Student(name="Mike"))
+        app.db_session.commit()
+        return app
+
+    def test_count_cached_and_invalidated(self):
+        self.namespace = self.datastore.get_cache_namespace('Student')
+        self.client.get('/admin/list/Student/')
+        self.assertEqual(self.cache.get(self.namespace, 'count'), 2)
+
+        self.client.post('/admin/add/Student/', data=dict(name='Jason'))
+        self.assertEqual(self.cache.get(self.namespace, 'count'), None)
+        rv = self.client.get('/admin/list/Student/')
+        assert '<a href="/admin/list/Student/?page=3">3</a>' in rv.data
+
+        self.client.get('/admin/delete/Student/1/')
+        self.assertEqual(self.cache.get(self.namespace, 'count'), None)
+
+    def test_batch_save_invalidates(self):
+        self.namespace = self.datastore.get_cache_namespace('Student')
+        self.client.get('/admin/list/Student/')
+        self.assertEqual(self.cache.get(self.namespace, 'count'), 2)
+        self.assertEqual(self.datastore.save_models(
+            [simple.Student(name=u'Jason'), simple.Student(name=u'Greg')]),
+            [])
+        self.assertEqual(self.cache.get(self.namespace, 'count'), None)
+        rv = self.client.get('/admin/list/Student/')
+        assert '<a href="/admin/list/Student/?page=4">4</a>' in rv.data
+
+
+    def test_namespaces(self):
+        self.assertEqual(self.datastore.get_cache_namespace('Student'),
+                         u'sqlite://|example.declarative.simple:Student')
+        # another datastore on another database sharing the cache
+        other_datastore = SQLAlchemyDatastore(
+            (simple.Student,), sa.orm.scoped_session(sa.orm.sessionmaker(
+                bind=sa.create_engine('sqlite:///other.db'))))
+        assert other_datastore.get_cache_namespace('Student') != \
+            self.datastore.get_cache_namespace('Student')
+        other_datastore.cache_prefix = u'other'
+        self.assertEqual(other_datastore.get_cache_namespace('Student'),
+                         u'other:Student')
+
+
+class TemplateCacheTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        self.cache_dir = tempfile.mkdtemp()
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'not secure'
+        engine = sa.create_engine('sqlite://', convert_unicode=True)
+        app.db_session = sa.orm.scoped_session(sa.orm.sessionmaker(
+            autocommit=False, autoflush=False,
+            bind=engine))
+        datastore = SQLAlchemyDatastore(
+            (simple.Course, simple.Student, simple.Teacher), app.db_session)
+        admin_blueprint = admin.create_admin_blueprint(
+            datastore, template_cache_dir=self.cache_dir,
+            preload_templates=True)
+        app.register_blueprint(admin_blueprint, url_prefix='/admin')
+        simple.Base.metadata.create_all(bind=engine)
+        return app
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_templates_preloaded(self):
+        assert 'admin/list.html' in templating.list_admin_templates()
+        self.assertEqual(len(os.listdir(self.cache_dir)),
+                         len(templating.list_admin_templates()))
+        rv = self.client.get('/admin/list/Student/')
+        self.assert_200(rv)
+
+    def test_precompile_templates(self):
+        cache_dir = os.path.join(self.cache_dir, 'precompiled')
+        template_names = templating.precompile_templates(cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), len(template_names))
+        # the precompiled templates are found under the same keys as
+        # the ones compiled by the app
+        app_cache_files = [filename for filename in os.listdir(self.cache_dir)
+                           if filename != 'precompiled']
+        self.assertEqual(sorted(os.listdir(cache_dir)),
+                         sorted(app_cache_files))
+
+
+class AssetBundleTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        self.bundle_folder = tempfile.mkdtemp()
+        self.manifest = assets.build_bundles(output_folder=self.bundle_folder)
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'not secure'
+        app.db_session = sa.orm.scoped_session(sa.orm.sessionmaker(
+            bind=sa.create_engine('sqlite://')))
+        datastore = SQLAlchemyDatastore(
+            (simple.Course, simple.Student, simple.Teacher), app.db_session)
+        admin_blueprint = admin.create_admin_blueprint(
+            datastore, asset_bundle_folder=self.bundle_folder)
+        app.register_blueprint(admin_blueprint, url_prefix='/admin')
+        return app
+
+    def tearDown(self):
+        shutil.rmtree(self.bundle_folder)
+
+    def test_build_bundles(self):
+        self.assertEqual(sorted(self.manifest), ['admin.css', 'admin.js'])
+        # building again gives the same files
+        self.assertEqual(assets.build_bundles(output_folder=self.bundle_folder),
+                         self.manifest)
+        self.assertEqual(len(os.listdir(self.bundle_folder)), 5)
+        css = open(os.path.join(self.bundle_folder,
+                                self.manifest['admin.css'])).read()
+        assert "url('../img/glyphicons-halflings.png')" in css
+        assert "url('../css/Aristo/images/icon_sprite.png')" in css
+        # the header font is only used if it is installed locally
+        assert "local('Vollkorn')" in css
+        assert 'googleapis' not in css
+
+    def test_bundles_in_page(self):
+        rv = self.client.get('/admin/')
+        self.assert_200(rv)
+        for filename in self.manifest.values():
+            assert '/admin/static/bundles/' + filename in rv.data
+        assert 'googleapis' not in rv.data
+        assert 'js/admin.js' not in rv.data
+
+    def test_serve_bundle(self):
+        url = '/admin/static/bundles/' + self.manifest['admin.css']
+        rv = self.client.get(url)
+        self.assert_200(rv)
+        self.assertEqual(rv.mimetype, 'text/css')
+        assert 'Content-Encoding' not in rv.headers
+        self.assertEqual(rv.cache_control.max_age, 365 * 24 * 60 * 60)
+        plain = rv.data
+
+        rv = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assert_200(rv)
+        self.assertEqual(rv.headers['Content-Encoding'], 'gzip')
+        assert 'Accept-Encoding' in rv.headers['Vary']
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(rv.data)).read(),
+                         plain)
+
+        rv = self.client.get('/admin/static/bundles/manifest.json')
+        self.assert_404(rv)
+        rv = self.client.get('/admin/static/css/style.css')
+        self.assert_200(rv)
+
+
+class CompressionTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'not secure'
+        app.db_session = sa.orm.scoped_session(sa.orm.sessionmaker(
+            bind=sa.create_engine('sqlite://')))
+        datastore = SQLAlchemyDatastore(
+            (simple.Course, simple.Student, simple.Teacher), app.db_session)
+        admin_blueprint = admin.create_admin_blueprint(
+            datastore, compress_responses=True, compress_level=9)
+        app.register_blueprint(admin_blueprint, url_prefix='/admin')
+        return app
+
+    def test_gzip(self):
+        plain = self.client.get('/admin/')
+        self.assert_200(plain)
+        assert 'Content-Encoding' not in plain.headers
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+
+        rv = self.client.get('/admin/', headers={
+            'Accept-Encoding': 'gzip, deflate'})
+        self.assert_200(rv)
+        self.assertEqual(rv.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(int(rv.headers['Content-Length']), len(rv.data))
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(rv.data)).read(),
+                         plain.data)
+
+    def test_deflate(self):
+        plain = self.client.get('/admin/')
+        rv = self.client.get('/admin/', headers={
+            'Accept-Encoding': 'gzip;q=0, deflate'})
+        self.assertEqual(rv.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(rv.data), plain.data)
+
+    def test_min_size(self):
+        rv = self.client.get('/admin/list/Nonexistent/', headers={
+            'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in rv.headers
+
+    def test_static_files_not_compressed(self):
+        rv = self.client.get('/admin/static/css/style.css', headers={
+            'Accept-Encoding': 'gzip'})
+        self.assert_200(rv)
+        assert 'Content-Encoding' not in rv.headers
+
+    def test_streamed_response(self):
+        def generate():
+            for i in range(100):
+                yield u'<p>row %d</p>\n' % i
+
+        with self.app.test_request_context(
+                headers={'Accept-Encoding': 'gzip'}):
+            response = compression.compress_response(
+                Response(generate(), mimetype='text/html'))
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            assert response.is_streamed
+            chunks = list(response.iter_encoded())
+
+        # every row is flushed as it is generated
+        self.assertEqual(len(chunks), 101)
+        self.assertEqual(
+            gzip.GzipFile(fileobj=StringIO(''.join(chunks))).read(),
+            ''.join(['<p>row %d</p>\n' % i for i in range(100)]))
+
+
+class ImportTest(unittest.TestCase):
+    def test_no_orm_imported(self):
+        output = subprocess.Popen(
+            [sys.executable, '-c',
+             'import sys, flask_admin; print(" ".join(sys.modules))'],
+            stdout=subprocess.PIPE).communicate()[0]
+        modules = set(output.split())
+        assert 'flask_admin' in modules
+        for module in ('sqlalchemy', 'mongoalchemy', 'pymongo', 'sqlite3'):
+            assert module not in modules, module
+
+    def test_converter_registry(self):
+        from flask.ext.admin.datastore.sqlalchemy import AdminConverter
+        converter = AdminConverter(None)
+        self.assertEqual(AdminConverter._converter_registry['Date'],
+                         'conv_Date')
+        self.assertEqual(converter.converters['Date'], converter.conv_Date)
+        # inherited converters are registered too
+        assert 'String' in converter.converters
+        other_converter = AdminConverter(None)
+        self.assertEqual(other_converter.converters['Date'],
+                         other_converter.conv_Date)
+
+
 class MultipleTest(TestCase):
     TESTING = True
 
@@ -207,7 +689,7 @@ class FlaskSQLAlchemyExampleTest(TestCase):
         self.assert_200(rv)
 
 
-class FlaskSQLAlchemyMultiPKsTest(TestCase):
+class FlaskSQLAlchemyMultiPKsTest(QueryBudgetMixin, TestCase):
     TESTING = True
 
     def create_app(self):
@@ -252,9 +734,24 @@ class FlaskSQLAlchemyMultiPKsTest(TestCase):
         rv = self.client.get('/admin/list/Asset/?page=1')
         self.assert_200(rv)
 
+    def test_query_budgets(self):
+        self.assert_query_budgets({
+            '/admin/': 0,
+            '/admin/list/Address/': 2,
+            '/admin/list/Asset/': 2,
+            '/admin/list/Location/': 2,
+            '/admin/edit/Address/K2/': 1,
+            '/admin/edit/Asset/1/': 3,
+            '/admin/edit/Location/K2/2.01/left%20side/': 3,
+            '/admin/add/Asset/': 1,
+            '/admin/add/Location/': 1,
+        })
+
     def test_list_location(self):
         rv = self.client.get('/admin/list/Location/')
         self.assert_200(rv)
+        assert 'href="/admin/edit/Location/K2/2.01/left%20side/"' in rv.data
+        assert 'href="/admin/delete/Location/K2/2.01/left%20side/"' in rv.data
 
     def test_view_location(self):
         rv = self.client.get('/admin/edit/Location/K2/2.01/left%20side/')
@@ -375,6 +872,22 @@ class FileFieldTest(TestCase):
         rv = self.client.get('/admin/edit/TestModel/1/')
         assert 'enctype="multipart/form-data"' in rv.data
 
+    def test_has_file_field_computed_once(self):
+        form_class = test.filefield.FileForm
+        assert '_has_file_field' in form_class.__dict__
+        assert form_class._has_file_field
+
+        class SubForm(form_class):
+            name = TextField()
+
+        class PlainForm(Form):
+            name = TextField()
+
+        assert has_file_field(SubForm)
+        assert not has_file_field(PlainForm)
+        assert not has_file_field(PlainForm())
+        self.assertEqual(PlainForm.__dict__['_has_file_field'], False)
+
 
 class DeprecationTest(TestCase):
     """test that the old deprecated method of calling
@@ -391,7 +904,1164 @@ class DeprecationTest(TestCase):
         self.assert_200(rv)
 
 
-class MASimpleTest(TestCase):
+class MemoryDatastoreTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        app = test.memory_datastore.create_app()
+        app.datastore.save_models(
+            [test.memory_datastore.Student(name=name)
+             for name in (u'Stewart', u'Mike', u'Jason')])
+        app.datastore.save_model(
+            test.memory_datastore.Location(building=u'K2', room=u''))
+        return app
+
+    def test_index(self):
+        rv = self.client.get('/admin/')
+        self.assert_200(rv)
+
+    def test_list(self):
+        rv = self.client.get('/admin/list/Student/?page=1')
+        self.assert_200(rv)
+        assert 'Stewart' in rv.data
+        assert '/admin/edit/Student/3/' in rv.data
+
+    def test_add(self):
+        rv = self.client.post('/admin/add/Student/',
+                              data=dict(name=u'Greg', enrolled='2012-03-01'))
+        self.assert_redirects(rv, '/admin/list/Student/')
+        student = self.app.datastore.find_model_instance('Student', [u'4'])
+        self.assertEqual(student.name, u'Greg')
+        self.assertEqual(student.enrolled, datetime(2012, 3, 1).date())
+
+    def test_add_invalid(self):
+        rv = self.client.post('/admin/add/Student/', data=dict(name=u''))
+        self.assert_200(rv)
+        self.assertEqual(len(self.app.datastore.tables['Student']), 3)
+
+    def test_edit(self):
+        rv = self.client.post('/admin/edit/Student/2/',
+                              data=dict(name=u'Michael'))
+        self.assert_redirects(rv, '/admin/list/Student/')
+        student = self.app.datastore.find_model_instance('Student', [u'2'])
+        self.assertEqual(student.name, u'Michael')
+
+    def test_edit_composite_key(self):
+        rv = self.client.get('/admin/edit/Location/K2/%1A/')
+        assert 'edit-form' in rv.data
+
+    def test_list_urls_match_url_for(self):
+        self.app.datastore.save_model(test.memory_datastore.Location(
+                building=u'K 2?#\xe4', room=u'1%'))
+        rv = self.client.get('/admin/list/Location/')
+        with self.app.test_request_context():
+            for model_url_key in (u'K2/\x1a', u'K 2?#\xe4/1%'):
+                for endpoint in ('admin.edit', 'admin.delete'):
+                    url = url_for(endpoint, model_name='Location',
+                                  model_url_key=model_url_key)
+                    assert 'href="%s"' % url in rv.data
+
+    def test_delete(self):
+        rv = self.client.get('/admin/delete/Student/2/')
+        self.assert_redirects(rv, '/admin/list/Student/')
+        self.assertEqual(len(self.app.datastore.tables['Student']), 2)
+
+        rv = self.client.get('/admin/delete/Student/2/')
+        assert "Student not found" in rv.data
+
+    def test_models_module(self):
+        # imported classes, including builtin ones, aren't models and
+        # aren't touched
+        models = types.ModuleType('models')
+        models.Flask = Flask
+        models.date = date
+        models.Model = memory.Model
+        models.Student = test.memory_datastore.Student
+        datastore = memory.InMemoryDatastore(models)
+        self.assertEqual(datastore.list_model_names(), ['Student'])
+        assert '_memory_fields' not in Flask.__dict__
+
+class MemoryDatastorePaginationTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        app = test.memory_datastore.create_app(pagination=25)
+        app.datastore.save_models(
+            [test.memory_datastore.Student(name=u'Student%s' % i)
+             for i in range(10000)])
+        return app
+
+    def test_last_page(self):
+        rv = self.client.get('/admin/list/Student/?page=400')
+        assert 'Student9999' in rv.data
+        assert 'Student9974' not in rv.data
+
+    def test_pager(self):
+        rv = self.client.get('/admin/list/Student/?page=2')
+        assert '<a href="/admin/list/Student/?page=3">></a>' in rv.data
+        assert '<a href="/admin/list/Student/?page=1"><</a>' in rv.data
+
+
+class StreamingListTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        app = test.memory_datastore.create_app(
+            pagination=500, stream_list_view=True)
+        app.datastore.save_models(
+            [test.memory_datastore.Student(name=u'Student%s' % i)
+             for i in range(1000)])
+        return app
+
+    def test_same_as_buffered(self):
+        rv = self.client.get('/admin/list/Student/?page=2')
+        self.assert_200(rv)
+        assert 'Student999' in rv.data
+        assert 'Student499' not in rv.data
+
+        buffered_app = test.memory_datastore.create_app(pagination=500)
+        buffered_app.datastore.tables = self.app.datastore.tables
+        buffered_rv = buffered_app.test_client().get(
+            '/admin/list/Student/?page=2')
+        self.assertEqual(rv.data, buffered_rv.data)
+
+    def test_streamed_in_chunks(self):
+        rv = self.client.get('/admin/list/Student/', buffered=False)
+        assert rv.is_streamed
+        chunks = list(rv.response)
+        rv.close()
+        assert len(chunks) > 10
+        # the page header is sent before the rows are rendered
+        assert '<table' in ''.join(chunks[:2])
+        assert 'Student499' not in ''.join(chunks[:2])
+        assert 'Student499' in ''.join(chunks)
+
+
+class InfiniteScrollTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        app = test.memory_datastore.create_app(
+            pagination=10, infinite_scroll=True)
+        app.datastore.save_models(
+            [test.memory_datastore.Student(name=u'Student%s' % i)
+             for i in range(25)])
+        return app
+
+    def test_list(self):
+        rv = self.client.get('/admin/list/Student/')
+        assert 'class="table table-condensed table-striped infinite-scroll"' \
+            in rv.data
+        assert 'data-next-url="/admin/list/Student/rows/?page=2"' in rv.data
+        # the pager is still there for browsers without javascript
+        assert '<a href="/admin/list/Student/?page=2">' in rv.data
+
+        rv = self.client.get('/admin/list/Student/?page=3')
+        assert 'data-next-url' not in rv.data
+
+    def test_rows(self):
+        rv = self.client.get('/admin/list/Student/rows/?page=2')
+        self.assert_200(rv)
+        self.assertEqual(rv.json['page'], 2)
+        self.assertEqual(rv.json['next_url'], '/admin/list/Student/rows/?page=3')
+        self.assertEqual(rv.json['html'].count('<tr class="listed">'), 10)
+        assert 'Student10' in rv.json['html']
+        assert 'Student9<' not in rv.json['html']
+        assert '<a class="edit-link" href="/admin/edit/Student/11/">' \
+            in rv.json['html']
+
+        rv = self.client.get('/admin/list/Student/rows/?page=3')
+        self.assertEqual(rv.json['html'].count('<tr class="listed">'), 5)
+        self.assertEqual(rv.json['next_url'], None)
+
+    def test_rows_match_list(self):
+        rv = self.client.get('/admin/list/Student/rows/?page=1')
+        list_rv = self.client.get('/admin/list/Student/?page=1')
+        assert rv.json['html'].strip() in list_rv.data.decode('utf-8')
+
+
+class PerPageTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        app = test.memory_datastore.create_app(
+            pagination=10, model_list_view_pagination={'Location': 3},
+            max_list_view_pagination=50, infinite_scroll=True)
+        app.datastore.save_models(
+            [test.memory_datastore.Student(name=u'Student%s' % i)
+             for i in range(100)])
+        app.datastore.save_models(
+            [test.memory_datastore.Location(building=u'Main', room=unicode(i))
+             for i in range(10)])
+        return app
+
+    def test_model_default(self):
+        rv = self.client.get('/admin/list/Student/')
+        self.assertEqual(rv.data.count('<tr class="listed">'), 10)
+        assert '<a href="/admin/list/Student/?page=2">' in rv.data
+        rv = self.client.get('/admin/list/Location/')
+        self.assertEqual(rv.data.count('<tr class="listed">'), 3)
+
+    def test_per_page(self):
+        rv = self.client.get('/admin/list/Student/?per_page=20')
+        self.assertEqual(rv.data.count('<tr class="listed">'), 20)
+        # the pager and the next page of rows keep the page size
+        assert '<a href="/admin/list/Student/?per_page=20&amp;page=2">' \
+            in rv.data
+        assert 'per_page=20' in rv.data.split('data-next-url=')[1][:80]
+
+        rv = self.client.get('/admin/list/Student/rows/?per_page=20&page=2')
+        self.assertEqual(rv.json['html'].count('<tr class="listed">'), 20)
+        assert 'per_page=20' in rv.json['next_url']
+
+    def test_max_per_page(self):
+        rv = self.client.get('/admin/list/Student/?per_page=1000000')
+        self.assertEqual(rv.data.count('<tr class="listed">'), 50)
+        rv = self.client.get('/admin/list/Student/rows/?per_page=1000000')
+        self.assertEqual(rv.json['html'].count('<tr class="listed">'), 50)
+
+    def test_invalid_per_page(self):
+        for per_page in ('0', '-5', 'all'):
+            rv = self.client.get('/admin/list/Student/?per_page=' + per_page)
+            self.assertEqual(rv.data.count('<tr class="listed">'), 10)
+
+
+def require_auth_header(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if 'X-Auth' not in request.headers:
+            abort(403)
+        return f(*args, **kwargs)
+    return wrapper
+
+
+class ProfilingTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        self.profile_dir = tempfile.mkdtemp()
+        app = test.memory_datastore.create_app(
+            profile_dir=self.profile_dir, view_decorator=require_auth_header)
+        app.config['ADMIN_PROFILING'] = True
+        app.datastore.save_models(
+            [test.memory_datastore.Student(name=u'Student%s' % i)
+             for i in range(10)])
+        return app
+
+    def tearDown(self):
+        shutil.rmtree(self.profile_dir)
+
+    def test_profile(self):
+        # compile the templates first, so they don't dominate the profile
+        self.client.get('/admin/list/Student/', headers={'X-Auth': '1'})
+        rv = self.client.get('/admin/list/Student/?_profile=1',
+                             headers={'X-Auth': '1'})
+        self.assert_200(rv)
+        assert 'Student9' in rv.data
+        profile_id = rv.headers['X-Admin-Profile-Id']
+        self.assertEqual(rv.headers['X-Admin-Profile-Url'],
+                         '/admin/profile/%s/' % profile_id)
+        self.assertEqual(os.listdir(self.profile_dir),
+                         [profile_id + '.prof'])
+
+        rv = self.client.get('/admin/profile/%s/' % profile_id,
+                             headers={'X-Auth': '1'})
+        self.assert_200(rv)
+        assert 'list_view' in rv.data
+        assert 'flask_admin/datastore/memory.py' in rv.data
+        assert '<strong>cumulative</strong>' in rv.data
+
+        rv = self.client.get('/admin/profile/%s/?sort=time' % profile_id,
+                             headers={'X-Auth': '1'})
+        self.assert_200(rv)
+        assert '<strong>time</strong>' in rv.data
+
+    def test_profile_header(self):
+        rv = self.client.get('/admin/add/Student/', headers={
+                'X-Auth': '1', 'X-Admin-Profile': '1'})
+        self.assert_200(rv)
+        assert 'X-Admin-Profile-Id' in rv.headers
+
+    def test_not_requested(self):
+        rv = self.client.get('/admin/list/Student/', headers={'X-Auth': '1'})
+        self.assert_200(rv)
+        assert 'X-Admin-Profile-Id' not in rv.headers
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_disabled_by_config(self):
+        self.app.config['ADMIN_PROFILING'] = False
+        rv = self.client.get('/admin/list/Student/?_profile=1',
+                             headers={'X-Auth': '1'})
+        self.assert_200(rv)
+        assert 'X-Admin-Profile-Id' not in rv.headers
+
+    def test_view_decorator(self):
+        rv = self.client.get('/admin/list/Student/?_profile=1')
+        self.assert_403(rv)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+        rv = self.client.get('/admin/list/Student/?_profile=1',
+                             headers={'X-Auth': '1'})
+        profile_url = rv.headers['X-Admin-Profile-Url']
+        self.assert_403(self.client.get(profile_url))
+
+    def test_unknown_profile(self):
+        for profile_id in ('0' * 32, '..', 'x' * 32):
+            rv = self.client.get('/admin/profile/%s/' % profile_id,
+                                 headers={'X-Auth': '1'})
+            self.assert_404(rv)
+
+
+class SlowLogTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.slow_log = SlowLog(os.path.join(self.log_dir, 'slow.log'),
+                                threshold=0,
+                                thresholds={'update_from_form': 60})
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'not secure'
+        engine = sa.create_engine('sqlite://')
+        app.db_session = sa.orm.scoped_session(sa.orm.sessionmaker(
+            autocommit=False, autoflush=False, bind=engine))
+        datastore = SQLAlchemyDatastore(
+            (simple.Course, simple.Student, simple.Teacher), app.db_session)
+        admin_blueprint = admin.create_admin_blueprint(
+            datastore, slow_log=self.slow_log)
+        app.register_blueprint(admin_blueprint, url_prefix='/admin')
+        simple.Base.metadata.create_all(bind=engine)
+        datastore.save_models([simple.Student(name=u'Student%s' % i)
+                               for i in range(5)])
+        return app
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+    def test_logged_operations(self):
+        self.client.get('/admin/list/Student/?page=1')
+        self.client.get('/admin/list/Student/?page=1')
+        self.client.post('/admin/edit/Student/1/',
+                         data={'name': u'Renamed'})
+
+        records = list(self.slow_log.read_records())
+        self.assertEqual(
+            [record['operation'] for record in records],
+            ['create_model_pagination', 'create_model_pagination',
+             'find_model_instance', 'save_model'])
+        pagination = records[0]
+        self.assertEqual(pagination['model'], 'Student')
+        self.assertEqual((pagination['page'], pagination['per_page']),
+                         (1, 25))
+        assert any('FROM student' in query
+                   for query in pagination['queries'])
+        self.assertEqual(records[2]['keys'], ['1'])
+        self.assertEqual(records[3]['keys'], ['1'])
+        assert any(query.startswith('UPDATE student')
+                   for query in records[3]['queries'])
+
+    def test_slow_page(self):
+        self.client.get('/admin/list/Student/')
+        self.client.get('/admin/list/Student/')
+        self.client.get('/admin/edit/Student/1/')
+        offenders = self.slow_log.worst_offenders()
+        self.assertEqual(
+            sorted([(offender['model'], offender['operation'],
+                     offender['count']) for offender in offenders]),
+            [('Student', 'create_model_pagination', 2),
+             ('Student', 'find_model_instance', 1)])
+
+        rv = self.client.get('/admin/slow/')
+        self.assert_200(rv)
+        assert 'create_model_pagination' in rv.data
+        assert 'FROM student' in rv.data
+
+    def test_threshold(self):
+        self.slow_log.threshold = 60
+        self.client.get('/admin/list/Student/')
+        self.assertEqual(list(self.slow_log.read_records()), [])
+        rv = self.client.get('/admin/slow/')
+        assert 'No datastore operation has been slow' in rv.data
+
+    def test_rotation(self):
+        slow_log = SlowLog(os.path.join(self.log_dir, 'rotated.log'),
+                           threshold=0, max_bytes=200, backup_count=2)
+        for i in range(20):
+            slow_log.log('find_model_instance', 'Student', 0.1 * i,
+                         keys=[i])
+        assert os.path.exists(slow_log.path + '.2')
+        assert not os.path.exists(slow_log.path + '.3')
+        records = list(slow_log.read_records())
+        self.assertEqual(records[-1]['keys'], ['19'])
+        offender, = slow_log.worst_offenders()
+        self.assertEqual(offender['count'], len(records))
+        self.assertEqual(offender['slowest']['keys'], ['19'])
+
+    def test_external_rotation(self):
+        path = os.path.join(self.log_dir, 'shared.log')
+        slow_log = SlowLog(path, threshold=0, max_bytes=None)
+        slow_log.log('find_model_instance', 'Student', 0.1, keys=[1])
+        os.rename(path, path + '.1')
+        slow_log.log('find_model_instance', 'Student', 0.2, keys=[2])
+        self.assertEqual(len(open(path).readlines()), 1)
+        self.assertEqual([record['keys'] for record in
+                          slow_log.read_records()], [['1'], ['2']])
+
+    def test_only_own_engine_listened(self):
+        engine = sa.create_engine('sqlite://')
+        other_engine = sa.create_engine('sqlite://')
+        db_session = sa.orm.scoped_session(sa.orm.sessionmaker(bind=engine))
+        datastore = SQLAlchemyDatastore((simple.Student,), db_session)
+        # nothing is listened to until queries are captured
+        assert engine not in sqlalchemy_datastore._listened_engines
+
+        with util.capture_queries() as queries:
+            db_session.execute('SELECT 1')
+            other_engine.execute('SELECT 2')
+        self.assertEqual(queries, ['SELECT 1'])
+        assert engine in sqlalchemy_datastore._listened_engines
+        assert other_engine not in sqlalchemy_datastore._listened_engines
+
+    def test_uncaptured_datastore_collected(self):
+        db_session = sa.orm.scoped_session(sa.orm.sessionmaker(
+            bind=sa.create_engine('sqlite://')))
+        datastore = weakref.ref(
+            SQLAlchemyDatastore((simple.Student,), db_session))
+        gc.collect()
+        self.assertEqual(datastore(), None)
+        hooks = len(util._capture_hooks)
+        with util.capture_queries():
+            pass
+        # the hook of the collected datastore is dropped
+        assert len(util._capture_hooks) < hooks
+
+
+class MetricsTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.metrics = Metrics(multiprocess_dir=self.metrics_dir,
+                               buckets=(0.5, 60))
+        app = test.memory_datastore.create_app(
+            pagination=4, cache=SimpleCache(), metrics=self.metrics,
+            stream_list_view=True)
+        app.datastore.save_models(
+            [test.memory_datastore.Student(name=u'Student%s' % i)
+             for i in range(10)])
+        return app
+
+    def tearDown(self):
+        shutil.rmtree(self.metrics_dir)
+
+    def test_metrics(self):
+        self.client.get('/admin/')
+        # the list pages are streamed, so their rows are rendered as
+        # the data is read
+        self.client.get('/admin/list/Student/').data
+        self.client.get('/admin/list/Student/?page=3').data
+        self.client.get('/admin/edit/Student/1/')
+        self.client.get('/admin/list/Nothing/')
+        # the in-memory datastore doesn't use the cache itself
+        cache = self.app.datastore.cache
+        cache.get_or_set('Student', 'count', lambda: 10)
+        cache.get_or_set('Student', 'count', lambda: 10)
+
+        rv = self.client.get('/admin/metrics')
+        self.assert_200(rv)
+        self.assertEqual(rv.mimetype, 'text/plain')
+        lines = rv.data.splitlines()
+        for line in [
+            '# TYPE flask_admin_request_duration_seconds histogram',
+            'flask_admin_request_duration_seconds_bucket'
+            '{endpoint="list",model="Student",le="60.0"} 2',
+            'flask_admin_request_duration_seconds_bucket'
+            '{endpoint="list",model="Student",le="+Inf"} 2',
+            'flask_admin_request_duration_seconds_count'
+            '{endpoint="list",model="Student"} 2',
+            'flask_admin_request_duration_seconds_count'
+            '{endpoint="list",model=""} 1',
+            'flask_admin_request_duration_seconds_count'
+            '{endpoint="index",model=""} 1',
+            'flask_admin_request_duration_seconds_count'
+            '{endpoint="edit",model="Student"} 1',
+            'flask_admin_datastore_calls_total'
+            '{model="Student",operation="create_model_pagination"} 2',
+            'flask_admin_datastore_calls_total'
+            '{model="Student",operation="find_model_instance"} 1',
+            'flask_admin_rows_rendered_total{model="Student"} 6',
+            'flask_admin_cache_lookups_total{result="hit"} 1',
+            'flask_admin_cache_lookups_total{result="miss"} 1',
+            'flask_admin_cache_hit_ratio 0.5',
+        ]:
+            assert line in lines, line
+        assert 'endpoint="metrics"' not in rv.data
+
+    def test_multiprocess(self):
+        self.client.get('/admin/')
+        self.metrics.flush()
+        # a file written by another worker process, which is running
+        other_path = os.path.join(self.metrics_dir, 'metrics-1-other.json')
+        shutil.copy(self.metrics._process_path(), other_path)
+        rv = self.client.get('/admin/metrics')
+        assert 'flask_admin_request_duration_seconds_count'\
+            '{endpoint="index",model=""} 2' in rv.data.splitlines()
+        assert os.path.exists(other_path)
+
+    def test_dead_processes_merged(self):
+        self.client.get('/admin/')
+        self.metrics.flush()
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        # two workers that had the same pid, which has exited now
+        for token in ('first', 'second'):
+            shutil.copy(self.metrics._process_path(), os.path.join(
+                self.metrics_dir, 'metrics-%d-%s.json' % (process.pid,
+                                                          token)))
+        line = 'flask_admin_request_duration_seconds_count'\
+            '{endpoint="index",model=""} 3'
+        for i in range(2):
+            rv = self.client.get('/admin/metrics')
+            assert line in rv.data.splitlines()
+        self.assertEqual(sorted(os.listdir(self.metrics_dir)), [
+            os.path.basename(self.metrics._process_path()),
+            'totals.json', 'totals.lock'])
+
+    def test_threads(self):
+        def record():
+            for i in range(100):
+                self.metrics.inc('rows_rendered_total', (('model', 'x'),))
+        threads = [threading.Thread(target=record) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counters = self.metrics.snapshot()['counters']
+        self.assertEqual(
+            counters[('rows_rendered_total', (('model', 'x'),))], 400)
+        # the aggregates of the threads that exited were folded
+        assert all(aggregate.thread_alive()
+                   for aggregate in self.metrics._aggregates)
+        self.metrics.inc('rows_rendered_total', (('model', 'x'),))
+        counters = self.metrics.snapshot()['counters']
+        self.assertEqual(
+            counters[('rows_rendered_total', (('model', 'x'),))], 401)
+
+
+class TracingTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        self.trace_dir = tempfile.mkdtemp()
+        self.exporter = FileExporter(os.path.join(self.trace_dir,
+                                                  'traces.log'))
+        app = test.memory_datastore.create_app(
+            tracer=Tracer(self.exporter), view_decorator=require_auth_header)
+        app.datastore.save_models(
+            [test.memory_datastore.Student(name=u'Student%s' % i)
+             for i in range(10)])
+        return app
+
+    def tearDown(self):
+        shutil.rmtree(self.trace_dir)
+
+    def get_span_tree(self, trace):
+        names = dict((span['span_id'], span['name'])
+                     for span in trace['spans'])
+        return [(names.get(span['parent_id']), span['name'])
+                for span in trace['spans']]
+
+    def test_edit(self):
+        self.client.post('/admin/edit/Student/1/', data={'name': u'x'},
+                         headers={'X-Auth': '1'})
+        trace, = self.exporter.read_traces()
+        self.assertEqual(self.get_span_tree(trace), [
+            (None, 'request'),
+            ('request', 'view'),
+            ('view', 'datastore.find_model_instance'),
+            ('view', 'form.create'),
+            ('view', 'form.validate'),
+            ('view', 'datastore.update_from_form'),
+            ('view', 'datastore.save_model'),
+        ])
+        spans = trace['spans']
+        self.assertEqual(spans[0]['attributes'], {
+            'endpoint': 'admin.edit', 'model_name': 'Student',
+            'model_url_key': '1'})
+        self.assertEqual(spans[2]['attributes'],
+                         {'model': 'Student', 'keys': '1'})
+        self.assertEqual(spans[5]['attributes'],
+                         {'model': 'Student', 'keys': '1'})
+        self.assertEqual(spans[6]['attributes'],
+                         {'model': 'Student', 'keys': '1'})
+        assert len(set(span['trace_id'] for span in spans)) == 1
+        assert 'datastore.save_model' in format_waterfall(trace)
+
+    def test_add(self):
+        self.client.post('/admin/add/Student/', data={'name': u'x'},
+                         headers={'X-Auth': '1'})
+        trace, = self.exporter.read_traces()
+        spans = dict((span['name'], span) for span in trace['spans'])
+        # the new instance has no keys until it is saved
+        self.assertEqual(spans['datastore.update_from_form']['attributes'],
+                         {'model': 'Student'})
+        self.assertEqual(spans['datastore.save_model']['attributes'],
+                         {'model': 'Student', 'keys': '11'})
+
+    def test_list(self):
+        self.client.get('/admin/list/Student/?page=2',
+                        headers={'X-Auth': '1'})
+        trace, = self.exporter.read_traces()
+        self.assertEqual(self.get_span_tree(trace), [
+            (None, 'request'),
+            ('request', 'view'),
+            ('view', 'datastore.create_model_pagination'),
+            ('view', 'template.render'),
+        ])
+        self.assertEqual(trace['spans'][2]['attributes'],
+                         {'model': 'Student', 'page': 2, 'per_page': 25})
+
+    def test_view_decorator_traced(self):
+        self.client.get('/admin/list/Student/')
+        trace, = self.exporter.read_traces()
+        self.assertEqual(self.get_span_tree(trace), [(None, 'request')])
+        self.assertEqual(trace['spans'][0]['attributes']['error'],
+                         'Forbidden')
+
+    def test_min_duration(self):
+        self.exporter.min_duration = 60
+        self.client.get('/admin/list/Student/', headers={'X-Auth': '1'})
+        self.assertEqual(list(self.exporter.read_traces()), [])
+
+
+class RelationshipQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """The number of queries of the views shouldn't depend on the
+    number of rows or related instances.
+    """
+    TESTING = True
+
+    def create_app(self):
+        app = simple.create_app('sqlite://')
+        teachers = [simple.Teacher(name=u'Teacher%s' % i) for i in range(5)]
+        students = [simple.Student(name=u'Student%s' % i)
+                    for i in range(50)]
+        for i in range(50):
+            course = simple.Course(subject=u'Course%s' % i,
+                                   teacher=teachers[i % 5])
+            course.students.extend(students[i:i + 10])
+            app.db_session.add(course)
+        app.db_session.commit()
+        return app
+
+    def test_list(self):
+        for per_page in (5, 50):
+            for model_name in ('Course', 'Student', 'Teacher'):
+                rv = self.assert_query_budget(
+                    2, '/admin/list/%s/?per_page=%s' % (model_name, per_page))
+                self.assert_200(rv)
+
+    def test_list_rows(self):
+        for per_page in (5, 50):
+            rv = self.assert_query_budget(
+                2, '/admin/list/Course/rows/?per_page=%s' % per_page)
+            self.assert_200(rv)
+
+    def test_edit(self):
+        self.assert_query_budgets({
+            '/admin/edit/Course/1/': 5,
+            '/admin/edit/Student/10/': 3,
+            '/admin/edit/Teacher/1/': 1,
+        })
+
+
+class ReadTimeoutTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        return test.large_table.create_app(
+            'sqlite://', read_timeouts={'count': 0})
+
+    def test_count_timeout(self):
+        rv = self.client.get('/admin/list/Reading/?page=3')
+        self.assert_200(rv)
+        self.assertEqual(rv.data.count('class="listed"'), 25)
+        assert 'Reading0050' in rv.data
+        assert 'Counting the rows took too long' in rv.data
+        # without a count, the pager can't link to the last page
+        assert 'page=4' in rv.data
+        assert 'page=120' not in rv.data
+
+    def test_count_timeout_cached(self):
+        datastore = self.app.datastore
+        datastore.cache = SimpleCache()
+        pagination = datastore.create_model_pagination('Reading', 1)
+        self.assertEqual(pagination.total, None)
+        # the count isn't tried again while the timeout is cached
+        datastore.read_timeouts = {}
+        with util.capture_queries() as queries:
+            pagination = datastore.create_model_pagination('Reading', 1)
+        self.assertEqual(pagination.total, None)
+        assert not any('count(' in query for query in queries)
+
+        datastore.cache.invalidate(datastore.get_cache_namespace('Reading'))
+        pagination = datastore.create_model_pagination('Reading', 1)
+        self.assertEqual(pagination.total, 3000)
+
+    def test_count_timeout_last_page(self):
+        pagination = self.app.datastore.create_model_pagination(
+            'Reading', 120)
+        self.assertEqual(pagination.total, None)
+        self.assertEqual(len(pagination.items), 25)
+        self.assertFalse(pagination.has_next)
+        self.assertEqual(pagination.pages, 120)
+
+        pagination = self.app.datastore.create_model_pagination(
+            'Reading', 119)
+        self.assertTrue(pagination.has_next)
+        self.assertEqual(pagination.next_num, 120)
+
+    def test_page_timeout(self):
+        datastore = self.app.datastore
+        datastore.read_timeouts = {('Reading', 'list'): 0}
+        pagination = datastore.create_model_pagination('Reading', 100)
+        self.assertEqual(pagination.total, 3000)
+        self.assertEqual(pagination.items, [])
+        assert 'took too long' in pagination.warning
+
+        rv = self.client.get('/admin/list/Reading/?page=100')
+        self.assert_200(rv)
+        assert 'Loading this page took too long' in rv.data
+
+    def test_streamed_page_timeout(self):
+        datastore = self.app.datastore
+        datastore.read_timeouts = {'list': 0}
+        pagination = datastore.create_model_pagination(
+            'Reading', 100, stream=True)
+        self.assertEqual(list(pagination.items), [])
+        assert 'took too long' in pagination.warning
+
+    def test_model_bound_to_own_engine(self):
+        # the deadline is set on the connection of the model's engine,
+        # not on the one of the session's default engine
+        engine = self.app.db_session.connection().engine
+        db_session = sa.orm.scoped_session(sa.orm.sessionmaker(
+            bind=sa.create_engine('sqlite://'),
+            binds={test.large_table.Event: engine}))
+        datastore = SQLAlchemyDatastore(
+            (test.large_table.Event, test.large_table.Reading), db_session,
+            read_timeouts={'count': 0})
+        pagination = datastore.create_model_pagination('Reading', 3)
+        self.assertEqual(pagination.total, None)
+        self.assertEqual(len(pagination.items), 25)
+
+    def test_read_timeouts(self):
+        datastore = self.app.datastore
+        datastore.read_timeout = 5
+        datastore.read_timeouts = {'count': 1, 'Event': 2,
+                                   ('Event', 'count'): 3}
+        self.assertEqual(datastore.get_read_timeout('Reading', 'list'), 5)
+        self.assertEqual(datastore.get_read_timeout('Reading', 'count'), 1)
+        self.assertEqual(datastore.get_read_timeout('Event', 'list'), 2)
+        self.assertEqual(datastore.get_read_timeout('Event', 'count'), 3)
+
+    def test_no_timeouts(self):
+        datastore = self.app.datastore
+        datastore.read_timeouts = {}
+        pagination = datastore.create_model_pagination('Reading', 100)
+        self.assertEqual(pagination.total, 3000)
+        self.assertEqual(len(pagination.items), 25)
+        self.assertEqual(pagination.warning, None)
+
+
+class EstimatedCountTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        return test.large_table.create_app(
+            'sqlite://', estimate_counts_above=1000)
+
+    def analyze(self):
+        self.app.db_session.execute('ANALYZE')
+        self.app.db_session.commit()
+
+    def test_estimate_count(self):
+        datastore = self.app.datastore
+        self.assertEqual(datastore.estimate_count('Event'), None)
+        self.analyze()
+        self.assertEqual(datastore.estimate_count('Event'), 3000)
+        # readings share the table of events, so its statistics don't
+        # tell how many of them there are
+        self.assertEqual(datastore.estimate_count('Reading'), None)
+
+    def test_estimated_pagination(self):
+        self.analyze()
+        self.app.datastore.save_models(
+            [test.large_table.Event(name=u'Event%s' % i) for i in range(10)])
+        pagination = self.app.datastore.create_model_pagination('Event', 1)
+        self.assertTrue(pagination.estimated)
+        self.assertEqual(pagination.total, 3000)
+        self.assertEqual(pagination.pages, 120)
+
+        # the statistics are out of date, but the next page is found
+        pagination = self.app.datastore.create_model_pagination('Event', 120)
+        self.assertEqual(len(pagination.items), 25)
+        self.assertTrue(pagination.has_next)
+        self.assertEqual(pagination.pages, 121)
+        pagination = self.app.datastore.create_model_pagination('Event', 121)
+        self.assertEqual(len(pagination.items), 10)
+        self.assertFalse(pagination.has_next)
+
+        rv = self.client.get('/admin/list/Event/')
+        self.assert_200(rv)
+        assert 'about 3000 event rows' in rv.data
+
+    def test_exact_count_below_threshold(self):
+        self.analyze()
+        self.app.datastore.estimate_counts_above = 5000
+        pagination = self.app.datastore.create_model_pagination('Event', 1)
+        self.assertFalse(pagination.estimated)
+        self.assertEqual(pagination.total, 3000)
+
+        rv = self.client.get('/admin/list/Event/')
+        assert 'about 3000' not in rv.data
+
+    def test_estimate_after_count_timeout(self):
+        self.analyze()
+        datastore = self.app.datastore
+        datastore.estimate_counts_above = None
+        datastore.read_timeouts = {'count': 0}
+        # SQLite counts whole tables in a few instructions, so the
+        # deadline has to be checked after every one of them
+        progress_steps = sqlalchemy_datastore._SQLITE_PROGRESS_STEPS
+        sqlalchemy_datastore._SQLITE_PROGRESS_STEPS = 1
+        try:
+            pagination = datastore.create_model_pagination('Event', 2)
+        finally:
+            sqlalchemy_datastore._SQLITE_PROGRESS_STEPS = progress_steps
+        self.assertTrue(pagination.estimated)
+        self.assertEqual(pagination.total, 3000)
+        assert 'estimated' in pagination.warning
+
+
+class AdmissionTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        self.metrics = Metrics()
+        self.admission = AdmissionController(
+            {'write': 1, 'count': 1, ('Location', 'count'): 2},
+            queue_size=1, queue_timeout=0.05, retry_after=7)
+        app = test.memory_datastore.create_app(
+            cache=SimpleCache(), metrics=self.metrics,
+            admission=self.admission)
+        app.datastore.save_models(
+            [test.memory_datastore.Student(name=u'Student%s' % i)
+             for i in range(3)])
+        return app
+
+    def test_rejected_when_full(self):
+        release = self.admission.admit('write', 'Student')
+        rv = self.client.post('/admin/edit/Student/1/',
+                              data={'name': u'Renamed'})
+        self.assertEqual(rv.status_code, 429)
+        self.assertEqual(rv.headers['Retry-After'], '7')
+        rv = self.client.get('/admin/delete/Student/1/')
+        self.assertEqual(rv.status_code, 429)
+        # reads aren't limited
+        self.assert_200(self.client.get('/admin/edit/Student/1/'))
+
+        release()
+        rv = self.client.post('/admin/edit/Student/1/',
+                              data={'name': u'Renamed'})
+        self.assertEqual(rv.status_code, 302)
+
+    def test_uncached_counts(self):
+        release = self.admission.admit('count', 'Student')
+        rv = self.client.get('/admin/list/Student/')
+        self.assertEqual(rv.status_code, 429)
+        # locations have a limit of their own
+        self.assert_200(self.client.get('/admin/list/Location/'))
+
+        # once the count is cached, the list page is cheap
+        self.app.datastore.cache.set(
+            self.app.datastore.get_cache_namespace('Student'), 'count', 3)
+        self.assert_200(self.client.get('/admin/list/Student/'))
+        release()
+
+    def test_queue(self):
+        release = self.admission.admit('write')
+        timer = threading.Timer(0.01, release)
+        timer.start()
+        try:
+            self.admission.queue_timeout = 5
+            rv = self.client.post('/admin/add/Student/',
+                                  data={'name': u'Added'})
+            self.assertEqual(rv.status_code, 302)
+        finally:
+            timer.join()
+
+    def test_queue_size(self):
+        gate_key = self.admission.get_gate_key('write', 'Student')
+        self.assertEqual(gate_key, 'write')
+        self.assertEqual(self.admission.get_gate_key('count', 'Location'),
+                         ('Location', 'count'))
+        self.assertEqual(self.admission.get_gate_key('export'), None)
+
+        release = self.admission.admit('write')
+        self.admission.queue_timeout = 5
+        waiting = threading.Thread(target=lambda: self.admission.admit(
+            'write')())
+        waiting.start()
+        try:
+            while not self.admission._gates['write'].waiting:
+                time.sleep(0.001)
+            # the queue is full, so this is rejected right away
+            start = time.time()
+            self.assertEqual(self.admission.admit('write'), None)
+            assert time.time() - start < 1
+        finally:
+            release()
+            waiting.join()
+
+        self.assertEqual(self.admission._gates['write'].running, 0)
+
+    def test_admitted_decorator(self):
+        @self.admission.admitted('write')
+        def export(model_name):
+            return 'exported'
+
+        with self.app.test_request_context():
+            self.assertEqual(export(model_name='Student'), 'exported')
+            release = self.admission.admit('write')
+            self.assertEqual(export(model_name='Student').status_code, 429)
+            release()
+
+    def test_metrics(self):
+        release = self.admission.admit('count', 'Student')
+        self.client.get('/admin/list/Student/')
+        self.client.get('/admin/list/Location/')
+        release()
+        lines = self.metrics.render().splitlines()
+        for line in [
+            '# TYPE flask_admin_admission_queue_depth gauge',
+            'flask_admin_admission_queue_depth'
+            '{model="",operation="count"} 0',
+            'flask_admin_admission_running'
+            '{model="",operation="count"} 0',
+            'flask_admin_admission_rejections_total'
+            '{operation="count"} 1',
+            'flask_admin_admission_wait_seconds_count'
+            '{operation="count"} 2',
+        ]:
+            assert line in lines, line
+
+
+class AdvisorTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        self.advisor = QueryAdvisor()
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'not secure'
+        engine = sa.create_engine('sqlite://')
+        app.db_session = sa.orm.scoped_session(sa.orm.sessionmaker(
+            autocommit=False, autoflush=False, bind=engine))
+        datastore = SQLAlchemyDatastore(
+            (simple.Course, simple.Student, simple.Teacher), app.db_session)
+        admin_blueprint = admin.create_admin_blueprint(
+            datastore, query_advisor=self.advisor)
+        app.register_blueprint(admin_blueprint, url_prefix='/admin')
+        simple.Base.metadata.create_all(bind=engine)
+        teacher = simple.Teacher(name=u'Teacher')
+        course = simple.Course(subject=u'Course', teacher=teacher)
+        course.students.extend([simple.Student(name=u'Student%s' % i)
+                                for i in range(3)])
+        datastore.save_model(course)
+        return app
+
+    def test_plans(self):
+        self.client.get('/admin/edit/Course/1/')
+        self.client.get('/admin/edit/Course/1/')
+        self.client.get('/admin/edit/Nothing/1/')
+        report = self.advisor.report()
+        self.assertEqual([(aggregate['model'], aggregate['view'],
+                           aggregate['requests']) for aggregate in report],
+                         [('Course', 'edit', 2)])
+        queries = report[0]['queries']
+        lookup = [query for query in queries
+                  if 'WHERE course.id = ?' in query['query']][0]
+        self.assertFalse(lookup['full_scan'])
+        self.assertEqual(lookup['count'], 2)
+        self.assertEqual(lookup['indexes'], [])
+        # the students of the course are looked up in the association
+        # table, which has no index on course_id
+        association = [query for query in queries
+                       if 'course_student_association' in query['query']][0]
+        self.assertTrue(association['full_scan'])
+        self.assertEqual(
+            association['indexes'],
+            ['CREATE INDEX ix_course_student_association_course_id '
+             'ON course_student_association (course_id)'])
+
+    def test_suggested_indexes(self):
+        self.client.get('/admin/edit/Course/1/')
+        self.client.get('/admin/edit/Student/1/')
+        indexes = self.advisor.suggested_indexes()
+        statements = [index['statement'] for index in indexes]
+        assert 'CREATE INDEX ix_course_student_association_course_id ' \
+            'ON course_student_association (course_id)' in statements
+        self.assertEqual(len(statements), len(set(statements)))
+
+        rv = self.client.get('/admin/advisor/')
+        self.assert_200(rv)
+        assert 'ix_course_student_association_course_id' in rv.data
+
+    def test_empty_advisor(self):
+        rv = self.client.get('/admin/advisor/')
+        self.assert_200(rv)
+        assert 'No query plans have been captured' in rv.data
+
+    def test_plans_not_captured_by_default(self):
+        with util.capture_queries() as queries:
+            self.client.get('/admin/edit/Course/1/')
+        assert not any(query.startswith('EXPLAIN') for query in queries)
+        assert not util.capturing_plans()
+
+    def test_failed_explain_rolled_back(self):
+        statements = []
+
+        class Cursor(object):
+            def execute(self, statement, parameters=None):
+                statements.append(statement.split(' SELECT')[0])
+                if statement.startswith('EXPLAIN'):
+                    raise ValueError('cannot explain')
+
+            def close(self):
+                pass
+
+        class Connection(object):
+            class dialect(object):
+                name = 'postgresql'
+
+            class connection(object):
+                cursor = Cursor
+
+        with util.capture_plans() as plans:
+            sqlalchemy_datastore._record_plan(
+                Connection(), 'SELECT 1 WHERE 1 = %(x)s', {'x': 1}, None)
+        self.assertEqual(plans, [])
+        self.assertEqual(statements, [
+            'SAVEPOINT flask_admin_explain',
+            'EXPLAIN',
+            'ROLLBACK TO SAVEPOINT flask_admin_explain'])
+
+
+class SQLAlchemyStreamingListTest(TestCase):
+    TESTING = True
+
+    def create_app(self):
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'not secure'
+        engine = sa.create_engine('sqlite://')
+        app.db_session = sa.orm.scoped_session(sa.orm.sessionmaker(
+            autocommit=False, autoflush=False, bind=engine))
+        datastore = SQLAlchemyDatastore(
+            (simple.Course, simple.Student, simple.Teacher), app.db_session)
+        admin_blueprint = admin.create_admin_blueprint(
+            datastore, list_view_pagination=300, stream_list_view=True)
+        app.register_blueprint(admin_blueprint, url_prefix='/admin')
+        simple.Base.metadata.create_all(bind=engine)
+        datastore.save_models([simple.Student(name=u'Student%03d' % i)
+                               for i in range(400)])
+        return app
+
+    def test_list(self):
+        rv = self.client.get('/admin/list/Student/?page=2')
+        self.assert_200(rv)
+        self.assertEqual(rv.data.count('class="edit-link"'), 100)
+        assert 'Student399' in rv.data
+
+    def test_url_keys_in_chunks(self):
+        # 300 rows are streamed, in several chunks of url keys
+        rv = self.client.get('/admin/list/Student/')
+        self.assert_200(rv)
+        for key in (1, 100, 101, 300):
+            assert 'href="/admin/edit/Student/%d/"' % key in rv.data
+        assert 'href="/admin/edit/Student/301/"' not in rv.data
+
+
+class FormCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.cache_dir, 'forms.cache')
+        engine = sa.create_engine('sqlite://')
+        simple.Base.metadata.create_all(bind=engine)
+        self.db_session = sa.orm.scoped_session(sa.orm.sessionmaker(
+            autocommit=False, autoflush=False, bind=engine))
+
+    def tearDown(self):
+        self.db_session.remove()
+        shutil.rmtree(self.cache_dir)
+
+    def create_datastore(self, form_cache=None):
+        return SQLAlchemyDatastore(
+            (simple.Course, simple.Student, simple.Teacher), self.db_session,
+            form_cache=form_cache)
+
+    def test_cached_forms(self):
+        form_cache = FormCache(self.path)
+        self.create_datastore(form_cache)
+        self.assertEqual((form_cache.hits, form_cache.misses), (0, 3))
+        assert os.path.exists(self.path)
+
+        form_cache = FormCache(self.path)
+        datastore = self.create_datastore(form_cache)
+        self.assertEqual((form_cache.hits, form_cache.misses), (3, 0))
+
+        uncached_datastore = self.create_datastore()
+        for model_name in ('Course', 'Student', 'Teacher'):
+            form = datastore.get_model_form(model_name)()
+            uncached_form = uncached_datastore.get_model_form(model_name)()
+            self.assertEqual(
+                [(field.name, type(field), field.label.text,
+                  [type(validator) for validator in field.validators])
+                 for field in form],
+                [(field.name, type(field), field.label.text,
+                  [type(validator) for validator in field.validators])
+                 for field in uncached_form])
+
+    def test_cached_query_factory(self):
+        form_cache = FormCache(self.path)
+        self.create_datastore(form_cache)
+        datastore = self.create_datastore(FormCache(self.path))
+        teacher = simple.Teacher(name=u'Mrs. Jones')
+        datastore.save_models([teacher])
+        form = datastore.get_model_form('Course')()
+        self.assertEqual(list(form.teacher.query_factory()), [teacher])
+
+    def test_changed_metadata(self):
+        form_cache = FormCache(self.path)
+        form_class = Form
+        form_cache.get_form('Form', ('v', 1), lambda: form_class)
+        form_cache.save()
+
+        form_cache = FormCache(self.path)
+        form_cache.get_form('Form', ('v', 2), lambda: form_class)
+        self.assertEqual((form_cache.hits, form_cache.misses), (0, 1))
+
+    def test_unpicklable_form(self):
+        class UnpicklableForm(Form):
+            name = TextField(default=lambda: u'name')
+
+        for i in range(2):
+            form_cache = FormCache(self.path)
+            form = form_cache.get_form('Form', (), lambda: UnpicklableForm)
+            form_cache.save()
+            assert form is UnpicklableForm
+            self.assertEqual((form_cache.hits, form_cache.misses), (0, 1))
+
+
+class MASimpleTest(QueryBudgetMixin, TestCase):
     TESTING = True
 
     def create_app(self):
@@ -421,6 +2091,67 @@ class MASimpleTest(TestCase):
         rv = self.client.get('/admin/list/Student/?page=1')
         self.assert_200(rv)
 
+    def test_query_budgets(self):
+        student = self.app.db_session.query(ma_simple.Student).first()
+        self.assert_query_budgets({
+            '/admin/': 0,
+            # the page and the count
+            '/admin/list/Student/': 2,
+            '/admin/edit/Student/%s/' % student.mongo_id: 1,
+            '/admin/add/Student/': 0,
+        })
+        self.assert_query_budget(
+            2, '/admin/edit/Student/%s/' % student.mongo_id, 'post',
+            data=dict(name='Stewie'))
+
+    def test_keyset_pages(self):
+        for i in range(7):
+            self.app.db_session.insert(ma_simple.Student(name='Student%s' % i))
+        datastore = MongoAlchemyDatastore(
+            (ma_simple.Course, ma_simple.Student, ma_simple.Teacher),
+            self.app.db_session)
+        ids = [unicode(student.mongo_id) for student in
+               self.app.db_session.query(ma_simple.Student).ascending(
+                   ma_simple.Student.mongo_id)]
+
+        def page_ids(pagination):
+            return [unicode(student.mongo_id)
+                    for student in pagination.items]
+
+        # forward, seeking after the last document of each page
+        pages = [datastore.create_model_pagination('Student', 1, 4)]
+        while pages[-1].has_next:
+            pages.append(datastore.create_model_pagination(
+                'Student', pages[-1].next_num, 4,
+                after=pages[-1].next_cursor))
+        self.assertEqual([page_ids(pagination) for pagination in pages],
+                         [ids[:4], ids[4:8], ids[8:]])
+        self.assertEqual(pages[-1].total, 10)
+
+        # backward, seeking before the first document of each page
+        pagination = datastore.create_model_pagination(
+            'Student', 2, 4, before=pages[-1].prev_cursor)
+        self.assertEqual(page_ids(pagination), ids[4:8])
+        pagination = datastore.create_model_pagination(
+            'Student', 1, 4, before=pagination.prev_cursor)
+        self.assertEqual(page_ids(pagination), ids[:4])
+        self.assertEqual(pagination.prev_cursor, None)
+
+        # pages linked by number are read from the closer end
+        with util.capture_queries() as queries:
+            pagination = datastore.create_model_pagination('Student', 3, 4)
+        self.assertEqual(page_ids(pagination), ids[8:])
+        assert not any('skip' in query for query in queries), queries
+
+    def test_keyset_list_view(self):
+        for i in range(30):
+            self.app.db_session.insert(ma_simple.Student(name='Student%s' % i))
+        rv = self.client.get('/admin/list/Student/')
+        self.assert_200(rv)
+        assert 'after=' in rv.data
+        rv = self.client.get('/admin/list/Student/?page=2&after=nonsense')
+        self.assert_200(rv)
+
     def test_edit(self):
         course = self.app.db_session.query(ma_simple.Course).\
             filter(ma_simple.Course.subject == 'Maths').one()
@@ -458,6 +2189,15 @@ class MASimpleTest(TestCase):
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(SimpleTest))
+    suite.addTest(unittest.makeSuite(UnchangedEditTest))
+    suite.addTest(unittest.makeSuite(BatchSaveTest))
+    suite.addTest(unittest.makeSuite(SimpleCacheTest))
+    suite.addTest(unittest.makeSuite(SQLiteCacheTest))
+    suite.addTest(unittest.makeSuite(CachedCountTest))
+    suite.addTest(unittest.makeSuite(TemplateCacheTest))
+    suite.addTest(unittest.makeSuite(AssetBundleTest))
+    suite.addTest(unittest.makeSuite(CompressionTest))
+    suite.addTest(unittest.makeSuite(ImportTest))
     suite.addTest(unittest.makeSuite(MultipleTest))
     suite.addTest(unittest.makeSuite(ViewDecoratorTest))
     suite.addTest(unittest.makeSuite(CustomFormTest))
@@ -472,6 +2212,26 @@ def suite():
     suite.addTest(unittest.makeSuite(FileFieldTest))
     suite.addTest(unittest.makeSuite(DeprecationTest))
     suite.addTest(unittest.makeSuite(ConversionTest))
+    suite.addTest(unittest.makeSuite(MemoryDatastoreTest))
+    suite.addTest(unittest.makeSuite(MemoryDatastorePaginationTest))
+    suite.addTest(unittest.makeSuite(StreamingListTest))
+    suite.addTest(unittest.makeSuite(InfiniteScrollTest))
+    suite.addTest(unittest.makeSuite(PerPageTest))
+    suite.addTest(unittest.makeSuite(ProfilingTest))
+    suite.addTest(unittest.makeSuite(SlowLogTest))
+    suite.addTest(unittest.makeSuite(MetricsTest))
+    suite.addTest(unittest.makeSuite(TracingTest))
+    suite.addTest(unittest.makeSuite(RelationshipQueryBudgetTest))
+    suite.addTest(unittest.makeSuite(ReadTimeoutTest))
+    suite.addTest(unittest.makeSuite(EstimatedCountTest))
+    suite.addTest(unittest.makeSuite(AdvisorTest))
+    suite.addTest(unittest.makeSuite(AdmissionTest))
+    suite.addTest(unittest.makeSuite(SQLAlchemyStreamingListTest))
+    suite.addTest(unittest.makeSuite(FormCacheTest))
+    suite.addTest(unittest.makeSuite(DocumentFormCacheTest))
+    suite.addTest(unittest.makeSuite(QueryRecordTest))
+    suite.addTest(unittest.makeSuite(PaginationTest))
+    suite.addTest(unittest.makeSuite(SaveModelTest))
     suite.addTest(unittest.makeSuite(MASimpleTest))
     return suite
 